@@ -0,0 +1,71 @@
+# Measure the analytics export: seed a scratch SQLite database with synthetic
+# hydration logs, export them to columnar files, then time the daily, weekly
+# and monthly per-user reports computed from the files.
+#
+#   python -m benchmarks.analytics_export --users 1000 --days 365
+#   python -m benchmarks.analytics_export --format npz
+#
+# Needs pyarrow (Parquet) or numpy (npz). Prints one JSON document. Runs in a
+# temporary directory; nothing else is touched.
+import argparse
+import json
+import os
+import tempfile
+import time
+from datetime import datetime
+
+from benchmarks.stand_ins import generate_logs
+from storage.sqlite_storage import SQLiteStorage
+from utils import analytics
+
+SEED_BATCH = 10000
+
+
+def directory_bytes(directory):
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def run(user_count, days, fmt, chunk_size):
+    now = datetime.now()
+    results = {"benchmark": "analytics_export", "users": user_count, "days": days}
+    with tempfile.TemporaryDirectory() as directory:
+        storage = SQLiteStorage(os.path.join(directory, "hydration.db"))
+        storage.initialize()
+        batch = []
+        rows = 0
+        for row in generate_logs(range(1, user_count + 1), days=days, now=now):
+            batch.append(row)
+            if len(batch) == SEED_BATCH:
+                rows += storage.insert_hydration_logs(batch)
+                batch = []
+        if batch:
+            rows += storage.insert_hydration_logs(batch)
+        results["rows"] = rows
+        results["database_bytes"] = os.path.getsize(storage.path)
+
+        export_directory = os.path.join(directory, "analytics")
+        # pending_days=0 exports the synthetic pending reminders too, so every seeded row is measured
+        summary = analytics.export_hydration_logs(storage, export_directory, until=now, fmt=fmt, chunk_size=chunk_size,
+                                                  pending_days=0)
+        results["export"] = {"format": summary["format"], "files": summary["files"], "seconds": summary["seconds"],
+                             "rows_per_s": summary["rows"] / summary["seconds"] if summary["seconds"] else 0.0,
+                             "bytes": directory_bytes(export_directory),
+                             "bytes_per_row": directory_bytes(export_directory) / max(summary["rows"], 1)}
+
+        for period in analytics.PERIODS:
+            start = time.perf_counter()
+            report = analytics.hydration_report(period, export_directory)
+            results[f"{period}_report_seconds"] = time.perf_counter() - start
+        results["report_users"] = len(report)
+        storage.close()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analytics export and report benchmark")
+    parser.add_argument("--users", type=int, default=200)
+    parser.add_argument("--days", type=int, default=365)
+    parser.add_argument("--format", choices=["auto", "parquet", "npz"], default="auto")
+    parser.add_argument("--chunk-size", type=int, default=analytics.ANALYTICS_CHUNK_SIZE)
+    args = parser.parse_args()
+    print(json.dumps(run(args.users, args.days, args.format, args.chunk_size), indent=2))
@@ -0,0 +1,162 @@
+# Compare query plans and timings of the hot hydration_logs queries before and
+# after the index migrations, on a seeded table in a scratch database.
+#
+#   python -m benchmarks.hydration_logs_queries --rows 2000000 --users 1000
+#
+# The scratch database (default: hydration_bench) is dropped and recreated.
+import argparse
+import json
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+import mysql.connector
+
+from utils.db_utils import DB_CONFIG
+from utils.migrations import apply_migrations, latest_version
+
+SCHEMA_VERSION_BEFORE = 2  # Base tables plus user_id, no indexes
+SEED_BATCH_SIZE = 20000
+
+HOT_QUERIES = {
+    "latest_pending": ("""
+        SELECT id FROM hydration_logs
+        WHERE status = 'pending'
+        ORDER BY date_time DESC
+        LIMIT 1
+    """, ()),
+    "latest_pending_for_user": ("""
+        SELECT id FROM hydration_logs
+        WHERE user_id = %s AND status = 'pending'
+        ORDER BY date_time DESC
+        LIMIT 1
+    """, (1,)),
+    "max_date_time": ("SELECT MAX(date_time) FROM hydration_logs", ()),
+    "last_times_per_user": ("""
+        SELECT user_id, MAX(date_time) FROM hydration_logs GROUP BY user_id
+    """, ()),
+    "weekly_range": ("""
+        SELECT COUNT(*), SUM(is_drunk) FROM hydration_logs
+        WHERE date_time BETWEEN %s AND %s
+    """, None),
+    "duplicate_minute_date_format": ("""
+        SELECT COUNT(*) FROM hydration_logs
+        WHERE DATE_FORMAT(date_time, '%Y-%m-%d %H:%i') = DATE_FORMAT(%s, '%Y-%m-%d %H:%i')
+    """, None),
+}
+
+# Only meaningful once the minute_bucket column exists
+MINUTE_BUCKET_QUERY = ("""
+    SELECT COUNT(*) FROM hydration_logs
+    WHERE user_id = %s AND minute_bucket = %s
+""", None)
+
+
+def connect(database=None):
+    config = dict(DB_CONFIG)
+    if database:
+        config["database"] = database
+    else:
+        config.pop("database", None)
+    return mysql.connector.connect(**config)
+
+
+def seed(conn, rows, users, start):
+    cursor = conn.cursor()
+    statuses = ("pending", "completed")
+    inserted = 0
+    minute = 0
+    while inserted < rows:
+        batch = []
+        for _ in range(min(SEED_BATCH_SIZE, rows - inserted)):
+            # Spread each user's reminders a few minutes apart so no minute repeats per user
+            user_id = inserted % users + 1
+            date_time = start + timedelta(minutes=minute)
+            status = statuses[random.random() < 0.8]
+            batch.append((user_id, date_time, 0.5, status == "completed", status))
+            inserted += 1
+            if user_id == users:
+                minute += 1
+        cursor.executemany("""
+        INSERT INTO hydration_logs (user_id, date_time, bottle_volume, is_drunk, status)
+        VALUES (%s, %s, %s, %s, %s)
+        """, batch)
+        conn.commit()
+    cursor.execute("ANALYZE TABLE hydration_logs")
+    cursor.fetchall()
+
+
+def explain(cursor, sql, params):
+    cursor.execute("EXPLAIN " + sql, params)
+    columns = [column[0] for column in cursor.description]
+    return [
+        {key: row[columns.index(key)] for key in ("select_type", "type", "key", "rows", "Extra") if key in columns}
+        for row in cursor.fetchall()
+    ]
+
+
+def time_query(cursor, sql, params, repeat):
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        cursor.execute(sql, params)
+        cursor.fetchall()
+        timings.append(time.perf_counter() - start)
+    return {"median_ms": statistics.median(timings) * 1000, "min_ms": min(timings) * 1000}
+
+
+def measure(conn, queries, sample_time, repeat):
+    cursor = conn.cursor()
+    week_start = sample_time - timedelta(days=sample_time.weekday())
+    results = {}
+    for name, (sql, params) in queries.items():
+        if params is None:
+            if name == "weekly_range":
+                params = (week_start, week_start + timedelta(days=6))
+            elif name == "duplicate_minute_date_format":
+                params = (sample_time,)
+            else:
+                params = (1, sample_time.replace(second=0, microsecond=0))
+        results[name] = {"plan": explain(cursor, sql, params), **time_query(cursor, sql, params, repeat)}
+    return results
+
+
+def run(rows, users, database, repeat):
+    with connect() as conn:
+        cursor = conn.cursor()
+        cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+        cursor.execute(f"CREATE DATABASE `{database}`")
+
+    start = datetime.now() - timedelta(minutes=rows // users + 1)
+    sample_time = start + timedelta(minutes=rows // users // 2)
+    report = {"rows": rows, "users": users}
+    with connect(database) as conn:
+        apply_migrations(conn, target=SCHEMA_VERSION_BEFORE)
+        seed_start = time.perf_counter()
+        seed(conn, rows, users, start)
+        report["seed_seconds"] = time.perf_counter() - seed_start
+        report["before"] = measure(conn, HOT_QUERIES, sample_time, repeat)
+
+        migrate_start = time.perf_counter()
+        apply_migrations(conn)
+        report["migration_seconds"] = time.perf_counter() - migrate_start
+        cursor = conn.cursor()
+        cursor.execute("ANALYZE TABLE hydration_logs")
+        cursor.fetchall()
+        report["after"] = measure(conn, {**HOT_QUERIES, "duplicate_minute_bucket": MINUTE_BUCKET_QUERY},
+                                  sample_time, repeat)
+        report["schema_version"] = latest_version()
+    return report
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="hydration_logs index benchmark")
+    parser.add_argument("--rows", type=int, default=2000000)
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--database", default="hydration_bench")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    json.dump(run(args.rows, args.users, args.database, args.repeat), sys.stdout, indent=2, default=str)
+    print()
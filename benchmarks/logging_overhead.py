@@ -0,0 +1,92 @@
+# Measure the per-call cost of logging on the reminder hot path.
+#
+#   python -m benchmarks.logging_overhead --calls 200000
+#
+# Compares suppressed f-string vs lazy %-style calls, a synchronous
+# ConcurrentRotatingFileHandler, the queue-based pipeline and sampling.
+import argparse
+import json
+import logging
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+from concurrent_log_handler import ConcurrentRotatingFileHandler
+
+from utils.log_config import JsonLinesFormatter, configure_logging, stop_logging
+
+
+def per_call_ns(fn, calls):
+    start = time.perf_counter_ns()
+    for _ in range(calls):
+        fn()
+    return (time.perf_counter_ns() - start) / calls
+
+
+def reset_root():
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+        handler.close()
+
+
+def run(calls):
+    logger = logging.getLogger("handlers.notification_handler")
+    now = datetime.now()
+    last_drink_time = now - timedelta(minutes=30)
+    next_drink_time = now + timedelta(minutes=70)
+    results = {"calls": calls}
+
+    with tempfile.TemporaryDirectory() as log_dir:
+        # Suppressed DEBUG: the f-string is still built, the %-style call returns after a level check
+        reset_root()
+        logging.getLogger().setLevel(logging.INFO)
+        results["suppressed_fstring_ns"] = per_call_ns(
+            lambda: logger.debug(f"Current time: {now}, Last drink time: {last_drink_time}, Next drink time: {next_drink_time}"),
+            calls)
+        results["suppressed_lazy_ns"] = per_call_ns(
+            lambda: logger.debug("Current time: %s, Last drink time: %s, Next drink time: %s", now, last_drink_time, next_drink_time),
+            calls)
+
+        # Enabled, written synchronously through the rotating file handler on the caller's thread
+        reset_root()
+        handler = ConcurrentRotatingFileHandler(f"{log_dir}/sync.log", maxBytes=10 * 1024 * 1024, backupCount=7)
+        handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s:%(message)s'))
+        logging.getLogger().addHandler(handler)
+        sync_calls = max(calls // 20, 1)  # File locking makes this path slow; sample fewer calls
+        results["sync_file_handler_ns"] = per_call_ns(
+            lambda: logger.info("Current time: %s, Next drink time: %s", now, next_drink_time), sync_calls)
+
+        # Enabled, handed to the queue listener thread
+        reset_root()
+        queue_handler = ConcurrentRotatingFileHandler(f"{log_dir}/queued.log", maxBytes=10 * 1024 * 1024, backupCount=7)
+        listener = configure_logging(level="INFO", module_levels="", log_format="json", sample_rate=1,
+                                     file_handler=queue_handler)
+        results["queued_json_ns"] = per_call_ns(
+            lambda: logger.info("Current time: %s, Next drink time: %s", now, next_drink_time), calls)
+        stop_logging(listener)
+
+        # Enabled with 1-in-100 sampling of the repeated loop message
+        reset_root()
+        sampled_handler = ConcurrentRotatingFileHandler(f"{log_dir}/sampled.log", maxBytes=10 * 1024 * 1024, backupCount=7)
+        listener = configure_logging(level="INFO", module_levels="", log_format="json", sample_rate=100,
+                                     file_handler=sampled_handler)
+        results["queued_sampled_ns"] = per_call_ns(
+            lambda: logger.info("Current time: %s, Next drink time: %s", now, next_drink_time), calls)
+        stop_logging(listener)
+        reset_root()
+
+    results["json_formatter_ns"] = per_call_ns(
+        lambda: JsonLinesFormatter().format(logging.LogRecord("bench", logging.INFO, __file__, 0, "Next drink time: %s",
+                                                              (next_drink_time,), None)),
+        calls)
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Logging hot-path benchmark")
+    parser.add_argument("--calls", type=int, default=100000)
+    args = parser.parse_args()
+    json.dump(run(args.calls), sys.stdout, indent=2)
+    print()
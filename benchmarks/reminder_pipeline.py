@@ -0,0 +1,170 @@
+# Load-test the reminder pipeline (send_reminder -> outbox -> channel dispatch ->
+# log buffer) against local stand-ins: a query-counting MySQL connection with an
+# in-memory outbox, an SMTP sink and the mock WhatsApp API. No real database or
+# mail server is touched.
+#
+#   python -m benchmarks.reminder_pipeline --users 5000
+#   python -m benchmarks.reminder_pipeline --users 5000 --output results.jsonl
+#
+# Prints one JSON document; --output also appends it as a line to a file so
+# runs of different versions can be compared.
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import time
+import tracemalloc
+from datetime import datetime
+
+os.environ.setdefault("MAIL_PORT", "8025")
+os.environ.setdefault("MAIL_TO", "user@localhost")
+os.environ.setdefault("WHATSAPP_NUMBER", "+10000000000")
+os.environ["STORAGE_BACKEND"] = "mysql"  # The query-counting stand-in replaces the MySQL pool
+
+from benchmarks.stand_ins import FakeOutbox, QueryCounter, SmtpSink, generate_users, install_fake_db
+from benchmarks.whatsapp_delivery import MockWhatsAppServer
+from channels import email_notification, whatsapp_notification
+from channels.dispatcher import NotificationDispatcher
+from channels.email_notification import EmailChannel, EmailDeliveryQueue
+from channels.whatsapp_notification import HttpApiBackend, WhatsAppChannel, WhatsAppDeliveryWorker
+from handlers import notification_handler
+from handlers.reminder_outbox import ReminderOutboxWorker
+from handlers.scheduler import ReminderScheduler
+from utils.db_utils import flush_log_buffer, stop_log_buffer, user_settings, user_state_cache
+from utils.state_cache import UserStateCache
+from utils.user_settings import compile_rules
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * q))]
+
+
+# Send one reminder to every user and measure the reminder thread and the whole pipeline
+def run_dispatch(users, email_workers):
+    counter = QueryCounter()
+    outbox = FakeOutbox()
+    install_fake_db(counter, outbox)
+    user_state_cache.seed({user_id: (None, None) for user_id in users})  # Everyone is due
+    user_settings.default_rules, user_settings.defaults = compile_rules({"reminder_start_hour": 0})  # at any hour
+
+    with SmtpSink() as smtp, MockWhatsAppServer() as whatsapp:
+        email_notification.email_queue = EmailDeliveryQueue(
+            host="127.0.0.1", port=smtp.port, username=None, password=None, from_address="tracker@localhost",
+            encryption="none", workers=email_workers)
+        whatsapp_notification.whatsapp_worker = WhatsAppDeliveryWorker(
+            backend_factory=lambda: HttpApiBackend(whatsapp.url), rate_limit=0)
+        dispatcher = NotificationDispatcher([EmailChannel(), WhatsAppChannel()])
+        notification_handler.dispatcher = dispatcher
+        outbox_worker = ReminderOutboxWorker(dispatcher, poll_interval=0.05)
+        outbox_worker.start()
+
+        latencies = []
+        due = datetime.now()
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            for user_id in users:
+                reminder_start = time.perf_counter()
+                notification_handler.send_reminder(user_id, due)
+                latencies.append(time.perf_counter() - reminder_start)
+        dispatch_elapsed = time.perf_counter() - start
+
+        # Wait for the outbox to be drained, for delivery and for the delivery results to be logged
+        flush_log_buffer()
+        while outbox.completed < len(users):
+            time.sleep(0.01)
+        outbox_worker.stop()
+        email_notification.email_queue.join()
+        whatsapp_notification.whatsapp_worker.join()
+        flush_log_buffer()
+        pipeline_elapsed = time.perf_counter() - start
+
+        email_notification.email_queue.stop()
+        whatsapp_notification.whatsapp_worker.stop()
+        dispatcher.shutdown()
+        emails_received = smtp.messages
+        whatsapp_received = len(whatsapp.received)
+
+    latencies.sort()
+    queries = counter.snapshot()
+    return {
+        "reminders": len(users),
+        "reminders_per_s": len(users) / dispatch_elapsed if dispatch_elapsed else 0.0,
+        "pipeline_reminders_per_s": len(users) / pipeline_elapsed if pipeline_elapsed else 0.0,
+        "latency_p50_ms": percentile(latencies, 0.5) * 1000,
+        "latency_p99_ms": percentile(latencies, 0.99) * 1000,
+        "latency_max_ms": latencies[-1] * 1000,
+        "emails_delivered": emails_received,
+        "whatsapp_delivered": whatsapp_received,
+        "db_queries": queries,
+        "db_queries_per_reminder": queries["total"] / len(users),
+        "db_rows_written_per_reminder": queries["rows_written"] / len(users),
+        "channels": dispatcher.channel_stats(),
+    }
+
+
+# Bytes of Python heap held per user by the state cache and the scheduler
+def run_memory(users):
+    tracemalloc.start()
+    baseline = tracemalloc.get_traced_memory()[0]
+    cache = UserStateCache(max_users=len(users))
+    cache.seed(users)
+    after_cache = tracemalloc.get_traced_memory()[0]
+    scheduler = ReminderScheduler()
+    now = datetime.now()
+    for user_id, (last_hydration_log_time, _) in users.items():
+        scheduler.schedule(user_id, notification_handler.next_reminder_time(user_id, last_hydration_log_time or now, now),
+                           notification_handler.send_reminder)
+    after_scheduler = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return {
+        "users": len(users),
+        "state_cache_bytes_per_user": (after_cache - baseline) / len(users),
+        "scheduler_bytes_per_user": (after_scheduler - after_cache) / len(users),
+        "total_bytes_per_user": (after_scheduler - baseline) / len(users),
+    }
+
+
+def version():
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(user_count, email_workers, scenarios):
+    users = generate_users(user_count)
+    results = {
+        "benchmark": "reminder_pipeline",
+        "version": version(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "users": user_count,
+    }
+    if "memory" in scenarios:
+        results["memory"] = run_memory(users)
+    if "dispatch" in scenarios:
+        results["dispatch"] = run_dispatch(users, email_workers)
+    stop_log_buffer()
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Reminder pipeline load test")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--email-workers", type=int, default=2)
+    parser.add_argument("--scenario", action="append", choices=["dispatch", "memory"],
+                        help="scenario to run; repeat for several (default: all)")
+    parser.add_argument("--output", help="append the JSON result as one line to this file")
+    args = parser.parse_args()
+
+    results = run(args.users, args.email_workers, args.scenario or ["dispatch", "memory"])
+    print(json.dumps(results, indent=2, default=str))
+    if args.output:
+        with open(args.output, "a") as f:
+            f.write(json.dumps(results, default=str) + "\n")
@@ -0,0 +1,66 @@
+# Measure email queue throughput and latency against a local SMTP sink.
+#
+#   pip install aiosmtpd
+#   python -m benchmarks.smtp_delivery --messages 2000 --workers 2
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("MAIL_PORT", "8025")
+
+from aiosmtpd.controller import Controller
+from aiosmtpd.handlers import Sink
+
+from channels.email_notification import EmailDeliveryQueue
+
+
+def run(messages, workers, batch_size, port):
+    controller = Controller(Sink(), hostname="127.0.0.1", port=port)
+    controller.start()
+    latencies = []
+
+    def on_result(email, success, error_message):
+        if success:
+            latencies.append(time.monotonic() - email.enqueued_at)
+
+    delivery = EmailDeliveryQueue(host="127.0.0.1", port=port, username=None, password=None,
+                                  from_address="tracker@localhost", encryption="none", workers=workers,
+                                  batch_size=batch_size, on_result=on_result)
+    try:
+        start = time.monotonic()
+        enqueue_start = time.perf_counter()
+        for i in range(messages):
+            delivery.enqueue("Hydration Reminder", f"Reminder {i}", ["user@localhost"])
+        enqueue_time = time.perf_counter() - enqueue_start
+        delivery.join()
+        elapsed = time.monotonic() - start
+    finally:
+        delivery.stop()
+        controller.stop()
+
+    latencies.sort()
+    return {
+        "messages": messages,
+        "workers": workers,
+        "batch_size": batch_size,
+        "sent": delivery.stats["sent"],
+        "failed": delivery.stats["failed"],
+        "sessions_opened": delivery.stats["sessions_opened"],
+        "throughput_per_s": messages / elapsed if elapsed else 0.0,
+        "enqueue_us_per_message": enqueue_time / messages * 1e6,
+        "latency_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+        "latency_p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Email delivery queue benchmark")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--batch-size", type=int, default=50)
+    parser.add_argument("--port", type=int, default=8025)
+    args = parser.parse_args()
+    json.dump(run(args.messages, args.workers, args.batch_size, args.port), sys.stdout, indent=2)
+    print()
@@ -0,0 +1,232 @@
+# Local stand-ins and synthetic data for the benchmarks: a query-counting MySQL
+# connection injected through the pool factory, an in-memory reminder outbox, an
+# SMTP sink and a generator of users and hydration logs. The WhatsApp stand-in is MockWhatsAppServer in
+# benchmarks.whatsapp_delivery.
+import itertools
+import random
+import socketserver
+import threading
+from collections import Counter
+from datetime import datetime, timedelta
+
+
+# Counts statements by their leading keyword, shared by every FakeConnection
+class QueryCounter:
+    def __init__(self):
+        self.statements = Counter()
+        self.rows_written = 0
+        self.commits = 0
+        self._lock = threading.Lock()
+
+    def record(self, sql, rows=0):
+        keyword = sql.lstrip().split(None, 1)[0].upper()
+        with self._lock:
+            self.statements[keyword] += 1
+            self.rows_written += rows
+
+    def record_commit(self):
+        with self._lock:
+            self.commits += 1
+
+    @property
+    def total(self):
+        return sum(self.statements.values())
+
+    def reset(self):
+        with self._lock:
+            self.statements.clear()
+            self.rows_written = 0
+            self.commits = 0
+
+    def snapshot(self):
+        with self._lock:
+            return {"total": sum(self.statements.values()), "by_statement": dict(self.statements),
+                    "rows_written": self.rows_written, "commits": self.commits}
+
+
+class FakeCursor:
+    def __init__(self, counter, responder):
+        self.counter = counter
+        self.responder = responder
+        self.rowcount = 0
+        self._rows = []
+
+    def execute(self, sql, params=()):
+        self.counter.record(sql)
+        self._rows = list(self.responder(sql, params) or [])
+        self.rowcount = len(self._rows)
+
+    def executemany(self, sql, seq_params):
+        seq_params = list(seq_params)
+        self.counter.record(sql, len(seq_params))
+        record_many = getattr(self.responder, "record_many", None)
+        if record_many is not None:
+            record_many(sql, seq_params)
+        self._rows = []
+        self.rowcount = len(seq_params)
+
+    def fetchone(self):
+        return self._rows.pop(0) if self._rows else None
+
+    def fetchall(self):
+        rows, self._rows = self._rows, []
+        return rows
+
+    def close(self):
+        pass
+
+
+# Answers the email_templates id lookup with made-up ids and every other query with no rows
+def default_responder(sql, params):
+    if "FROM email_templates" in sql:
+        return [(template_hash, template_id) for template_id, template_hash in enumerate(params, start=1)]
+    return []
+
+
+# Responder that keeps the reminder outbox in memory: queued reminders are handed
+# out by the claim query once each, stay leased to the claiming worker, and completed ones are counted
+class FakeOutbox:
+    def __init__(self):
+        self.keys = set()
+        self.pending = []
+        self.completed = 0
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def record_many(self, sql, seq_params):
+        if "INTO reminder_outbox" not in sql:
+            return
+        with self._lock:
+            for key, user_id, reminder_time, subject, message, next_drink_time, available_at in seq_params:
+                if key not in self.keys:
+                    self.keys.add(key)
+                    self.pending.append((next(self._ids), key, user_id, reminder_time, subject, message,
+                                         next_drink_time, 0))
+
+    def __call__(self, sql, params):
+        if "SKIP LOCKED" in sql:
+            limit = params[-1]
+            with self._lock:
+                claimed, self.pending = self.pending[:limit], self.pending[limit:]
+            return claimed
+        if "SELECT id FROM reminder_outbox" in sql:
+            return [(outbox_id,) for outbox_id in params[1:]]
+        if "SET status = 'sent'" in sql:
+            with self._lock:
+                self.completed += len(params) - 1
+            return []
+        if "SELECT COUNT(*) FROM reminder_outbox" in sql:
+            return [(0,)]
+        return default_responder(sql, params)
+
+
+# Minimal mysql.connector connection: answers every query through responder(sql, params) -> rows
+class FakeConnection:
+    def __init__(self, counter, responder=None):
+        self.counter = counter
+        self.responder = responder or default_responder
+        self.in_transaction = False
+
+    def cursor(self, dictionary=False):
+        return FakeCursor(self.counter, self.responder)
+
+    def commit(self):
+        self.counter.record_commit()
+
+    def rollback(self):
+        pass
+
+    def is_connected(self):
+        return True
+
+    def close(self):
+        pass
+
+
+# Point the MySQL storage connection pool at FakeConnections sharing counter
+def install_fake_db(counter, responder=None):
+    from utils.db_utils import storage
+
+    storage.pool.close_all()
+    storage.pool.factory = lambda: FakeConnection(counter, responder)
+    return storage.pool
+
+
+class _SmtpSinkHandler(socketserver.StreamRequestHandler):
+    def reply(self, line):
+        self.wfile.write(line.encode() + b"\r\n")
+
+    def handle(self):
+        self.reply("220 localhost benchmark sink")
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line[:4].upper()
+            if command in (b"EHLO", b"HELO"):
+                self.reply("250 localhost")
+            elif command == b"DATA":
+                self.reply("354 End data with <CR><LF>.<CR><LF>")
+                while self.rfile.readline() not in (b".\r\n", b".\n", b""):
+                    pass
+                with self.server.lock:
+                    self.server.messages += 1
+                self.reply("250 OK")
+            elif command == b"QUIT":
+                self.reply("221 Bye")
+                return
+            else:
+                self.reply("250 OK")
+
+
+# SMTP server that accepts and discards every message; use with MAIL_ENCRYPTION=none
+class SmtpSink(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host="127.0.0.1", port=0):
+        super().__init__((host, port), _SmtpSinkHandler)
+        self.messages = 0
+        self.lock = threading.Lock()
+
+    @property
+    def port(self):
+        return self.server_address[1]
+
+    def __enter__(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+
+
+# {user_id: (last_hydration_log_time, last_email_log_time)} for users with random recent activity
+def generate_users(count, now=None, seed=0):
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    users = {}
+    for user_id in range(1, count + 1):
+        if rng.random() < 0.1:
+            users[user_id] = (None, None)  # New user without logs
+            continue
+        last = now - timedelta(minutes=rng.randint(0, 600))
+        users[user_id] = (last, last + timedelta(seconds=rng.randint(0, 5)))
+    return users
+
+
+# Yield hydration_logs rows (user_id, date_time, bottle_volume, is_drunk, status) over the past `days`
+def generate_logs(users, days=30, per_day=8, now=None, seed=0):
+    rng = random.Random(seed)
+    now = now or datetime.now()
+    for user_id in users:
+        for day in range(days):
+            start = (now - timedelta(days=day)).replace(hour=9, minute=0, second=0, microsecond=0)
+            for slot in range(per_day):
+                date_time = start + timedelta(minutes=100 * slot + rng.randint(0, 5))
+                if date_time > now:
+                    continue
+                is_drunk = rng.random() < 0.7
+                status = "completed" if is_drunk else rng.choice(("skipped", "pending"))
+                yield (user_id, date_time, 0.5, is_drunk, status)
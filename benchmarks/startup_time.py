@@ -0,0 +1,107 @@
+# Measure how long the tracker takes to import main.py and load its enabled
+# notification channels, using python -X importtime in fresh interpreters.
+#
+#   python -m benchmarks.startup_time
+#   python -m benchmarks.startup_time --mode desktop --runs 10
+#
+# "headless" is a server or container: no display, email and WhatsApp only and
+# the embedded SQLite backend. It must stay within HEADLESS_TARGET_MS and never
+# load a GUI or unused database module; the process exits 1 when it does not.
+# Prints one JSON document.
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Imports of main.py plus load_channels(), summed from -X importtime
+HEADLESS_TARGET_MS = 250
+
+# Modules a headless start must not load
+HEADLESS_FORBIDDEN = ("tkinter", "plyer", "pywhatkit", "pyautogui", "mysql", "aiomysql", "aiosmtplib")
+
+STARTUP_CODE = "import main; from channels.dispatcher import load_channels; load_channels()"
+
+MODES = {
+    "headless": {"NOTIFICATION_CHANNELS": "email,whatsapp", "STORAGE_BACKEND": "sqlite"},
+    "desktop": {"NOTIFICATION_CHANNELS": "desktop,email,whatsapp", "STORAGE_BACKEND": "mysql"},
+}
+
+
+def environment(mode, directory):
+    env = dict(os.environ)
+    env.update(MODES[mode])
+    env.setdefault("MAIL_PORT", "587")
+    env.setdefault("MAIL_HOST", "localhost")
+    env.setdefault("MAIL_TO", "user@localhost")
+    env["SQLITE_PATH"] = os.path.join(directory, "hydration.db")
+    env["PYTHONPATH"] = ROOT + os.pathsep + env.get("PYTHONPATH", "")
+    if mode == "headless":
+        env.pop("DISPLAY", None)
+        env.pop("WAYLAND_DISPLAY", None)
+    return env
+
+
+# {module: (self_us, cumulative_us)} from one interpreter's -X importtime output
+def parse_importtime(stderr):
+    modules = {}
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "imported package" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = (int(self_us), int(cumulative_us))
+    return modules
+
+
+def run_once(mode, directory):
+    start = time.perf_counter()
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", STARTUP_CODE], cwd=directory,
+                            env=environment(mode, directory), capture_output=True, text=True)
+    wall = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"Startup failed:\n{result.stderr[-2000:]}")
+    return parse_importtime(result.stderr), wall
+
+
+def run(mode, runs):
+    import_ms = []
+    wall_ms = []
+    with tempfile.TemporaryDirectory() as directory:
+        run_once(mode, directory)  # Warm up: write bytecode caches
+        for _ in range(runs):
+            modules, wall = run_once(mode, directory)
+            import_ms.append(sum(self_us for self_us, _ in modules.values()) / 1000)
+            wall_ms.append(wall * 1000)
+
+    loaded = {name.split(".")[0] for name in modules}
+    slowest = sorted(modules.items(), key=lambda item: item[1][1], reverse=True)
+    results = {
+        "benchmark": "startup_time",
+        "mode": mode,
+        "runs": runs,
+        "import_ms_median": statistics.median(import_ms),
+        "process_ms_median": statistics.median(wall_ms),
+        "modules_loaded": len(modules),
+        "slowest_cumulative_ms": {name: cumulative / 1000 for name, (_, cumulative) in slowest[:15]},
+    }
+    if mode == "headless":
+        results["target_ms"] = HEADLESS_TARGET_MS
+        results["forbidden_loaded"] = sorted(loaded & set(HEADLESS_FORBIDDEN))
+        results["within_target"] = results["import_ms_median"] <= HEADLESS_TARGET_MS and not results["forbidden_loaded"]
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Startup import time benchmark")
+    parser.add_argument("--mode", choices=sorted(MODES), default="headless")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    results = run(args.mode, args.runs)
+    print(json.dumps(results, indent=2))
+    sys.exit(0 if results.get("within_target", True) else 1)
@@ -0,0 +1,78 @@
+# Measure the embedded SQLite backend: time to open and initialize a fresh
+# database, and hydration log write throughput for buffered batches, single-row
+# writes and several threads writing at once.
+#
+#   python -m benchmarks.storage_backends --rows 20000
+#
+# Prints one JSON document. Runs in a temporary directory; nothing else is touched.
+import argparse
+import json
+import os
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+
+from storage.sqlite_storage import SQLiteStorage
+
+
+def rows_for(user_id, count, start):
+    return [(user_id, start + timedelta(minutes=minute), 0.5, False, "pending") for minute in range(count)]
+
+
+def run_startup(directory, repeat=20):
+    timings = []
+    for i in range(repeat):
+        start = time.perf_counter()
+        storage = SQLiteStorage(os.path.join(directory, f"startup-{i}.db"))
+        storage.initialize()
+        timings.append(time.perf_counter() - start)
+        storage.close()
+    timings.sort()
+    return {"open_and_initialize_ms_median": timings[len(timings) // 2] * 1000,
+            "open_and_initialize_ms_max": timings[-1] * 1000}
+
+
+def run_writes(directory, row_count, batch_size, threads):
+    storage = SQLiteStorage(os.path.join(directory, f"writes-{batch_size}-{threads}.db"))
+    storage.initialize()
+    start_time = datetime(2024, 1, 1)
+    per_thread = row_count // threads
+
+    def write(user_id):
+        rows = rows_for(user_id, per_thread, start_time)
+        for i in range(0, len(rows), batch_size):
+            storage.insert_hydration_logs(rows[i:i + batch_size])
+
+    workers = [threading.Thread(target=write, args=(user_id,)) for user_id in range(1, threads + 1)]
+    start = time.perf_counter()
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+    elapsed = time.perf_counter() - start
+    stats = storage.stats()
+    storage.close()
+    return {"rows": per_thread * threads, "batch_size": batch_size, "threads": threads,
+            "rows_per_s": per_thread * threads / elapsed, "transactions": stats["writes"]}
+
+
+def run(row_count):
+    with tempfile.TemporaryDirectory() as directory:
+        return {
+            "benchmark": "storage_backends",
+            "backend": "sqlite",
+            "startup": run_startup(directory),
+            "writes": [
+                run_writes(directory, row_count, batch_size=100, threads=1),  # LOG_BUFFER_SIZE flushes
+                run_writes(directory, row_count // 10, batch_size=1, threads=1),
+                run_writes(directory, row_count // 10, batch_size=1, threads=8),
+            ],
+        }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="SQLite storage backend benchmark")
+    parser.add_argument("--rows", type=int, default=20000)
+    args = parser.parse_args()
+    print(json.dumps(run(args.rows), indent=2))
@@ -0,0 +1,101 @@
+# Measure WhatsApp queue throughput and enqueue cost against a local mock messaging API.
+#
+#   python -m benchmarks.whatsapp_delivery --messages 2000 --rate-limit 0
+import argparse
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from channels.whatsapp_notification import HttpApiBackend, WhatsAppDeliveryWorker
+
+
+# Accepts POSTed messages over keep-alive connections and counts them
+class MockWhatsAppHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        with self.server.lock:
+            self.server.received.append(json.loads(body))
+            self.server.connections.add(self.client_address)
+        self.send_response(self.server.status)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        pass
+
+
+# Local stand-in for the messaging API; POST http://127.0.0.1:<port>/messages
+class MockWhatsAppServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, host="127.0.0.1", port=0, status=200):
+        super().__init__((host, port), MockWhatsAppHandler)
+        self.status = status
+        self.received = []
+        self.connections = set()
+        self.lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/messages"
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.shutdown()
+        self.server_close()
+
+
+def run(messages, batch_size, rate_limit):
+    latencies = []
+
+    def on_result(message, error):
+        if error is None:
+            latencies.append(time.monotonic() - message.enqueued_at)
+
+    with MockWhatsAppServer() as server:
+        worker = WhatsAppDeliveryWorker(backend_factory=lambda: HttpApiBackend(server.url, token="benchmark"),
+                                        rate_limit=rate_limit, batch_size=batch_size, on_result=on_result)
+        worker.start()
+        try:
+            start = time.monotonic()
+            enqueue_start = time.perf_counter()
+            for i in range(messages):
+                worker.enqueue(f"Reminder {i}", to="+10000000000")
+            enqueue_time = time.perf_counter() - enqueue_start
+            worker.join()
+            elapsed = time.monotonic() - start
+        finally:
+            worker.stop()
+
+    latencies.sort()
+    return {
+        "messages": messages,
+        "batch_size": batch_size,
+        "rate_limit": rate_limit,
+        "sent": worker.stats["sent"],
+        "failed": worker.stats["failed"],
+        "received": len(server.received),
+        "connections_opened": len(server.connections),
+        "throughput_per_s": messages / elapsed if elapsed else 0.0,
+        "enqueue_us_per_message": enqueue_time / messages * 1e6,
+        "latency_p50_ms": latencies[len(latencies) // 2] * 1000 if latencies else None,
+        "latency_p99_ms": latencies[int(len(latencies) * 0.99) - 1] * 1000 if latencies else None,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="WhatsApp delivery worker benchmark")
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--batch-size", type=int, default=20)
+    parser.add_argument("--rate-limit", type=float, default=0, help="messages per second; 0 disables rate limiting")
+    args = parser.parse_args()
+    print(json.dumps(run(args.messages, args.batch_size, args.rate_limit), indent=2))
@@ -0,0 +1,69 @@
+import os
+
+# Channel Configuration
+CHANNEL_TIMEOUT = float(os.getenv("CHANNEL_TIMEOUT", 10))  # seconds a channel may take per reminder
+
+# Registered channel classes by name
+CHANNELS = {}
+
+
+class Reminder:
+    __slots__ = ("user_id", "subject", "message", "next_drink_time")
+
+    def __init__(self, user_id, subject, message, next_drink_time=None):
+        self.user_id = user_id
+        self.subject = subject
+        self.message = message
+        self.next_drink_time = next_drink_time
+
+
+# A way of delivering a reminder; subclasses implement send() and register with @register_channel
+class Channel:
+    name = None
+    timeout = CHANNEL_TIMEOUT
+
+    # Whether the channel is configured well enough to be used
+    def enabled(self):
+        return True
+
+    # Deliver one reminder; raise on failure. A channel that hands the reminder to a background worker
+    # returns a concurrent.futures.Future (a delivery receipt) that completes once it has really been sent.
+    def send(self, reminder):
+        raise NotImplementedError
+
+    # Deliver one reminder from the asyncio runtime; blocking send() runs on the default executor
+    async def send_async(self, reminder):
+        import asyncio
+
+        receipt = await asyncio.get_running_loop().run_in_executor(None, self.send, reminder)
+        if receipt is not None:
+            await asyncio.wrap_future(receipt)
+
+    # Stop this channel's background delivery workers, waiting up to timeout for queued messages
+    @classmethod
+    def stop_workers(cls, timeout=None):
+        pass
+
+
+# Mark a delivery receipt as in progress before sending; False when the dispatcher already gave up on
+# the delivery (cancelled the receipt), so the message is dropped instead of sent late
+def start_delivery(receipt):
+    return receipt is None or receipt.running() or receipt.set_running_or_notify_cancel()
+
+
+# Complete a delivery receipt with the final outcome of its message
+def finish_delivery(receipt, error=None):
+    if receipt is None or receipt.done():
+        return
+    if error is None:
+        receipt.set_result(None)
+    else:
+        receipt.set_exception(error if isinstance(error, BaseException) else RuntimeError(error))
+
+
+# Class decorator adding a channel to the registry under its name
+def register_channel(cls):
+    if not cls.name:
+        raise ValueError(f"Channel {cls.__name__} must define a name.")
+    CHANNELS[cls.name] = cls
+    return cls
@@ -0,0 +1,35 @@
+import importlib.util
+import logging
+import os
+import sys
+from channels.base import Channel, register_channel
+
+logger = logging.getLogger(__name__)
+
+# Notification Settings
+NOTIFICATION_TITLE = "Hydration Reminder"
+NOTIFICATION_MESSAGE = "Time to drink water!"
+
+
+# Desktop pop-up through plyer
+@register_channel
+class DesktopChannel(Channel):
+    name = "desktop"
+
+    # Needs plyer installed and, on Linux, a display; headless servers skip the channel
+    def enabled(self):
+        if importlib.util.find_spec("plyer") is None:
+            return False
+        if sys.platform.startswith("linux"):
+            return bool(os.getenv("DISPLAY") or os.getenv("WAYLAND_DISPLAY"))
+        return True
+
+    def send(self, reminder):
+        from plyer import notification  # Loads platform GUI backends; only imported once a notification is due
+
+        notification.notify(
+            title=NOTIFICATION_TITLE,
+            message=f"{NOTIFICATION_MESSAGE} Next drink time: {reminder.next_drink_time.strftime('%Y-%m-%d %H:%M:%S')}",
+            timeout=10
+        )
+        logger.info("Notification sent to user %s.", reminder.user_id)
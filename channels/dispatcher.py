@@ -0,0 +1,246 @@
+import importlib
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from channels.base import CHANNELS
+from utils.metrics import LatencyHistogram, registry
+
+logger = logging.getLogger(__name__)
+
+# Dispatcher Configuration
+NOTIFICATION_CHANNELS = os.getenv("NOTIFICATION_CHANNELS", "desktop,email,whatsapp")  # comma-separated, in order
+DISPATCH_WORKERS = int(os.getenv("DISPATCH_WORKERS", 8))  # threads shared by all channels
+CHANNEL_TIMEOUTS = os.getenv("CHANNEL_TIMEOUTS", "")  # per-channel overrides in seconds, e.g. "desktop=2,email=5"
+CHANNEL_FAILURE_THRESHOLD = int(os.getenv("CHANNEL_FAILURE_THRESHOLD", 5))  # consecutive failures before a channel is skipped
+CHANNEL_RESET_TIMEOUT = float(os.getenv("CHANNEL_RESET_TIMEOUT", 60))  # seconds before a skipped channel is tried again
+
+# Modules that register the built-in channels; imported only when the channel is enabled
+CHANNEL_MODULES = {
+    "desktop": "channels.desktop_notification",
+    "email": "channels.email_notification",
+    "whatsapp": "channels.whatsapp_notification",
+}
+
+# Metrics
+CHANNEL_SEND_SECONDS = registry.histogram("hydration_channel_send_seconds", "Time a channel takes to accept a reminder",
+                                          labels=("channel",))
+CHANNEL_RESULTS = registry.counter("hydration_channel_results_total", "Reminder deliveries by channel and result",
+                                   labels=("channel", "result"))
+CHANNEL_BREAKER_OPEN = registry.gauge("hydration_channel_breaker_open", "1 while a channel's circuit breaker skips it",
+                                      labels=("channel",))
+
+
+# Skips a channel after repeated failures, then lets a single trial call through after reset_timeout
+class CircuitBreaker:
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold=CHANNEL_FAILURE_THRESHOLD, reset_timeout=CHANNEL_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self._lock = threading.Lock()
+
+    # Whether a call may go through now
+    def allow(self):
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = self.CLOSED
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == self.HALF_OPEN or self.failures >= self.failure_threshold:
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+
+# Parse "name=seconds,name=seconds" into {name: seconds}
+def parse_channel_timeouts(spec):
+    timeouts = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, seconds = (part.strip() for part in item.split("=", 1))
+        if name and seconds:
+            timeouts[name] = float(seconds)
+    return timeouts
+
+
+# Import the modules of the named channels and instantiate the enabled ones
+def load_channels(names=NOTIFICATION_CHANNELS):
+    if isinstance(names, str):
+        names = [name.strip() for name in names.split(",") if name.strip()]
+    channels = []
+    for name in names:
+        if name not in CHANNELS and name in CHANNEL_MODULES:
+            try:
+                importlib.import_module(CHANNEL_MODULES[name])
+            except Exception as e:
+                logger.error("Could not load the %s channel: %s", name, e)
+                continue
+        if name not in CHANNELS:
+            logger.error("Unknown notification channel: %s", name)
+            continue
+        channel = CHANNELS[name]()
+        if channel.enabled():
+            channels.append(channel)
+        else:
+            logger.info("Notification channel %s is not configured; skipping it.", name)
+    return channels
+
+
+# Stop the delivery workers of every channel whose module has been loaded
+def stop_channel_workers(timeout=None):
+    for channel_class in list(CHANNELS.values()):
+        channel_class.stop_workers(timeout)
+
+
+# Fans each reminder out to every channel at once, bounded by per-channel timeouts and circuit breakers
+class NotificationDispatcher:
+    def __init__(self, channels=None, workers=DISPATCH_WORKERS, timeouts=CHANNEL_TIMEOUTS):
+        self.channels = load_channels() if channels is None else list(channels)
+        if isinstance(timeouts, str):
+            timeouts = parse_channel_timeouts(timeouts)
+        self.timeouts = {channel.name: timeouts.get(channel.name, channel.timeout) for channel in self.channels}
+        self.breakers = {channel.name: CircuitBreaker() for channel in self.channels}
+        self.latencies = {channel.name: LatencyHistogram() for channel in self.channels}
+        self.send_seconds = {channel.name: CHANNEL_SEND_SECONDS.labels(channel.name) for channel in self.channels}
+        self.stats = {channel.name: {"sent": 0, "failed": 0, "timed_out": 0, "skipped": 0} for channel in self.channels}
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="dispatch")
+        self._lock = threading.Lock()
+
+    # Send a reminder on every channel; returns {channel name: "sent" | "failed" | "timed_out" | "skipped"}.
+    # "sent" means delivered: for queued channels the delivery receipt is awaited within the timeout.
+    def dispatch(self, reminder):
+        return self._collect(reminder, *self._submit(reminder))
+
+    # dispatch() for several reminders at once: every send starts before any result is awaited
+    def dispatch_many(self, reminders):
+        submitted = [(reminder, *self._submit(reminder)) for reminder in reminders]
+        return [self._collect(*args) for args in submitted]
+
+    def _submit(self, reminder):
+        futures = {}
+        results = {}
+        for channel in self.channels:
+            if not self.breakers[channel.name].allow():
+                results[channel.name] = "skipped"
+                continue
+            futures[channel.name] = self._executor.submit(self._send, channel, reminder)
+        return time.monotonic(), futures, results
+
+    def _collect(self, reminder, start, futures, results):
+        for name, future in futures.items():
+            deadline = start + self.timeouts[name]
+            receipt = None
+            try:
+                receipt = future.result(timeout=max(deadline - time.monotonic(), 0))
+                if receipt is not None:
+                    receipt.result(timeout=max(deadline - time.monotonic(), 0))
+                results[name] = "sent"
+            except FutureTimeoutError:
+                # The call keeps its worker thread until it returns; the breaker stops new calls piling up.
+                # A queued message that has not been picked up yet is dropped, so a retry does not duplicate it.
+                if receipt is not None:
+                    receipt.cancel()
+                logger.error("Notification channel %s timed out after %ss for user %s.", name, self.timeouts[name], reminder.user_id)
+                results[name] = "timed_out"
+            except Exception as e:
+                logger.error("Notification channel %s failed for user %s: %s", name, reminder.user_id, e)
+                results[name] = "failed"
+
+        self._count(results)
+        return results
+
+    # asyncio variant of dispatch(): channels run as tasks on the running loop instead of pool threads
+    async def dispatch_async(self, reminder):
+        import asyncio  # Only the async runtime needs it; the threaded runtime starts without loading asyncio
+
+        results = {}
+        tasks = {}
+        for channel in self.channels:
+            if not self.breakers[channel.name].allow():
+                results[channel.name] = "skipped"
+                continue
+            tasks[channel.name] = asyncio.ensure_future(
+                asyncio.wait_for(self._send_async(channel, reminder), self.timeouts[channel.name]))
+
+        for name, outcome in zip(tasks, await asyncio.gather(*tasks.values(), return_exceptions=True)):
+            if isinstance(outcome, asyncio.TimeoutError):
+                # wait_for cancelled the send, so unlike the threaded path nothing is left running
+                logger.error("Notification channel %s timed out after %ss for user %s.", name, self.timeouts[name], reminder.user_id)
+                results[name] = "timed_out"
+            elif isinstance(outcome, BaseException):
+                if isinstance(outcome, asyncio.CancelledError):
+                    raise outcome
+                logger.error("Notification channel %s failed for user %s: %s", name, reminder.user_id, outcome)
+                results[name] = "failed"
+            else:
+                results[name] = "sent"
+
+        self._count(results)
+        return results
+
+    # Count the results and feed them to the breakers. Each call's breaker update happens here, once,
+    # so a call that finishes after it timed out neither counts twice nor closes the breaker.
+    def _count(self, results):
+        with self._lock:
+            for name, result in results.items():
+                self.stats[name][result] += 1
+        for name, result in results.items():
+            if result == "sent":
+                self.breakers[name].record_success()
+            elif result != "skipped":
+                self.breakers[name].record_failure()
+            CHANNEL_RESULTS.labels(name, result).inc()
+            CHANNEL_BREAKER_OPEN.labels(name).set(int(self.breakers[name].state != CircuitBreaker.CLOSED))
+
+    async def _send_async(self, channel, reminder):
+        start = time.perf_counter()
+        try:
+            await channel.send_async(reminder)
+        finally:
+            self._observe(channel.name, time.perf_counter() - start)
+
+    def _send(self, channel, reminder):
+        start = time.perf_counter()
+        try:
+            return channel.send(reminder)
+        finally:
+            self._observe(channel.name, time.perf_counter() - start)
+
+    def _observe(self, name, elapsed):
+        self.latencies[name].observe(elapsed)
+        self.send_seconds[name].observe(elapsed)
+
+    # Per-channel counters, breaker state and latency percentiles
+    def channel_stats(self):
+        stats = {}
+        with self._lock:
+            for channel in self.channels:
+                name = channel.name
+                histogram = self.latencies[name]
+                stats[name] = dict(self.stats[name],
+                                   breaker=self.breakers[name].state,
+                                   latency_p50=histogram.quantile(0.5),
+                                   latency_p99=histogram.quantile(0.99),
+                                   latency=histogram.snapshot())
+        return stats
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
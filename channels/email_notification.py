@@ -1,8 +1,17 @@
+import asyncio
 import os
+import queue
+import random
 import smtplib
+import threading
+import time
 import logging
+from concurrent.futures import Future
 from datetime import datetime
-from utils.db_utils import log_email_status
+from utils.db_utils import log_email_status, DEFAULT_USER_ID
+from channels.base import Channel, finish_delivery, register_channel, start_delivery
+
+logger = logging.getLogger(__name__)
 
 # Email Configuration
 EMAIL = os.getenv("MAIL_USERNAME")
@@ -12,15 +21,396 @@ MAIL_HOST = os.getenv("MAIL_HOST")
 MAIL_PORT = int(os.getenv("MAIL_PORT"))
 MAIL_ENCRYPTION = os.getenv("MAIL_ENCRYPTION")
 
-# Send Email
-def send_email(subject, message):
-    try:
-        with smtplib.SMTP(MAIL_HOST, MAIL_PORT) as server:
+# Delivery Queue Configuration
+MAIL_WORKERS = int(os.getenv("MAIL_WORKERS", 2))  # SMTP sessions kept open in parallel
+MAIL_BATCH_SIZE = int(os.getenv("MAIL_BATCH_SIZE", 50))  # messages sent per session pass
+MAIL_MAX_RETRIES = int(os.getenv("MAIL_MAX_RETRIES", 3))
+MAIL_RETRY_BACKOFF = float(os.getenv("MAIL_RETRY_BACKOFF", 2))  # seconds, doubled per attempt
+MAIL_SESSION_IDLE_TIMEOUT = float(os.getenv("MAIL_SESSION_IDLE_TIMEOUT", 60))  # seconds before an idle session is closed
+MAIL_QUEUE_SIZE = int(os.getenv("MAIL_QUEUE_SIZE", 10000))
+
+
+class EmailMessage:
+    __slots__ = ("subject", "message", "recipients", "user_id", "attempts", "enqueued_at", "receipt")
+
+    def __init__(self, subject, message, recipients, user_id=DEFAULT_USER_ID, receipt=None):
+        self.subject = subject
+        self.message = message
+        self.recipients = recipients
+        self.user_id = user_id
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+        self.receipt = receipt  # completed with the delivery outcome, if the sender waits for it
+
+
+# Background queue that delivers emails over long-lived, authenticated SMTP sessions
+class EmailDeliveryQueue:
+    def __init__(self, host=MAIL_HOST, port=MAIL_PORT, username=EMAIL, password=PASSWORD, from_address=EMAIL,
+                 encryption=MAIL_ENCRYPTION, workers=MAIL_WORKERS, batch_size=MAIL_BATCH_SIZE,
+                 max_retries=MAIL_MAX_RETRIES, retry_backoff=MAIL_RETRY_BACKOFF,
+                 session_idle_timeout=MAIL_SESSION_IDLE_TIMEOUT, maxsize=MAIL_QUEUE_SIZE, on_result=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.from_address = from_address
+        self.encryption = (encryption or "").lower()
+        self.workers = workers
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.session_idle_timeout = session_idle_timeout
+        self.on_result = on_result or self._log_result
+
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._threads = []
+        self._stopping = threading.Event()
+        self._lock = threading.Lock()
+        self.stats = {"sent": 0, "failed": 0, "retried": 0, "sessions_opened": 0, "latency_total": 0.0}
+
+    # Start the worker threads
+    def start(self):
+        with self._lock:
+            if self._threads:
+                return
+            self._stopping.clear()
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f"email-worker-{i}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    # Queue an email without blocking; returns False if the queue is full. A receipt
+    # (concurrent.futures.Future) is completed once the email is sent or given up on.
+    def enqueue(self, subject, message, recipients=None, user_id=DEFAULT_USER_ID, receipt=None):
+        if not self._threads:
+            self.start()
+        recipients = recipients or [TO_EMAIL]
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        try:
+            self._queue.put_nowait(EmailMessage(subject, message, list(recipients), user_id, receipt))
+            return True
+        except queue.Full:
+            logger.error("Email queue full, dropping email: %s", subject)
+            self.on_result(EmailMessage(subject, message, recipients, user_id), False, "Email queue full")
+            return False
+
+    # Wait until every queued email has been delivered or given up on
+    def join(self):
+        self._queue.join()
+
+    # Drain the queue and stop the workers
+    def stop(self, timeout=None):
+        with self._lock:
+            threads, self._threads = self._threads, []
+        if not threads:
+            return
+        self._stopping.set()
+        for thread in threads:
+            thread.join(timeout)
+
+    def _worker(self):
+        server = None
+        last_used = time.monotonic()
+        while True:
+            try:
+                batch = [self._queue.get(timeout=1)]
+            except queue.Empty:
+                if server is not None and time.monotonic() - last_used >= self.session_idle_timeout:
+                    server = self._close_session(server)
+                if self._stopping.is_set():
+                    break
+                continue
+
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            for email in batch:
+                try:
+                    if not start_delivery(email.receipt):
+                        continue  # The dispatcher gave up waiting; the outbox delivers it again
+                    server = self._send(server, email)
+                except Exception as e:
+                    server = self._close_session(server)
+                    self._retry_or_fail(email, e)
+                finally:
+                    self._queue.task_done()
+            last_used = time.monotonic()
+
+        self._close_session(server)
+
+    # Send one email, (re)opening the session when needed
+    def _send(self, server, email):
+        if server is None:
+            server = self._open_session()
+        try:
+            server.sendmail(self.from_address, email.recipients, f"Subject: {email.subject}\n\n{email.message}")
+        except smtplib.SMTPServerDisconnected:
+            # The server dropped an idle session; reconnect once and resend
+            server = self._open_session()
+            server.sendmail(self.from_address, email.recipients, f"Subject: {email.subject}\n\n{email.message}")
+        with self._lock:
+            self.stats["sent"] += 1
+            self.stats["latency_total"] += time.monotonic() - email.enqueued_at
+        finish_delivery(email.receipt)
+        self.on_result(email, True, None)
+        return server
+
+    def _open_session(self):
+        server = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.encryption != "none":
             server.starttls()
-            server.login(EMAIL, PASSWORD)
-            server.sendmail(EMAIL, TO_EMAIL, f"Subject: {subject}\n\n{message}")
-        log_email_status(subject, message, True)
-        logging.info("Email sent successfully.")
-    except Exception as e:
-        log_email_status(subject, message, False, str(e))
-        logging.error(f"Failed to send email: {e}")
\ No newline at end of file
+        if self.username and self.password:
+            server.login(self.username, self.password)
+        with self._lock:
+            self.stats["sessions_opened"] += 1
+        return server
+
+    def _close_session(self, server):
+        if server is not None:
+            try:
+                server.quit()
+            except Exception:
+                server.close()
+        return None
+
+    def _retry_or_fail(self, email, error):
+        email.attempts += 1
+        if email.attempts > self.max_retries or self._stopping.is_set():
+            with self._lock:
+                self.stats["failed"] += 1
+            finish_delivery(email.receipt, error)
+            self.on_result(email, False, str(error))
+            return
+        delay = self.retry_backoff * (2 ** (email.attempts - 1)) * random.uniform(0.8, 1.2)
+        logger.warning("Email '%s' failed (attempt %s), retrying in %.1fs: %s", email.subject, email.attempts, delay, error)
+        with self._lock:
+            self.stats["retried"] += 1
+        timer = threading.Timer(delay, self._requeue, args=(email,))
+        timer.daemon = True
+        timer.start()
+
+    def _requeue(self, email):
+        try:
+            self._queue.put_nowait(email)
+        except queue.Full:
+            finish_delivery(email.receipt, "Email queue full")
+            self.on_result(email, False, "Email queue full")
+
+    @staticmethod
+    def _log_result(email, success, error_message):
+        log_email_status(email.subject, email.message, success, error_message, user_id=email.user_id)
+        if success:
+            logger.info("Email sent successfully.")
+        else:
+            logger.error("Failed to send email: %s", error_message)
+
+
+# asyncio counterpart of EmailDeliveryQueue: worker tasks on the running loop keep aiosmtplib sessions open
+class AsyncEmailDeliveryQueue:
+    def __init__(self, host=MAIL_HOST, port=MAIL_PORT, username=EMAIL, password=PASSWORD, from_address=EMAIL,
+                 encryption=MAIL_ENCRYPTION, workers=MAIL_WORKERS, max_retries=MAIL_MAX_RETRIES,
+                 retry_backoff=MAIL_RETRY_BACKOFF, session_idle_timeout=MAIL_SESSION_IDLE_TIMEOUT,
+                 maxsize=MAIL_QUEUE_SIZE, on_result=None):
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.from_address = from_address
+        self.encryption = (encryption or "").lower()
+        self.workers = workers
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.session_idle_timeout = session_idle_timeout
+        self.maxsize = maxsize
+        self.on_result = on_result  # coroutine function (email, success, error_message)
+
+        self._queue = None
+        self._tasks = []
+        self._retries = set()
+        self._reports = set()
+        self.stats = {"sent": 0, "failed": 0, "retried": 0, "sessions_opened": 0, "latency_total": 0.0}
+
+    # Start the worker tasks on the running loop
+    def start(self):
+        if self._tasks:
+            return
+        self._queue = asyncio.Queue(maxsize=self.maxsize)
+        self._tasks = [asyncio.create_task(self._worker(), name=f"email-worker-{i}") for i in range(self.workers)]
+
+    # Queue an email without waiting; returns False if the queue is full. A receipt (asyncio.Future)
+    # is completed once the email is sent or given up on.
+    def enqueue(self, subject, message, recipients=None, user_id=DEFAULT_USER_ID, receipt=None):
+        if not self._tasks:
+            self.start()
+        recipients = recipients or [TO_EMAIL]
+        if isinstance(recipients, str):
+            recipients = [recipients]
+        try:
+            self._queue.put_nowait(EmailMessage(subject, message, list(recipients), user_id, receipt))
+            return True
+        except asyncio.QueueFull:
+            logger.error("Email queue full, dropping email: %s", subject)
+            self._report(EmailMessage(subject, message, recipients, user_id), False, "Email queue full")
+            return False
+
+    # Deliver what is queued, then cancel the workers
+    async def stop(self, timeout=None):
+        if not self._tasks:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning("Stopping the email queue with %s email(s) undelivered.", self._queue.qsize())
+        for task in self._tasks + list(self._retries):
+            task.cancel()
+        await asyncio.gather(*self._tasks, *self._retries, return_exceptions=True)
+        self._tasks = []
+        # Let the result callbacks finish logging
+        await asyncio.gather(*self._reports, return_exceptions=True)
+
+    async def _worker(self):
+        client = None
+        try:
+            while True:
+                try:
+                    email = await asyncio.wait_for(self._queue.get(), self.session_idle_timeout)
+                except asyncio.TimeoutError:
+                    client = await self._close_session(client)
+                    continue
+                try:
+                    if email.receipt is not None and email.receipt.cancelled():
+                        continue  # The dispatcher gave up waiting; the outbox delivers it again
+                    client = await self._send(client, email)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    client = await self._close_session(client)
+                    self._retry_or_fail(email, e)
+                finally:
+                    self._queue.task_done()
+        finally:
+            await self._close_session(client)
+
+    async def _send(self, client, email):
+        if client is None or not client.is_connected:
+            client = await self._open_session()
+        await client.sendmail(self.from_address, email.recipients, f"Subject: {email.subject}\n\n{email.message}")
+        self.stats["sent"] += 1
+        self.stats["latency_total"] += time.monotonic() - email.enqueued_at
+        self._report(email, True, None)
+        return client
+
+    async def _open_session(self):
+        import aiosmtplib
+
+        client = aiosmtplib.SMTP(hostname=self.host, port=self.port, timeout=30, start_tls=False)
+        await client.connect()
+        if self.encryption != "none":
+            await client.starttls()
+        if self.username and self.password:
+            await client.login(self.username, self.password)
+        self.stats["sessions_opened"] += 1
+        return client
+
+    async def _close_session(self, client):
+        if client is not None:
+            try:
+                await client.quit()
+            except Exception:
+                client.close()
+        return None
+
+    def _retry_or_fail(self, email, error):
+        email.attempts += 1
+        if email.attempts > self.max_retries:
+            self.stats["failed"] += 1
+            self._report(email, False, str(error))
+            return
+        delay = self.retry_backoff * (2 ** (email.attempts - 1)) * random.uniform(0.8, 1.2)
+        logger.warning("Email '%s' failed (attempt %s), retrying in %.1fs: %s", email.subject, email.attempts, delay, error)
+        self.stats["retried"] += 1
+        task = asyncio.create_task(self._requeue_after(email, delay))
+        self._retries.add(task)
+        task.add_done_callback(self._retries.discard)
+
+    async def _requeue_after(self, email, delay):
+        await asyncio.sleep(delay)
+        try:
+            self._queue.put_nowait(email)
+        except asyncio.QueueFull:
+            self._report(email, False, "Email queue full")
+
+    def _report(self, email, success, error_message):
+        if email.receipt is not None and not email.receipt.done():
+            if success:
+                email.receipt.set_result(None)
+            else:
+                email.receipt.set_exception(RuntimeError(error_message))
+        if success:
+            logger.info("Email sent successfully.")
+        else:
+            logger.error("Failed to send email: %s", error_message)
+        if self.on_result is not None:
+            task = asyncio.ensure_future(self.on_result(email.subject, email.message, success, error_message,
+                                                        user_id=email.user_id))
+            self._reports.add(task)
+            task.add_done_callback(self._reports.discard)
+
+
+email_queue = EmailDeliveryQueue()
+async_email_queue = None
+
+# Queue an email for background delivery
+def enqueue_email(subject, message, recipients=None, user_id=DEFAULT_USER_ID, receipt=None):
+    return email_queue.enqueue(subject, message, recipients, user_id, receipt)
+
+# Stop the email workers after the queued emails are sent
+def stop_email_queue(timeout=None):
+    email_queue.stop(timeout)
+
+# Start the asyncio email workers; on_result is a coroutine function with log_email_status's signature
+def start_async_email_queue(on_result=None):
+    global async_email_queue
+    async_email_queue = AsyncEmailDeliveryQueue(on_result=on_result)
+    async_email_queue.start()
+    return async_email_queue
+
+# Stop the asyncio email workers after the queued emails are sent
+async def stop_async_email_queue(timeout=None):
+    global async_email_queue
+    if async_email_queue is not None:
+        await async_email_queue.stop(timeout)
+        async_email_queue = None
+
+
+# Email reminder, handed to the background delivery queue; the returned receipt completes once it is sent
+@register_channel
+class EmailChannel(Channel):
+    name = "email"
+
+    def enabled(self):
+        return bool(MAIL_HOST and TO_EMAIL)
+
+    def send(self, reminder):
+        receipt = Future()
+        if not enqueue_email(reminder.subject, reminder.message, user_id=reminder.user_id, receipt=receipt):
+            raise RuntimeError("Email queue is full.")
+        return receipt
+
+    # Waits for the SMTP result; the dispatcher's timeout cancels the wait and drops the email if still queued
+    async def send_async(self, reminder):
+        if async_email_queue is None:
+            return await super().send_async(reminder)
+        receipt = asyncio.get_running_loop().create_future()
+        if not async_email_queue.enqueue(reminder.subject, reminder.message, user_id=reminder.user_id,
+                                         receipt=receipt):
+            raise RuntimeError("Email queue is full.")
+        await receipt
+
+    @classmethod
+    def stop_workers(cls, timeout=None):
+        stop_email_queue(timeout)
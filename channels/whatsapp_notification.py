@@ -1,32 +1,346 @@
-import pywhatkit as kit
+import asyncio
+import http.client
+import json
 import logging
 import os
-import pyautogui
+import threading
 import time
+from concurrent.futures import Future
+from urllib.parse import urlsplit
+from channels.base import Channel, finish_delivery, register_channel, start_delivery
+
+logger = logging.getLogger(__name__)
 
 # WhatsApp Configuration
 WHATSAPP_NUMBER = os.getenv("WHATSAPP_NUMBER")  # Replace with the recipient's WhatsApp number
 WHATSAPP_MESSAGE = os.getenv("WHATSAPP_MESSAGE")
+WHATSAPP_BACKEND = os.getenv("WHATSAPP_BACKEND", "http")  # "http" or "pywhatkit"
+WHATSAPP_API_URL = os.getenv("WHATSAPP_API_URL")  # e.g. https://api.example.com/v1/messages
+WHATSAPP_API_TOKEN = os.getenv("WHATSAPP_API_TOKEN")
+WHATSAPP_TIMEOUT = float(os.getenv("WHATSAPP_TIMEOUT", 10))  # seconds per HTTP request
+WHATSAPP_RATE_LIMIT = float(os.getenv("WHATSAPP_RATE_LIMIT", 5))  # messages per second
+WHATSAPP_BATCH_SIZE = int(os.getenv("WHATSAPP_BATCH_SIZE", 20))  # messages sent per worker wake-up
+WHATSAPP_MAX_RETRIES = int(os.getenv("WHATSAPP_MAX_RETRIES", 2))
+WHATSAPP_QUEUE_SIZE = int(os.getenv("WHATSAPP_QUEUE_SIZE", 10000))
+
+
+class WhatsAppMessage:
+    __slots__ = ("to", "text", "attempts", "enqueued_at", "receipt")
+
+    def __init__(self, to, text, receipt=None):
+        self.to = to
+        self.text = text
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+        self.receipt = receipt  # completed with the delivery outcome, if the sender waits for it
+
+
+# Sends messages through an HTTP messaging API over one keep-alive connection
+class HttpApiBackend:
+    def __init__(self, url=WHATSAPP_API_URL, token=WHATSAPP_API_TOKEN, timeout=WHATSAPP_TIMEOUT):
+        if not url:
+            raise ValueError("WHATSAPP_API_URL must be set for the HTTP WhatsApp backend.")
+        parts = urlsplit(url)
+        self.scheme = parts.scheme
+        self.host = parts.hostname
+        self.port = parts.port
+        self.path = parts.path or "/"
+        self.token = token
+        self.timeout = timeout
+        self._conn = None
+
+    # Send a batch; returns a list of (message, error or None)
+    def send_batch(self, messages):
+        results = []
+        for message in messages:
+            try:
+                self._post(message)
+                results.append((message, None))
+            except Exception as e:
+                self.close()
+                results.append((message, e))
+        return results
+
+    def _post(self, message):
+        if self._conn is None:
+            connection_class = http.client.HTTPSConnection if self.scheme == "https" else http.client.HTTPConnection
+            self._conn = connection_class(self.host, self.port, timeout=self.timeout)
+        body = json.dumps({"to": message.to, "message": message.text})
+        headers = {"Content-Type": "application/json"}
+        if self.token:
+            headers["Authorization"] = f"Bearer {self.token}"
+        self._conn.request("POST", self.path, body=body, headers=headers)
+        response = self._conn.getresponse()
+        response.read()  # Drain the body so the connection can be reused
+        if response.status >= 300:
+            raise RuntimeError(f"WhatsApp API returned HTTP {response.status}")
+
+    def close(self):
+        if self._conn is not None:
+            self._conn.close()
+            self._conn = None
+
+
+# Legacy backend: drives WhatsApp Web in a browser with pywhatkit and pyautogui (~30 s per message)
+class PywhatkitBackend:
+    def send_batch(self, messages):
+        import pywhatkit as kit
+        import pyautogui
+
+        results = []
+        for message in messages:
+            try:
+                # Send the message instantly
+                kit.sendwhatmsg_instantly(message.to, message.text, wait_time=10, tab_close=False)
+                logger.info("WhatsApp message opened in browser.")
+
+                # Wait for the browser to open and load the message
+                time.sleep(15)
+
+                # Press 'Enter' to send the message
+                pyautogui.press('enter')
+
+                # Wait for a few seconds to ensure the message is sent
+                time.sleep(5)
+
+                # Close the tab using pyautogui
+                pyautogui.hotkey('ctrl', 'w')
+                logger.info("WhatsApp tab closed.")
+                results.append((message, None))
+            except Exception as e:
+                results.append((message, e))
+        return results
+
+    def close(self):
+        pass
+
+
+# Stand-in that fails every message when the configured backend cannot be created
+class _UnavailableBackend:
+    def __init__(self, error):
+        self.error = error
+
+    def send_batch(self, messages):
+        return [(message, self.error) for message in messages]
+
+    def close(self):
+        pass
+
+
+BACKENDS = {
+    "http": HttpApiBackend,
+    "pywhatkit": PywhatkitBackend,
+}
+
+
+# Rate-limited, batching delivery worker running its own asyncio loop on a dedicated thread
+class WhatsAppDeliveryWorker:
+    def __init__(self, backend_factory=None, rate_limit=WHATSAPP_RATE_LIMIT, batch_size=WHATSAPP_BATCH_SIZE,
+                 max_retries=WHATSAPP_MAX_RETRIES, maxsize=WHATSAPP_QUEUE_SIZE, on_result=None):
+        self.backend_factory = backend_factory or BACKENDS[WHATSAPP_BACKEND]
+        self.rate_limit = rate_limit
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.maxsize = maxsize
+        self.on_result = on_result or self._log_result
+
+        self._loop = None
+        self._queue = None
+        self._thread = None
+        self._ready = threading.Event()
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        self._retrying = {}  # message -> call_later handle putting it back on the queue
+        self.stats = {"sent": 0, "failed": 0, "retried": 0, "dropped": 0}
 
-# Send WhatsApp Message
+    def start(self):
+        with self._lock:
+            if self._thread is None:
+                self._ready.clear()
+                self._thread = threading.Thread(target=self._run_loop, name="whatsapp-worker", daemon=True)
+                self._thread.start()
+        self._ready.wait()
+
+    # Queue a message without blocking; returns False if the queue is full. A receipt
+    # (concurrent.futures.Future) is completed once the message is sent or given up on.
+    def enqueue(self, text, to=None, receipt=None):
+        if self._thread is None:
+            self.start()
+        with self._lock:
+            if self._pending >= self.maxsize:
+                self.stats["dropped"] += 1
+                logger.error("WhatsApp queue full, dropping message to %s.", to or WHATSAPP_NUMBER)
+                return False
+            self._pending += 1
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, WhatsAppMessage(to or WHATSAPP_NUMBER, text, receipt))
+        return True
+
+    # Wait until every queued message has been sent or given up on
+    def join(self, timeout=None):
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    # Send what is queued, then stop the worker thread
+    def stop(self, timeout=None):
+        with self._lock:
+            thread = self._thread
+        if thread is None:
+            return
+        self.join(timeout)
+        self._loop.call_soon_threadsafe(self._queue.put_nowait, None)
+        thread.join(timeout)
+        with self._lock:
+            self._thread = None
+
+    def _run_loop(self):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._queue = asyncio.Queue()
+        self._ready.set()
+        try:
+            self._loop.run_until_complete(self._consume())
+        finally:
+            self._loop.close()
+
+    async def _consume(self):
+        try:
+            backend = self.backend_factory()
+        except Exception as e:
+            logger.error("Could not create the %s WhatsApp backend: %s", WHATSAPP_BACKEND, e)
+            backend = _UnavailableBackend(e)
+        tokens = float(self.batch_size)
+        refilled_at = time.monotonic()
+        try:
+            while True:
+                message = await self._queue.get()
+                if message is None:
+                    break
+                batch = [message]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                stop_after = any(message is None for message in batch)
+                batch = [message for message in batch if message is not None and self._start(message)]
+                if not batch:
+                    if stop_after:
+                        break
+                    continue
+
+                # Token bucket: wait until the batch fits within the rate limit
+                if self.rate_limit > 0:
+                    now = time.monotonic()
+                    tokens = min(float(self.batch_size), tokens + (now - refilled_at) * self.rate_limit)
+                    refilled_at = now
+                    if tokens < len(batch):
+                        await asyncio.sleep((len(batch) - tokens) / self.rate_limit)
+                        tokens = float(len(batch))
+                        refilled_at = time.monotonic()
+                    tokens -= len(batch)
+
+                # The backend does blocking I/O, so run it off the event loop
+                results = await self._loop.run_in_executor(None, backend.send_batch, batch)
+                for message, error in results:
+                    self._finish(message, error)
+                if stop_after:
+                    break
+        finally:
+            backend.close()
+            self._abandon()
+
+    # Fail whatever is still queued or waiting to be retried once the worker stops
+    def _abandon(self):
+        error = RuntimeError("WhatsApp worker stopped before the message was sent.")
+        for message, handle in list(self._retrying.items()):
+            handle.cancel()
+            self._complete(message, error)
+        self._retrying.clear()
+        while not self._queue.empty():
+            message = self._queue.get_nowait()
+            if message is not None:
+                self._complete(message, error)
+
+    # Whether to send a message; one whose receipt the dispatcher cancelled is dropped
+    def _start(self, message):
+        if start_delivery(message.receipt):
+            return True
+        with self._idle:
+            self._pending -= 1
+            self._idle.notify_all()
+        return False
+
+    def _finish(self, message, error):
+        if error is not None and message.attempts < self.max_retries:
+            message.attempts += 1
+            with self._lock:
+                self.stats["retried"] += 1
+            delay = 2 ** message.attempts
+            logger.warning("WhatsApp message to %s failed (attempt %s), retrying in %ss: %s",
+                           message.to, message.attempts, delay, error)
+            self._retrying[message] = self._loop.call_later(delay, self._requeue, message)
+            return
+        self._complete(message, error)
+
+    # Put a message back on the queue once its retry delay has passed
+    def _requeue(self, message):
+        del self._retrying[message]
+        self._queue.put_nowait(message)
+
+    # Count the outcome, resolve the receipt and report it
+    def _complete(self, message, error):
+        with self._idle:
+            self.stats["sent" if error is None else "failed"] += 1
+            self._pending -= 1
+            self._idle.notify_all()
+        finish_delivery(message.receipt, error)
+        self.on_result(message, error)
+
+    @staticmethod
+    def _log_result(message, error):
+        if error is None:
+            logger.info("WhatsApp message sent to %s.", message.to)
+        else:
+            logger.error("Error sending WhatsApp message to %s: %s", message.to, error)
+
+
+whatsapp_worker = WhatsAppDeliveryWorker()
+
+# Whether WhatsApp delivery is configured
+def whatsapp_enabled():
+    if not WHATSAPP_NUMBER:
+        return False
+    return WHATSAPP_BACKEND != "http" or bool(WHATSAPP_API_URL)
+
+# Queue a WhatsApp message for background delivery
+def enqueue_whatsapp_message(message, to=None, receipt=None):
+    return whatsapp_worker.enqueue(message, to, receipt)
+
+# Send WhatsApp Message (queued; returns immediately)
 def send_whatsapp_message(message):
-    try:
-        # Send the message instantly
-        kit.sendwhatmsg_instantly(WHATSAPP_NUMBER, message, wait_time=10, tab_close=False)
-        logging.info("WhatsApp message opened in browser.")
-
-        # Wait for the browser to open and load the message
-        time.sleep(15)
-
-        # Press 'Enter' to send the message
-        pyautogui.press('enter')
-        logging.info("WhatsApp message sent.")
-
-        # Wait for a few seconds to ensure the message is sent
-        time.sleep(5)
-
-        # Close the tab using pyautogui
-        pyautogui.hotkey('ctrl', 'w')
-        logging.info("WhatsApp tab closed.")
-    except Exception as e:
-        logging.error(f"Error sending WhatsApp message: {e}", exc_info=True)
\ No newline at end of file
+    return enqueue_whatsapp_message(message)
+
+# Stop the WhatsApp worker after the queued messages are sent
+def stop_whatsapp_worker(timeout=None):
+    whatsapp_worker.stop(timeout)
+
+
+# WhatsApp reminder, handed to the background delivery worker; the returned receipt completes once it is sent
+@register_channel
+class WhatsAppChannel(Channel):
+    name = "whatsapp"
+
+    def enabled(self):
+        return whatsapp_enabled()
+
+    def send(self, reminder):
+        receipt = Future()
+        if not enqueue_whatsapp_message(reminder.message, receipt=receipt):
+            raise RuntimeError("WhatsApp queue is full.")
+        return receipt
+
+    # Enqueueing never blocks, so there is no need for an executor thread; only the receipt is awaited
+    async def send_async(self, reminder):
+        await asyncio.wrap_future(self.send(reminder))
+
+    @classmethod
+    def stop_workers(cls, timeout=None):
+        stop_whatsapp_worker(timeout)
@@ -1,28 +1,220 @@
+import argparse
+import ctypes
+import ctypes.util
+import logging
 import os
+import re
+import select
+import sys
 import time
-import glob
-
-def get_latest_log_file():
-    log_files = glob.glob("logs/hydration_tracker.log*")
-    if not log_files:
-        return None
-    latest_log_file = max(log_files, key=os.path.getctime)
-    return latest_log_file
-
-def follow_log_file(log_file):
-    with open(log_file, 'r') as f:
-        f.seek(0, os.SEEK_END)
+
+logger = logging.getLogger(__name__)
+
+LOG_FILE = os.getenv("LOG_FILE", "logs/hydration_tracker.log")
+READ_CHUNK_SIZE = 256 * 1024  # bytes read per syscall
+MIN_POLL_INTERVAL = 0.05  # seconds
+MAX_POLL_INTERVAL = 2.0
+
+LEVELS = {"DEBUG": 10, "INFO": 20, "WARNING": 30, "ERROR": 40, "CRITICAL": 50}
+# Matches both the text format ("... INFO:message") and JSON lines ("level": "INFO")
+LEVEL_PATTERN = re.compile(r' (DEBUG|INFO|WARNING|ERROR|CRITICAL):|"level": "(DEBUG|INFO|WARNING|ERROR|CRITICAL)"')
+
+# inotify event masks (see <sys/inotify.h>)
+IN_MODIFY = 0x00000002
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_NONBLOCK = 0x00000800
+IN_CLOEXEC = 0x00080000
+
+# Wakes on changes in the log directory via inotify (Linux only)
+class InotifyWatcher:
+    def __init__(self, directory):
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        mask = IN_MODIFY | IN_CREATE | IN_MOVED_FROM | IN_MOVED_TO | IN_DELETE
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f"inotify_add_watch failed for {directory}")
+
+    # Block until something changes or timeout seconds pass
+    def wait(self, timeout=None):
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if readable:
+            try:
+                # Events are only a wake-up signal; the follower re-checks the file itself
+                while os.read(self.fd, 64 * 1024):
+                    pass
+            except BlockingIOError:
+                pass
+        return bool(readable)
+
+    def close(self):
+        os.close(self.fd)
+
+# Fallback for platforms without inotify: poll, backing off while the log is idle
+class PollingWatcher:
+    def __init__(self, min_interval=MIN_POLL_INTERVAL, max_interval=MAX_POLL_INTERVAL):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.interval = min_interval
+
+    def wait(self, timeout=None):
+        interval = self.interval if timeout is None else min(self.interval, timeout)
+        time.sleep(interval)
+        self.interval = min(self.interval * 2, self.max_interval)
+        return False
+
+    # Called when new data arrived, so the next wait is short again
+    def reset(self):
+        self.interval = self.min_interval
+
+    def close(self):
+        pass
+
+# Delivers matching log lines to one callback
+class Subscriber:
+    def __init__(self, callback, level=None, pattern=None):
+        self.callback = callback
+        self.min_level = LEVELS[level.upper()] if level else 0
+        self.pattern = re.compile(pattern) if pattern else None
+
+    def matches(self, line, level):
+        if level < self.min_level:
+            return False
+        return self.pattern is None or self.pattern.search(line) is not None
+
+# Follows a log file across rotations, like `tail -F`, fanning lines out to subscribers
+class LogFollower:
+    def __init__(self, path=LOG_FILE, chunk_size=READ_CHUNK_SIZE, from_start=False):
+        self.path = path
+        self.chunk_size = chunk_size
+        self.from_start = from_start
+        self.subscribers = []
+        self._file = None
+        self._inode = None
+        self._partial = b""
+        self._last_level = LEVELS["INFO"]
+
+    def subscribe(self, callback, level=None, pattern=None):
+        subscriber = Subscriber(callback, level, pattern)
+        self.subscribers.append(subscriber)
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        self.subscribers.remove(subscriber)
+
+    # Follow the file until stop_event is set (or forever)
+    def run(self, stop_event=None):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        try:
+            watcher = InotifyWatcher(directory)
+        except (OSError, AttributeError) as e:
+            logger.debug("inotify unavailable, falling back to polling: %s", e)
+            watcher = PollingWatcher()
+
+        try:
+            self._open(seek_end=not self.from_start)
+            while stop_event is None or not stop_event.is_set():
+                if self.poll():
+                    if isinstance(watcher, PollingWatcher):
+                        watcher.reset()
+                    continue
+                # Wake at least every MAX_POLL_INTERVAL to notice a stop request or a missed rotation
+                watcher.wait(MAX_POLL_INTERVAL)
+        finally:
+            watcher.close()
+            if self._file:
+                self._file.close()
+
+    # Read whatever is available; returns True if any data was read
+    def poll(self):
+        if self._file is None and not self._open(seek_end=False):
+            return False
+
+        read_any = self._read_available()
+        rotated = self._rotated()
+        if rotated:
+            # Drain what was written to the old file before the rename, then switch
+            read_any = self._read_available() or read_any
+            self._flush_partial()
+            self._file.close()
+            self._file = None
+            read_any = self._open(seek_end=False) or read_any
+        return read_any
+
+    def _open(self, seek_end):
+        try:
+            self._file = open(self.path, "rb", buffering=0)
+        except FileNotFoundError:
+            self._file = None
+            return False
+        self._inode = os.fstat(self._file.fileno()).st_ino
+        self._partial = b""
+        if seek_end:
+            self._file.seek(0, os.SEEK_END)
+        return True
+
+    def _rotated(self):
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return True
+        if stat.st_ino != self._inode:
+            return True
+        if stat.st_size < self._file.tell():
+            # Truncated in place; start over from the beginning
+            self._file.seek(0)
+            self._partial = b""
+        return False
+
+    def _read_available(self):
+        read_any = False
         while True:
-            line = f.readline()
-            if not line:
-                time.sleep(1)
-                continue
-            print(line, end='')
+            chunk = self._file.read(self.chunk_size)
+            if not chunk:
+                return read_any
+            read_any = True
+            lines = (self._partial + chunk).split(b"\n")
+            self._partial = lines.pop()
+            for line in lines:
+                self._dispatch(line)
+
+    def _flush_partial(self):
+        if self._partial:
+            self._dispatch(self._partial)
+            self._partial = b""
+
+    def _dispatch(self, raw_line):
+        line = raw_line.decode("utf-8", errors="replace")
+        match = LEVEL_PATTERN.search(line)
+        # Lines without a level (e.g. tracebacks) belong to the previous record
+        if match:
+            self._last_level = LEVELS[match.group(1) or match.group(2)]
+        for subscriber in self.subscribers:
+            if subscriber.matches(line, self._last_level):
+                subscriber.callback(line)
 
 if __name__ == "__main__":
-    latest_log_file = get_latest_log_file()
-    if latest_log_file:
-        print(f"Following log file: {latest_log_file}")
-        follow_log_file(latest_log_file)
+    parser = argparse.ArgumentParser(description="Follow the hydration tracker log across rotations.")
+    parser.add_argument("--file", default=LOG_FILE, help="log file to follow")
+    parser.add_argument("--level", choices=list(LEVELS), help="minimum level to show")
+    parser.add_argument("--grep", help="only show lines matching this regular expression")
+    parser.add_argument("--from-start", action="store_true", help="print the existing contents first")
+    args = parser.parse_args()
+
+    # Rotated backups (hydration_tracker.log.N) are never followed; a missing log is read once it is created
+    if os.path.exists(args.file):
+        print(f"Following log file: {args.file}")
     else:
-        print("No log files found.")
\ No newline at end of file
+        print(f"Waiting for log file: {args.file}")
+    follower = LogFollower(args.file, from_start=args.from_start)
+    follower.subscribe(print, level=args.level, pattern=args.grep)
+    try:
+        follower.run()
+    except KeyboardInterrupt:
+        sys.exit(0)
@@ -0,0 +1,234 @@
+import asyncio
+import logging
+import os
+import signal
+from datetime import datetime
+from utils.db_utils import (
+    initialize_database, start_log_archiver, reload_user_settings, start_settings_reload, user_settings,
+)
+from utils.async_db import AsyncDatabase
+from channels.dispatcher import NotificationDispatcher
+from handlers.async_scheduler import AsyncReminderScheduler
+from handlers.confirmation_inbox import RESPONSES, CONFIRMATION_BATCH_SIZE, confirmation_inbox
+from handlers.notification_handler import (
+    NOTIFICATION_TITLE, WEEKLY_GOAL_JOB, REMINDERS_SCHEDULED, REMINDERS_SKIPPED, REMINDER_SECONDS,
+    user_reminder_time, users_to_reschedule, prompt_for_response, next_weekly_goal_time,
+)
+from handlers.reminder_outbox import (
+    OUTBOX_POLL_INTERVAL, REMINDERS_SENT, OUTBOX_RESULTS, reminder_key, outbox_reminder, delivered,
+)
+from utils.metrics import registry, timed
+
+logger = logging.getLogger(__name__)
+
+# Asyncio Runtime Configuration
+ASYNC_MAX_CONCURRENT_REMINDERS = int(os.getenv("ASYNC_MAX_CONCURRENT_REMINDERS", 1000))  # reminder jobs in flight
+ASYNC_SHUTDOWN_TIMEOUT = float(os.getenv("ASYNC_SHUTDOWN_TIMEOUT", 30))  # seconds to deliver queued email on exit
+CONFIRMATION_POLL_INTERVAL = 0.5  # seconds between inbox checks when it is empty
+LOOP_LAG_INTERVAL = 1.0  # seconds between event loop lag probes
+
+# Metrics
+EVENT_LOOP_LAG_SECONDS = registry.histogram("hydration_event_loop_lag_seconds",
+                                            "How late the event loop wakes from a timed sleep")
+
+db = None
+dispatcher = None
+scheduler = None
+
+# Queue a hydration reminder for a user and return when the next one is due; deliver_outbox sends it
+@timed(REMINDER_SECONDS, runtime="async")
+async def send_reminder(user_id, due_time):
+    now = datetime.now()
+    rules = user_settings.rules(user_id)
+
+    # Skip if the window is closed or a notification was already sent within the interval (cached; a user
+    # evicted from the cache or new since startup is loaded without blocking the loop)
+    last_reminder_time = (await db.get_user_state(user_id)).last_hydration_log_time
+    if not rules.is_due(now, last_reminder_time):
+        logger.info("No reminder due for user %s (last sent %s). Skipping this reminder.", user_id, last_reminder_time)
+        REMINDERS_SKIPPED.inc()
+        REMINDERS_SCHEDULED.inc()
+        return rules.next_reminder_time(last_reminder_time or now, now)
+
+    next_drink_time = now + rules.interval
+    logger.info("Time to send a hydration reminder to user %s (due %s). Next drink time: %s", user_id, due_time, next_drink_time)
+    message = (f"It's time to drink {rules.bottle_volume:g}L of water! "
+               f"Next drink time: {next_drink_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    await db.enqueue_reminder(reminder_key(user_id, last_reminder_time, rules.drink_interval, now), user_id, now,
+                              NOTIFICATION_TITLE, message, next_drink_time)  # Logged as pending once delivered
+    REMINDERS_SCHEDULED.inc()
+    return rules.next_reminder_time(now, now)
+
+# Evaluate every user's weekly goal on the prize day and schedule the next check
+async def run_weekly_goal_check(key, due_time):
+    if user_settings.default_rules.is_prize_day(due_time):
+        await db.check_weekly_goals(due_time)
+    return next_weekly_goal_time()
+
+# Re-key the reminders of users whose settings changed, scheduling users new to the settings table
+async def reschedule_users(user_ids):
+    now = datetime.now()
+    user_ids = users_to_reschedule(user_ids, scheduler.keys())
+    for user_id in user_ids:
+        state = await db.get_user_state(user_id)
+        scheduler.schedule(user_id, user_reminder_time(user_id, state.last_hydration_log_time,
+                                                       state.last_email_log_time, now), send_reminder)
+    logger.info("Rescheduled reminders for %s user(s) after a settings change.", len(user_ids))
+
+# Settings reload listener: runs on the reload thread and hands the rescheduling to the loop
+def on_settings_change(loop, user_ids):
+    asyncio.run_coroutine_threadsafe(reschedule_users(user_ids), loop).add_done_callback(log_reschedule_error)
+
+def log_reschedule_error(future):
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Error rescheduling reminders after a settings change: %s", future.exception())
+
+# Apply a batch of confirmation inbox responses
+async def apply_confirmations(batch):
+    by_outcome = {}
+    for confirmation in batch:
+        is_drunk, status = RESPONSES[confirmation.response]
+        if confirmation.log_id is not None:
+            by_outcome.setdefault((is_drunk, status), []).append(confirmation.log_id)
+            continue
+        try:
+            await db.log_hydration_reminder(is_drunk, status=status, update_pending=True, user_id=confirmation.user_id)
+        except Exception as e:
+            logger.error("Error applying hydration response for user %s: %s", confirmation.user_id, e)
+
+    for (is_drunk, status), log_ids in by_outcome.items():
+        try:
+            await db.update_hydration_log_statuses(log_ids, is_drunk, status)
+        except Exception as e:
+            logger.error("Error applying hydration responses for logs %s: %s", log_ids, e)
+
+# Deliver one claimed batch of outbox reminders concurrently, then mark them sent or put them back for a retry
+async def deliver_reminders(claimed):
+    results = await asyncio.gather(*(dispatcher.dispatch_async(outbox_reminder(row)) for row in claimed))
+    sent = [row for row, result in zip(claimed, results) if delivered(result)]
+    undelivered = [row for row, result in zip(claimed, results) if not delivered(result)]
+    if sent:
+        completed = await db.complete_reminders(sent)
+        if completed:
+            prompt_for_response(completed)
+        REMINDERS_SENT.inc(len(sent))
+        OUTBOX_RESULTS.labels("sent").inc(len(sent))
+    if undelivered:
+        failed = await db.release_reminders(undelivered)
+        OUTBOX_RESULTS.labels("retried").inc(len(undelivered) - failed)
+        OUTBOX_RESULTS.labels("failed").inc(failed)
+        if failed:
+            logger.error("%s reminder(s) could not be delivered after every attempt.", failed)
+
+# Claim and deliver outbox reminders until cancelled; a failed claim leaves them leased until the lease runs out
+async def deliver_outbox(poll_interval=OUTBOX_POLL_INTERVAL):
+    while True:
+        try:
+            claimed = await db.claim_reminders()
+            if claimed:
+                await deliver_reminders(claimed)
+                continue
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Error delivering outbox reminders: %s", e)
+        try:
+            await asyncio.wait_for(db.outbox_ready.wait(), poll_interval)
+        except asyncio.TimeoutError:
+            pass
+        db.outbox_ready.clear()
+
+# Measure how late the loop wakes from a sleep; anything blocking the loop delays every reminder by as much
+async def monitor_loop_lag(interval=LOOP_LAG_INTERVAL):
+    loop = asyncio.get_running_loop()
+    while True:
+        start = loop.time()
+        await asyncio.sleep(interval)
+        EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval))
+
+# Drain the confirmation inbox on the loop; the terminal and HTTP endpoint keep posting from their own threads
+async def consume_confirmations():
+    try:
+        while True:
+            batch = confirmation_inbox.drain(CONFIRMATION_BATCH_SIZE)
+            if batch:
+                await apply_confirmations(batch)
+            else:
+                await asyncio.sleep(CONFIRMATION_POLL_INTERVAL)
+    finally:
+        remaining = confirmation_inbox.drain()
+        if remaining:
+            await asyncio.shield(apply_confirmations(remaining))
+
+# Cancel the given task on SIGINT/SIGTERM
+def install_signal_handlers(task):
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, task.cancel)
+        except (NotImplementedError, RuntimeError):
+            # Windows event loops have no add_signal_handler
+            signal.signal(sig, lambda signum, frame: loop.call_soon_threadsafe(task.cancel))
+
+# Main Hydration Reminder Loop on a single event loop
+async def main():
+    global db, dispatcher, scheduler
+    install_signal_handlers(asyncio.current_task())
+    logger.debug("Starting asyncio hydration reminder runtime.")
+
+    # Migrations run once at startup, off the loop
+    await asyncio.get_running_loop().run_in_executor(None, initialize_database)
+    # Settings are compiled up front and reloaded on their own thread once everyone is scheduled,
+    # so reminders only read them
+    await asyncio.get_running_loop().run_in_executor(None, reload_user_settings)
+    # Archiving runs on its own thread through the threaded storage; main.py stops it
+    start_log_archiver()
+    db = AsyncDatabase()
+    await db.open()
+    dispatcher = NotificationDispatcher()
+    # Channel modules are only imported when enabled, so the email queue is started only with the email channel
+    email_enabled = any(channel.name == "email" for channel in dispatcher.channels)
+    if email_enabled:
+        from channels.email_notification import start_async_email_queue
+        start_async_email_queue(on_result=db.log_email_status)
+    logger.info("Notification channels: %s", ", ".join(channel.name for channel in dispatcher.channels) or "none")
+    scheduler = AsyncReminderScheduler(max_concurrency=ASYNC_MAX_CONCURRENT_REMINDERS)
+    confirmations = asyncio.create_task(consume_confirmations())
+    lag_monitor = asyncio.create_task(monitor_loop_lag())
+    # Deliver queued reminders, including any a previous run left unsent
+    outbox = asyncio.create_task(deliver_outbox())
+
+    try:
+        # Rebuild every user's state and next reminder from their latest logs in one query,
+        # plus users who only have settings so far
+        now = datetime.now()
+        reminder_times = await db.seed_user_state_cache()
+        for user_id in user_settings.user_ids() - reminder_times.keys():
+            reminder_times[user_id] = (None, None)
+        for user_id, (last_hydration_log_time, last_email_log_time) in reminder_times.items():
+            scheduler.schedule(user_id, user_reminder_time(user_id, last_hydration_log_time, last_email_log_time, now),
+                               send_reminder)
+            REMINDERS_SCHEDULED.inc()
+        scheduler.schedule(WEEKLY_GOAL_JOB, next_weekly_goal_time(now), run_weekly_goal_check)
+        logger.info("Scheduled reminders for %s user(s).", len(scheduler) - 1)
+        loop = asyncio.get_running_loop()
+        start_settings_reload(on_change=lambda user_ids: on_settings_change(loop, user_ids))
+
+        await scheduler.run()
+    except asyncio.CancelledError:
+        logger.info("Gracefully shutting down...")
+    finally:
+        confirmations.cancel()
+        lag_monitor.cancel()
+        outbox.cancel()
+        await asyncio.gather(confirmations, lag_monitor, outbox, return_exceptions=True)
+        if email_enabled:
+            from channels.email_notification import stop_async_email_queue
+            await stop_async_email_queue(ASYNC_SHUTDOWN_TIMEOUT)
+        logger.info("Notification channel stats: %s", dispatcher.channel_stats())
+        dispatcher.shutdown(wait=False)
+        await db.close()
+
+# Run the asyncio runtime until SIGINT/SIGTERM
+def run():
+    asyncio.run(main())
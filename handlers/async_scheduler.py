@@ -0,0 +1,99 @@
+import asyncio
+import heapq
+import itertools
+import logging
+from datetime import datetime, timedelta
+from handlers.scheduler import SCHEDULE_LAG_SECONDS
+
+logger = logging.getLogger(__name__)
+
+
+# asyncio counterpart of ReminderScheduler: the same lazily-pruned min-heap, but
+# each due job runs as a task, so thousands of users' reminders can be in
+# flight at once without a thread each. max_concurrency bounds the running jobs.
+class AsyncReminderScheduler:
+    def __init__(self, retry_delay=60, max_concurrency=1000):
+        self.retry_delay = retry_delay  # seconds before a failed job is retried
+        self._heap = []  # (due, seq, key)
+        self._entries = {}  # key -> (due, seq, callback)
+        self._seq = itertools.count()
+        self._wakeup = asyncio.Event()
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._running = set()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # Schedule (or reschedule) a key; callback(key, due) is a coroutine function returning the next due time or None
+    def schedule(self, key, due, callback):
+        seq = next(self._seq)
+        self._entries[key] = (due, seq, callback)
+        heapq.heappush(self._heap, (due, seq, key))
+        if self._heap[0][1] == seq:
+            self._wakeup.set()
+
+    def cancel(self, key):
+        self._entries.pop(key, None)
+
+    def next_due(self, key):
+        entry = self._entries.get(key)
+        return entry[0] if entry else None
+
+    # Copies the keys in one step, so other threads can read them while the loop schedules
+    def keys(self):
+        return list(self._entries)
+
+    # Pop the earliest live entry, waiting until it is due
+    async def _next_ready(self):
+        while True:
+            while self._heap:
+                due, seq, key = self._heap[0]
+                entry = self._entries.get(key)
+                if entry is not None and entry[1] == seq:
+                    break
+                heapq.heappop(self._heap)  # Stale entry left behind by a reschedule or cancel
+            else:
+                self._wakeup.clear()
+                await self._wakeup.wait()
+                continue
+
+            delay = (due - datetime.now()).total_seconds()
+            if delay > 0:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), delay)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            heapq.heappop(self._heap)
+            return key, due, self._entries.pop(key)[2]
+
+    # Run due jobs until cancelled; cancelling also cancels the jobs in flight
+    async def run(self):
+        try:
+            while True:
+                key, due, callback = await self._next_ready()
+                await self._slots.acquire()
+                task = asyncio.create_task(self._run_job(key, due, callback))
+                self._running.add(task)
+                task.add_done_callback(self._running.discard)
+        finally:
+            for task in list(self._running):
+                task.cancel()
+            await asyncio.gather(*self._running, return_exceptions=True)
+
+    async def _run_job(self, key, due, callback):
+        # Includes time spent waiting for a concurrency slot
+        SCHEDULE_LAG_SECONDS.labels("async").observe(max(0.0, (datetime.now() - due).total_seconds()))
+        try:
+            next_due = await callback(key, due)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            logger.error("Scheduled job %r failed, retrying in %ss: %s", key, self.retry_delay, e, exc_info=True)
+            next_due = datetime.now() + timedelta(seconds=self.retry_delay)
+        finally:
+            self._slots.release()
+        if next_due is not None:
+            self.schedule(key, next_due, callback)
@@ -0,0 +1,147 @@
+import json
+import logging
+import os
+import queue
+import threading
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from utils.db_utils import DEFAULT_USER_ID, log_hydration_reminder, update_hydration_log_statuses
+
+logger = logging.getLogger(__name__)
+
+# Confirmation Inbox Configuration
+CONFIRMATION_HOST = os.getenv("CONFIRMATION_HOST", "127.0.0.1")
+CONFIRMATION_PORT = int(os.getenv("CONFIRMATION_PORT", 8765))  # 0 disables the HTTP endpoint
+CONFIRMATION_BATCH_SIZE = int(os.getenv("CONFIRMATION_BATCH_SIZE", 100))
+
+# Accepted responses and the (is_drunk, status) they set; "no" leaves the log pending, as the CLI always has
+RESPONSES = {
+    "drank": (True, "completed"),
+    "yes": (True, "completed"),
+    "skipped": (False, "skipped"),
+    "no": (False, "pending"),
+}
+
+
+class Confirmation:
+    __slots__ = ("response", "log_id", "user_id", "received_at")
+
+    def __init__(self, response, log_id=None, user_id=DEFAULT_USER_ID):
+        self.response = response
+        self.log_id = log_id
+        self.user_id = user_id
+        self.received_at = datetime.now()
+
+
+# Queue of "drank"/"skipped" responses applied to hydration_logs by a background worker.
+# A response with a log_id updates that log; without one it answers the user's latest pending reminder.
+class ConfirmationInbox:
+    def __init__(self, batch_size=CONFIRMATION_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._queue = queue.Queue()
+        self._thread = None
+        self._stop_event = None
+
+    # Post a response without blocking; returns False if the response is not recognised
+    def post(self, response, log_id=None, user_id=DEFAULT_USER_ID):
+        response = str(response).strip().lower()
+        if response not in RESPONSES:
+            logger.warning("Ignoring unknown hydration response: %r", response)
+            return False
+        self._queue.put(Confirmation(response, log_id, user_id))
+        return True
+
+    def start(self, stop_event=None):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event = stop_event or threading.Event()
+        self._thread = threading.Thread(target=self._run, name="confirmation-inbox", daemon=True)
+        self._thread.start()
+
+    # Stop the worker after applying every queued response
+    def stop(self, timeout=None):
+        if self._thread is not None:
+            self._stop_event.set()
+            self._thread.join(timeout)
+            self._thread = None
+        self._apply(self.drain())
+
+    def _run(self):
+        while not self._stop_event.is_set():
+            try:
+                batch = [self._queue.get(timeout=1)]
+            except queue.Empty:
+                continue
+            batch.extend(self.drain(self.batch_size - 1))
+            self._apply(batch)
+
+    # Take up to limit queued responses without waiting
+    def drain(self, limit=None):
+        batch = []
+        while limit is None or len(batch) < limit:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _apply(self, batch):
+        by_outcome = {}
+        for confirmation in batch:
+            is_drunk, status = RESPONSES[confirmation.response]
+            if confirmation.log_id is not None:
+                by_outcome.setdefault((is_drunk, status), []).append(confirmation.log_id)
+                continue
+            try:
+                log_hydration_reminder(is_drunk, status=status, update_pending=True, user_id=confirmation.user_id)
+            except Exception as e:
+                logger.error("Error applying hydration response for user %s: %s", confirmation.user_id, e)
+
+        for (is_drunk, status), log_ids in by_outcome.items():
+            try:
+                update_hydration_log_statuses(log_ids, is_drunk, status)
+            except Exception as e:
+                logger.error("Error applying hydration responses for logs %s: %s", log_ids, e)
+
+
+confirmation_inbox = ConfirmationInbox()
+
+
+# POST /confirm {"response": "drank" | "skipped", "log_id": 123, "user_id": 1}
+class ConfirmationRequestHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        if self.path.rstrip("/") != "/confirm":
+            self.send_error(404)
+            return
+        try:
+            length = int(self.headers.get("Content-Length", 0))
+            body = json.loads(self.rfile.read(length) or b"{}")
+            log_id = body.get("log_id")
+            user_id = int(body.get("user_id", DEFAULT_USER_ID))
+            accepted = confirmation_inbox.post(body.get("response", ""), int(log_id) if log_id is not None else None, user_id)
+        except (ValueError, TypeError, AttributeError) as e:
+            self.send_error(400, f"Invalid confirmation: {e}")
+            return
+        if not accepted:
+            self.send_error(400, f"Response must be one of: {', '.join(RESPONSES)}")
+            return
+        self.send_response(202)
+        self.end_headers()
+
+    def log_message(self, format, *args):
+        logger.debug("Confirmation endpoint: %s", format % args)
+
+
+# Serve the confirmation endpoint on a background thread; returns the server, or None if disabled
+def start_confirmation_server(host=CONFIRMATION_HOST, port=CONFIRMATION_PORT):
+    if not port:
+        return None
+    try:
+        server = ThreadingHTTPServer((host, port), ConfirmationRequestHandler)
+    except OSError as e:
+        logger.error("Could not start confirmation endpoint on %s:%s: %s", host, port, e)
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="confirmation-server", daemon=True).start()
+    logger.info("Confirmation endpoint listening on http://%s:%s/confirm", host, port)
+    return server
@@ -0,0 +1,46 @@
+import threading
+
+# Show popup for hydration response with timeout
+def show_hydration_popup():
+    # tkinter needs a display and is slow to import, so it is only loaded when a popup is shown
+    import tkinter as tk
+    from tkinter import messagebox
+
+    def on_yes():
+        nonlocal is_drunk
+        is_drunk = True
+        root.destroy()
+
+    def on_no():
+        nonlocal is_drunk
+        is_drunk = False
+        root.destroy()
+
+    def on_timeout():
+        nonlocal is_drunk
+        is_drunk = None  # Set to None to indicate pending status
+        root.destroy()
+
+    root = tk.Tk()
+    root.withdraw()  # Hide the main window
+    root.title("Hydration Check")
+    root.geometry("300x100")
+
+    is_drunk = None
+
+    response = messagebox.askyesno(
+        "Hydration Check", "Did you drink 0.5L of water as prompted?"
+    )
+
+    if response:
+        on_yes()
+    else:
+        on_no()
+
+    # Set a timer to automatically close the popup after the timeout
+    timer = threading.Timer(60, on_timeout)
+    timer.start()
+
+    root.mainloop()
+    timer.cancel()  # Cancel the timer if the user responds in time
+    return is_drunk
@@ -1,101 +1,155 @@
-import time
 from datetime import datetime, timedelta
-from plyer import notification
 import logging
-from utils.db_utils import initialize_database, get_last_hydration_log_time, get_last_email_log_time, log_hydration_reminder, check_weekly_goal
-from channels.email_notification import send_email
-from channels.whatsapp_notification import send_whatsapp_message
-import threading
+from utils.db_utils import (
+    initialize_database, seed_user_state_cache, get_user_state, enqueue_reminder, check_weekly_goals,
+    start_log_archiver, reload_user_settings, start_settings_reload, user_settings,
+)
+from channels.dispatcher import NotificationDispatcher
+from handlers.reminder_outbox import ReminderOutboxWorker, reminder_key
+from handlers.scheduler import ReminderScheduler
+from utils.metrics import registry, timed
 
-# Hydration Tracker Configuration
-DRINK_INTERVAL = 100  # minutes (1.67 hours)
-BOTTLE_VOLUME = 0.5  # liters
-DAILY_GOAL = 2  # liters
-PRIZE_DAY = "Sunday"  # Day to evaluate prizes
+logger = logging.getLogger(__name__)
+
+# Hydration Tracker Configuration; the drink interval, bottle volume, goals and reminder
+# window are per-user settings (utils/user_settings.py) reloaded while the tracker runs
+WEEKLY_GOAL_CHECK_HOUR = 23  # Evaluate the weekly goal late on the prize day
+WEEKLY_GOAL_CHECK_MINUTE = 55
+WEEKLY_GOAL_JOB = "weekly_goal"
 
 # Notification Settings
 NOTIFICATION_TITLE = "Hydration Reminder"
-NOTIFICATION_MESSAGE = "Time to drink water!"
-SLEEP_INTERVAL = 60  # seconds
-INPUT_TIMEOUT = 60  # seconds
 
-# Send Notification
-def send_notification(next_drink_time):
-    try:
-        notification.notify(
-            title=NOTIFICATION_TITLE,
-            message=f"{NOTIFICATION_MESSAGE} Next drink time: {next_drink_time.strftime('%Y-%m-%d %H:%M:%S')}",
-            timeout=10
-        )
-        logging.info("Notification sent.")
-    except Exception as e:
-        logging.error(f"Error sending notification: {e}")
-
-# Function to get user input with timeout
-def input_with_timeout(prompt, timeout):
-    def get_input():
-        nonlocal user_input
-        user_input = input(prompt)
-
-    user_input = None
-    input_thread = threading.Thread(target=get_input)
-    input_thread.start()
-    input_thread.join(timeout)
-
-    if input_thread.is_alive():
-        logging.info("Input timeout reached, assuming default response 'no'.")
-        return 'no'
-    return user_input
+# Metrics
+REMINDERS_SCHEDULED = registry.counter("hydration_reminders_scheduled_total", "User reminders put on the schedule")
+REMINDERS_SKIPPED = registry.counter("hydration_reminders_skipped_total",
+                                     "Due reminders skipped because one was already sent within the drink interval "
+                                     "or the reminder window is closed")
+REMINDER_SECONDS = registry.histogram("hydration_reminder_seconds", "Time to queue one due reminder in the outbox",
+                                      labels=("runtime",))
+
+scheduler = ReminderScheduler()
+dispatcher = None
+outbox_worker = None
+
+# Next reminder time after the user's last drink, never in the past and inside their reminder window
+def next_reminder_time(user_id, last_drink_time, now=None):
+    now = now or datetime.now()
+    return user_settings.rules(user_id).next_reminder_time(last_drink_time, now)
+
+# Next reminder time of a user from their latest logs; users missing either log count as having drunk one interval ago
+def user_reminder_time(user_id, last_hydration_log_time, last_email_log_time, now):
+    last_drink_time = max(last_hydration_log_time, last_email_log_time) if last_hydration_log_time and last_email_log_time else now - user_settings.rules(user_id).interval
+    return next_reminder_time(user_id, last_drink_time, now)
+
+# Users to re-key after a settings reload: those whose settings changed, or when the defaults
+# changed everyone scheduled or with settings of their own
+def users_to_reschedule(user_ids, scheduled):
+    if user_ids is not None:
+        return user_ids
+    return (set(scheduled) | user_settings.user_ids()) - {WEEKLY_GOAL_JOB}
+
+# Reminder times of users from their cached log state, after their settings changed
+def rescheduled_reminder_times(user_ids, scheduled, now=None):
+    now = now or datetime.now()
+    due_times = []
+    for user_id in users_to_reschedule(user_ids, scheduled):
+        state = get_user_state(user_id)
+        due_times.append((user_id, user_reminder_time(user_id, state.last_hydration_log_time,
+                                                      state.last_email_log_time, now)))
+    return due_times
+
+# Next weekly goal check, late today or tomorrow. It runs every day and only evaluates on the
+# prize day, so a prize day changed in the settings applies without rescheduling.
+def next_weekly_goal_time(now=None):
+    now = now or datetime.now()
+    check_time = now.replace(hour=WEEKLY_GOAL_CHECK_HOUR, minute=WEEKLY_GOAL_CHECK_MINUTE, second=0, microsecond=0)
+    if check_time <= now:
+        check_time += timedelta(days=1)
+    return check_time
+
+# Queue a hydration reminder for a user and return when the next one is due. The outbox
+# worker delivers it; its key makes a second process scheduling the same slot a no-op.
+@timed(REMINDER_SECONDS, runtime="threads")
+def send_reminder(user_id, due_time):
+    now = datetime.now()
+    rules = user_settings.rules(user_id)
+
+    # Skip if the window is closed or a notification was already sent within the interval (cached, no DB read)
+    last_reminder_time = get_user_state(user_id).last_hydration_log_time
+    if not rules.is_due(now, last_reminder_time):
+        logger.info("No reminder due for user %s (last sent %s). Skipping this reminder.", user_id, last_reminder_time)
+        REMINDERS_SKIPPED.inc()
+        REMINDERS_SCHEDULED.inc()
+        return rules.next_reminder_time(last_reminder_time or now, now)
+
+    next_drink_time = now + rules.interval
+    logger.info("Time to send a hydration reminder to user %s (due %s). Next drink time: %s", user_id, due_time, next_drink_time)
+    message = (f"It's time to drink {rules.bottle_volume:g}L of water! "
+               f"Next drink time: {next_drink_time.strftime('%Y-%m-%d %H:%M:%S')}")
+    # Logged as pending once delivered, then prompt_for_response asks the user
+    enqueue_reminder(reminder_key(user_id, last_reminder_time, rules.drink_interval, now), user_id, now,
+                     NOTIFICATION_TITLE, message, next_drink_time)
+    REMINDERS_SCHEDULED.inc()
+    return rules.next_reminder_time(now, now)
+
+# Ask about reminders the outbox worker delivered and logged as pending. Responses arrive
+# through the confirmation inbox, so neither the scheduler nor the worker waits on the user.
+def prompt_for_response(reminders):
+    for reminder in reminders:
+        rules = user_settings.rules(reminder["user_id"])
+        print(f"Did you drink {rules.bottle_volume:g}L of water as prompted? Answer 'yes' or 'no' in the terminal.")
+
+# Evaluate every user's weekly goal on the prize day and schedule the next check
+def run_weekly_goal_check(key, due_time):
+    if user_settings.default_rules.is_prize_day(due_time):
+        check_weekly_goals(due_time)
+    return next_weekly_goal_time()
+
+# Re-key the reminders of users whose settings changed, scheduling users new to the settings table
+def reschedule_users(user_ids):
+    due_times = rescheduled_reminder_times(user_ids, scheduler.keys())
+    for user_id, due in due_times:
+        scheduler.schedule(user_id, due, send_reminder)
+    logger.info("Rescheduled reminders for %s user(s) after a settings change.", len(due_times))
+
+# Stop the reminder scheduler
+def stop():
+    scheduler.stop()
 
 # Main Hydration Reminder Loop
 def main(stop_event):
-    logging.debug("Starting main hydration reminder loop.")
+    global scheduler, dispatcher, outbox_worker
+    logger.debug("Starting hydration reminder scheduler.")
     initialize_database()
+    # Compile everyone's settings; changes to them are picked up once everyone is scheduled
+    reload_user_settings()
+    # Move logs past retention to the archive tables in small throttled batches
+    start_log_archiver(stop_event)
+    scheduler = ReminderScheduler(stop_event)
+    dispatcher = NotificationDispatcher()
+    logger.info("Notification channels: %s", ", ".join(channel.name for channel in dispatcher.channels) or "none")
+    # Deliver queued reminders, including any a previous run left unsent
+    outbox_worker = ReminderOutboxWorker(dispatcher, on_completed=prompt_for_response)
+    outbox_worker.start(stop_event)
 
-    # Get the last hydration log time and email log time
-    last_hydration_log_time = get_last_hydration_log_time()
-    last_email_log_time = get_last_email_log_time()
-
-    # Determine the last drink time based on the latest log
-    last_drink_time = max(last_hydration_log_time, last_email_log_time) if last_hydration_log_time and last_email_log_time else datetime.now() - timedelta(minutes=DRINK_INTERVAL)
-
-    while not stop_event.is_set():
-        now = datetime.now()
-        current_hour = now.hour
-
-        # Check if the current time is within the allowed range (9 AM to 12 AM)
-        if 9 <= current_hour < 24:
-            next_drink_time = last_drink_time + timedelta(minutes=DRINK_INTERVAL)
-            logging.info(f"Current time: {now}, Last drink time: {last_drink_time}, Next drink time: {next_drink_time}")
-            # Check if it's time to remind
-            time_since_last_drink = (now - last_drink_time).total_seconds()
-            logging.debug(f"Time since last drink: {time_since_last_drink} seconds")
-            if time_since_last_drink >= DRINK_INTERVAL * 60:
-                # Check if a notification has already been sent within the same period
-                if last_hydration_log_time and (now - last_hydration_log_time).total_seconds() < DRINK_INTERVAL * 60:
-                    logging.info("A notification has already been sent within the same period. Skipping this reminder.")
-                else:
-                    logging.info("Time to send a hydration reminder.")
-                    send_notification(next_drink_time)
-                    send_email("Hydration Reminder", f"It's time to drink 0.5L of water! Next drink time: {next_drink_time.strftime('%Y-%m-%d %H:%M:%S')}")
-                    #send_whatsapp_message(f"It's time to drink 0.5L of water! Next drink time: {next_drink_time.strftime('%Y-%m-%d %H:%M:%S')}")
-                    log_hydration_reminder(False, status='pending')  # Log as pending
-
-                    # Terminal prompt to ask if the user drank the water with timeout
-                    response = input_with_timeout("Did you drink 0.5L of water as prompted? (yes/no): ", INPUT_TIMEOUT).strip().lower()
-                    if response == 'yes':
-                        is_drunk = True
-                        # Update the pending log entry to completed
-                        log_hydration_reminder(is_drunk, status='completed', update_pending=True)
-                    else:
-                        logging.info("User did not confirm drinking water. Keeping status as pending.")
-
-                    last_drink_time = now
-
-            # Check weekly goal at the end of the week
-            if now.strftime('%A') == PRIZE_DAY:
-                check_weekly_goal()
-
-        # Wait before the next check
-        logging.debug(f"Waiting for {SLEEP_INTERVAL} seconds before next check.")
-        stop_event.wait(SLEEP_INTERVAL)
\ No newline at end of file
+    # Rebuild every user's state and next reminder from their latest logs in one query,
+    # plus users who only have settings so far
+    now = datetime.now()
+    reminder_times = seed_user_state_cache()
+    for user_id in user_settings.user_ids() - reminder_times.keys():
+        reminder_times[user_id] = (None, None)
+    for user_id, (last_hydration_log_time, last_email_log_time) in reminder_times.items():
+        scheduler.schedule(user_id, user_reminder_time(user_id, last_hydration_log_time, last_email_log_time, now),
+                           send_reminder)
+        REMINDERS_SCHEDULED.inc()
+    scheduler.schedule(WEEKLY_GOAL_JOB, next_weekly_goal_time(now), run_weekly_goal_check)
+    logger.info("Scheduled reminders for %s user(s).", len(scheduler) - 1)
+    start_settings_reload(stop_event, on_change=reschedule_users)
+
+    try:
+        scheduler.run()
+    finally:
+        outbox_worker.stop(timeout=30)
+        logger.info("Notification channel stats: %s", dispatcher.channel_stats())
+        dispatcher.shutdown(wait=False)
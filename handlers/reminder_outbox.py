@@ -0,0 +1,111 @@
+import logging
+import os
+import threading
+from datetime import datetime, timedelta
+from channels.base import Reminder
+from utils.db_utils import (
+    OUTBOX_BATCH_SIZE, claim_reminders, complete_reminders, release_reminders, outbox_ready,
+)
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Outbox Worker Configuration
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", 2))  # claiming threads per process
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", 1))  # seconds between claims when the outbox is empty
+
+# Metrics
+REMINDERS_SENT = registry.counter("hydration_reminders_sent_total", "Reminders dispatched to the notification channels")
+OUTBOX_RESULTS = registry.counter("hydration_outbox_results_total", "Claimed outbox reminders by outcome",
+                                  labels=("result",))
+
+
+# Idempotency key of a user's reminder: the slot one drink interval after their last logged reminder,
+# which every process reads from the same database, so processes running the same user's reminder
+# seconds apart produce the same key wherever the clock stands. Limits: a process that has not yet
+# seen the latest delivered reminder keys off an older one (it then matches the key already used for
+# that one and queues nothing), and a user's first reminder falls back to the drink interval grid of
+# the clock, where two processes on either side of a grid line can still both queue it.
+def reminder_key(user_id, last_reminder_time, interval_minutes, now):
+    if last_reminder_time is not None:
+        slot = last_reminder_time + timedelta(minutes=interval_minutes)
+    else:
+        minutes = int((now - datetime(1970, 1, 1)).total_seconds() // 60)
+        slot = datetime(1970, 1, 1) + timedelta(minutes=minutes - minutes % interval_minutes)
+    return f"reminder:{user_id}:{slot:%Y-%m-%dT%H:%M}"
+
+
+def outbox_reminder(row):
+    return Reminder(row["user_id"], row["subject"], row["message"], row["next_drink_time"])
+
+
+# A reminder counts as delivered once any channel has delivered it (queued channels report "sent" only
+# after their SMTP or HTTP call succeeded), or when no channel is enabled
+def delivered(results):
+    return not results or "sent" in results.values()
+
+
+# Claims reminders from the outbox and delivers them through the dispatcher.
+# Several threads, and several tracker processes sharing the database, can
+# claim at once: each claim leases its rows, and the rows of a worker that
+# crashed mid-delivery are claimed again when the lease runs out, so every
+# reminder is delivered at least once and, barring such a crash, exactly once.
+# on_completed is called with the reminders marked sent, once their pending
+# hydration logs exist.
+class ReminderOutboxWorker:
+    def __init__(self, dispatcher, workers=OUTBOX_WORKERS, batch_size=OUTBOX_BATCH_SIZE,
+                 poll_interval=OUTBOX_POLL_INTERVAL, on_completed=None):
+        self.dispatcher = dispatcher
+        self.on_completed = on_completed
+        self.workers = workers
+        self.batch_size = batch_size
+        self.poll_interval = poll_interval
+        self._threads = []
+        self._stop_event = None
+
+    def start(self, stop_event=None):
+        if self._threads:
+            return
+        self._stop_event = stop_event or threading.Event()
+        for i in range(self.workers):
+            thread = threading.Thread(target=self._run, name=f"reminder-outbox-{i}", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    # Stop claiming; reminders being delivered are finished first
+    def stop(self, timeout=None):
+        threads, self._threads = self._threads, []
+        if threads:
+            self._stop_event.set()
+            outbox_ready.set()
+            for thread in threads:
+                thread.join(timeout)
+
+    # Deliver claimed reminders concurrently, then mark them sent or put them back for a retry
+    def process(self, claimed):
+        sent, undelivered = [], []
+        for row, results in zip(claimed, self.dispatcher.dispatch_many([outbox_reminder(row) for row in claimed])):
+            (sent if delivered(results) else undelivered).append(row)
+        if sent:
+            completed = complete_reminders(sent)
+            if completed and self.on_completed:
+                self.on_completed(completed)
+            REMINDERS_SENT.inc(len(sent))
+            OUTBOX_RESULTS.labels("sent").inc(len(sent))
+        if undelivered:
+            failed = release_reminders(undelivered)
+            OUTBOX_RESULTS.labels("retried").inc(len(undelivered) - failed)
+            OUTBOX_RESULTS.labels("failed").inc(failed)
+            if failed:
+                logger.error("%s reminder(s) could not be delivered after every attempt.", failed)
+        return len(sent), len(undelivered)
+
+    def _run(self):
+        stop_event = self._stop_event
+        while not stop_event.is_set():
+            claimed = claim_reminders(self.batch_size)
+            if claimed:
+                self.process(claimed)
+                continue
+            outbox_ready.wait(self.poll_interval)
+            outbox_ready.clear()
@@ -0,0 +1,95 @@
+import heapq
+import itertools
+import logging
+import threading
+from datetime import datetime, timedelta
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Metrics
+SCHEDULE_LAG_SECONDS = registry.histogram("hydration_schedule_lag_seconds", "How late scheduled jobs start after they are due",
+                                          labels=("runtime",))
+
+
+# Min-heap of per-key deadlines that sleeps until the earliest one is due.
+# Rescheduling a key pushes a new heap entry and leaves the old one to be
+# skipped lazily, so every schedule/pop is O(log n) regardless of user count.
+class ReminderScheduler:
+    def __init__(self, stop_event=None, retry_delay=60):
+        self.stop_event = stop_event or threading.Event()
+        self.retry_delay = retry_delay  # seconds before a failed job is retried
+        self._heap = []  # (due, seq, key)
+        self._entries = {}  # key -> (due, seq, callback)
+        self._seq = itertools.count()
+        self._cond = threading.Condition()
+
+    def __len__(self):
+        with self._cond:
+            return len(self._entries)
+
+    # Schedule (or reschedule) a key; callback(key, due) returns the next due time or None
+    def schedule(self, key, due, callback):
+        with self._cond:
+            seq = next(self._seq)
+            self._entries[key] = (due, seq, callback)
+            heapq.heappush(self._heap, (due, seq, key))
+            if self._heap[0][1] == seq:
+                self._cond.notify()
+
+    def cancel(self, key):
+        with self._cond:
+            self._entries.pop(key, None)
+
+    def next_due(self, key):
+        with self._cond:
+            entry = self._entries.get(key)
+            return entry[0] if entry else None
+
+    def keys(self):
+        with self._cond:
+            return list(self._entries)
+
+    def stop(self):
+        self.stop_event.set()
+        with self._cond:
+            self._cond.notify_all()
+
+    # Pop the earliest live entry that is due, waiting until it is; None once stopped
+    def _next_ready(self):
+        with self._cond:
+            while not self.stop_event.is_set():
+                while self._heap:
+                    due, seq, key = self._heap[0]
+                    entry = self._entries.get(key)
+                    if entry is not None and entry[1] == seq:
+                        break
+                    heapq.heappop(self._heap)  # Stale entry left behind by a reschedule or cancel
+                else:
+                    self._cond.wait()
+                    continue
+
+                delay = (due - datetime.now()).total_seconds()
+                if delay > 0:
+                    self._cond.wait(delay)
+                    continue
+
+                heapq.heappop(self._heap)
+                return key, due, self._entries.pop(key)[2]
+        return None
+
+    # Run due callbacks until stopped
+    def run(self):
+        while True:
+            ready = self._next_ready()
+            if ready is None:
+                break
+            key, due, callback = ready
+            SCHEDULE_LAG_SECONDS.labels("threads").observe(max(0.0, (datetime.now() - due).total_seconds()))
+            try:
+                next_due = callback(key, due)
+            except Exception as e:
+                logger.error("Scheduled job %r failed, retrying in %ss: %s", key, self.retry_delay, e, exc_info=True)
+                next_due = datetime.now() + timedelta(seconds=self.retry_delay)
+            if next_due is not None:
+                self.schedule(key, next_due, callback)
@@ -4,11 +4,18 @@ import logging
 import sys
 import os
 import subprocess
-from concurrent_log_handler import ConcurrentRotatingFileHandler
-from handlers.notification_handler import main as notification_main
-from utils.db_utils import update_hydration_logs
+from handlers.notification_handler import main as notification_main, stop as notification_stop
+from utils.db_utils import (
+    update_hydration_logs, close_db_pool, start_log_buffer, stop_log_buffer, stop_log_archiver, stop_settings_reload,
+)
+from channels.dispatcher import stop_channel_workers
+from handlers.confirmation_inbox import confirmation_inbox, start_confirmation_server
+from utils.metrics import start_metrics_server
+from utils.log_config import configure_logging
 from dotenv import load_dotenv
 
+logger = logging.getLogger(__name__)
+
 # Load environment variables
 load_dotenv()
 
@@ -17,17 +24,17 @@ log_folder = "logs"
 if not os.path.exists(log_folder):
     os.makedirs(log_folder)
 
-# Configure logging with rotation based on file size
-log_file = os.getenv("LOG_FILE", "logs/hydration_tracker.log")
-log_handler = ConcurrentRotatingFileHandler(log_file, maxBytes=10*1024*1024, backupCount=7)  # 10 MB per log file
-log_handler.setFormatter(logging.Formatter('%(asctime)s %(levelname)s:%(message)s'))
-logging.getLogger().addHandler(log_handler)
-logging.getLogger().setLevel(logging.DEBUG)
+# Configure asynchronous JSON-lines logging with rotation based on file size
+configure_logging()
+
+# "threads" runs the scheduler and workers on OS threads; "async" runs them on one asyncio event loop
+RUNTIME_MODE = os.getenv("RUNTIME_MODE", "threads")
 
 # Handle graceful shutdown
 def signal_handler(sig, frame):
-    logging.info("Gracefully shutting down...")
+    logger.info("Gracefully shutting down...")
     stop_event.set()
+    notification_stop()
 
 if __name__ == "__main__":
     try:
@@ -35,12 +42,22 @@ if __name__ == "__main__":
         stop_event = threading.Event()
         signal.signal(signal.SIGINT, signal_handler)  # Handle Ctrl+C
 
-        # Start the notification thread
-        main_thread = threading.Thread(target=notification_main, args=(stop_event,))
-        main_thread.start()
+        # Serve counters and latency histograms on the local /metrics endpoint
+        metrics_server = start_metrics_server()
+
+        if RUNTIME_MODE == "async":
+            # The event loop flushes logs and applies inbox responses itself
+            confirmation_server = start_confirmation_server()
+        else:
+            # Flush buffered log writes in the background until shutdown
+            start_log_buffer(stop_event)
+
+            # Apply hydration responses from the terminal and the local HTTP endpoint in the background
+            confirmation_inbox.start(stop_event)
+            confirmation_server = start_confirmation_server()
 
         # Start the hydration logs update thread
-        update_hydration_thread = threading.Thread(target=update_hydration_logs, args=(stop_event,))
+        update_hydration_thread = threading.Thread(target=update_hydration_logs, args=(stop_event, confirmation_inbox), daemon=True)
         update_hydration_thread.start()
 
         # Open another terminal and run follow_latest_log.py
@@ -51,8 +68,28 @@ if __name__ == "__main__":
         elif sys.platform == "linux":
             subprocess.Popen(["gnome-terminal", "--", "python3", "follow_latest_log.py"])
 
-        main_thread.join()
-        update_hydration_thread.join()
+        if RUNTIME_MODE == "async":
+            # Runs until SIGINT/SIGTERM cancels it
+            from handlers.async_runtime import run as async_main
+            async_main()
+            stop_event.set()
+        else:
+            # Start the notification thread
+            main_thread = threading.Thread(target=notification_main, args=(stop_event,))
+            main_thread.start()
+            main_thread.join()
+        # The CLI thread may be blocked on input(); it is a daemon and exits with the process
+        update_hydration_thread.join(timeout=1)
+        if confirmation_server:
+            confirmation_server.shutdown()
+        confirmation_inbox.stop()
+        if metrics_server:
+            metrics_server.shutdown()
+        stop_channel_workers(timeout=30)
+        stop_log_archiver(timeout=30)
+        stop_settings_reload(timeout=5)
+        stop_log_buffer()
+        close_db_pool()
     except Exception as e:
-        logging.error(f"An unexpected error occurred: {e}", exc_info=True)
+        logger.error("An unexpected error occurred: %s", e, exc_info=True)
         sys.exit(1)
\ No newline at end of file
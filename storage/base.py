@@ -0,0 +1,276 @@
+import hashlib
+import importlib
+import re
+import threading
+from utils.user_settings import SETTING_NAMES
+
+
+class StorageError(Exception):
+    pass
+
+
+# The database could not be reached (pool exhausted, server down, file not writable)
+class StorageUnavailableError(StorageError):
+    pass
+
+
+# Persistence operations used by utils/db_utils. Every backend implements the
+# same methods with the same semantics; storage/contract.py checks them.
+# Times are naive datetimes; hydration rows are
+# (user_id, date_time, bottle_volume, is_drunk, status) and email rows are
+# (user_id, date_time, subject, message, success, error_message). Email bodies
+# are stored once in email_templates and referenced from the logs. Outbox rows
+# are (idempotency_key, user_id, reminder_time, subject, message,
+# next_drink_time, available_at).
+class Storage:
+    name = None
+
+    # Create or upgrade the schema and return its version
+    def initialize(self):
+        raise NotImplementedError
+
+    # {user_id: (last_hydration_log_time, last_email_log_time)} for every user with logs
+    def get_last_reminder_times(self):
+        raise NotImplementedError
+
+    # (last_hydration_log_time, last_email_log_time) of one user
+    def load_user_state(self, user_id):
+        raise NotImplementedError
+
+    # Insert hydration rows, keeping at most one per user per minute, and update the rollups; returns the
+    # number inserted, without the rows that fell in a minute already logged
+    def insert_hydration_logs(self, rows):
+        raise NotImplementedError
+
+    def insert_email_logs(self, rows):
+        raise NotImplementedError
+
+    # Answer the user's latest pending reminder; returns the number of logs updated (0 or 1)
+    def answer_latest_pending(self, user_id, is_drunk, status):
+        raise NotImplementedError
+
+    # Update logs by id; returns the number of logs updated
+    def set_hydration_log_statuses(self, log_ids, is_drunk, status, pending_only=False):
+        raise NotImplementedError
+
+    # Update pending logs in a time range (and optionally for one user); returns the number updated
+    def confirm_pending(self, is_drunk, status, start=None, end=None, before=None, user_id=None):
+        raise NotImplementedError
+
+    # Page of pending logs as dicts with id, user_id and date_time, ordered by (date_time, id)
+    def get_pending_hydration_logs(self, after=None, limit=20, user_id=None):
+        raise NotImplementedError
+
+    # (reminders, bottles_drunk) for one user's week
+    def get_weekly_totals(self, user_id, week_start):
+        raise NotImplementedError
+
+    # (start_date, end_date, reminders, bottles_drunk) for the day, week or month containing today
+    def get_period_totals(self, user_id, period, today):
+        raise NotImplementedError
+
+    # Upsert one user's weekly goal; returns whether the prize had already been awarded
+    def record_weekly_goal(self, user_id, start_date, end_date, total_bottles, goal_met, prize_awarded):
+        raise NotImplementedError
+
+    # Upsert every user's weekly goal for the week starting week_start from the weekly rollups; each
+    # user's goal is daily_goal / bottle_volume * 7 bottles, from their user_settings row or these defaults
+    def record_weekly_goals(self, week_start, daily_goal, bottle_volume, is_prize_day):
+        raise NotImplementedError
+
+    # Value that changes whenever a user_settings row is added, changed or removed
+    def get_settings_version(self):
+        raise NotImplementedError
+
+    # {user_id: {setting: value or None}} for every user_settings row
+    def load_user_settings(self):
+        raise NotImplementedError
+
+    # Upsert the given settings of one user; None clears a setting back to the default
+    def set_user_settings(self, user_id, settings):
+        raise NotImplementedError
+
+    # Move up to limit of the oldest hydration logs before a time to hydration_logs_archive in one short
+    # transaction; returns the number moved. The rollups keep counting archived logs.
+    def archive_hydration_logs(self, before, limit):
+        raise NotImplementedError
+
+    # Move up to limit of the oldest email logs before a time to email_logs_archive; returns the number moved
+    def archive_email_logs(self, before, limit):
+        raise NotImplementedError
+
+    # Queue outbox rows, skipping idempotency keys that are already queued; returns the number queued
+    def enqueue_reminders(self, rows):
+        raise NotImplementedError
+
+    # Lease up to limit outbox rows that are available at now to worker_id until now + lease_seconds, skipping
+    # rows other workers hold; returns dicts with id, idempotency_key, user_id, reminder_time, subject, message,
+    # next_drink_time and attempts. Rows whose lease ran out are claimable again until they have had
+    # max_attempts; then they are marked failed.
+    def claim_reminders(self, worker_id, now, lease_seconds, limit, max_attempts):
+        raise NotImplementedError
+
+    # Mark the outbox rows still leased to worker_id sent and insert their hydration rows (hydration_rows[i]
+    # belongs to outbox_ids[i]) in the same transaction; returns the ids marked sent
+    def complete_reminders(self, worker_id, outbox_ids, hydration_rows, sent_at):
+        raise NotImplementedError
+
+    # Return outbox rows still leased to worker_id to the queue at available_at, or mark them failed once
+    # they have had max_attempts; returns the number marked failed
+    def release_reminders(self, worker_id, outbox_ids, available_at, max_attempts):
+        raise NotImplementedError
+
+    # Delete up to limit sent or failed outbox rows for reminders before a time; returns the number deleted
+    def purge_reminder_outbox(self, before, limit):
+        raise NotImplementedError
+
+    # Yield lists of up to chunk_size (id, user_id, date_time, is_drunk, status) hydration log rows, archived
+    # ones included, with start <= date_time < end (no lower bound when start is None). Rows are streamed
+    # from one read snapshot, so a row archived during the export is read once.
+    def export_hydration_logs(self, start, end, chunk_size):
+        raise NotImplementedError
+
+    def stats(self):
+        return {}
+
+    def close(self):
+        pass
+
+
+# Modules implementing each backend; imported only when selected
+BACKENDS = {
+    "mysql": ("storage.mysql_storage", "MySQLStorage"),
+    "sqlite": ("storage.sqlite_storage", "SQLiteStorage"),
+}
+
+
+# Create the named storage backend
+def create_storage(backend, **options):
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown storage backend: {backend}")
+    module_name, class_name = BACKENDS[backend]
+    return getattr(importlib.import_module(module_name), class_name)(**options)
+
+
+# Keep the first of several hydration rows for the same (user, minute)
+def dedupe_by_minute(rows):
+    by_minute = {}
+    for row in rows:
+        by_minute.setdefault((row[0], row[1].replace(second=0, microsecond=0)), row)
+    return by_minute
+
+
+# Timestamps are what varies between otherwise identical reminder emails, so
+# they are cut out of the stored template and kept with each log as
+# message_args, separated by TEMPLATE_MARKER.
+TEMPLATE_FIELD = re.compile(r"\d{4}-\d{2}-\d{2}[ T]\d{2}:\d{2}(?::\d{2}(?:\.\d+)?)?")
+TEMPLATE_MARKER = "\x1f"
+MESSAGE_ARGS_LIMIT = 255  # message_args column size
+
+
+# (template body, message_args or None) for an email message
+def split_email_message(message):
+    if TEMPLATE_MARKER in message:
+        return message, None
+    args = TEMPLATE_MARKER.join(TEMPLATE_FIELD.findall(message))
+    if not args or len(args) > MESSAGE_ARGS_LIMIT:
+        return message, None
+    return TEMPLATE_FIELD.sub(TEMPLATE_MARKER, message), args
+
+
+# The message split_email_message() was given
+def join_email_message(body, message_args):
+    if message_args is None:
+        return body
+    parts = body.split(TEMPLATE_MARKER)
+    args = message_args.split(TEMPLATE_MARKER) + [""]
+    return "".join(part + arg for part, arg in zip(parts, args))
+
+
+# Add the email_templates row for a message to templates; returns (template_hash, message_args)
+def email_template(subject, message, templates):
+    body, message_args = split_email_message(message)
+    template_hash = hashlib.sha256(f"{subject}\0{body}".encode()).hexdigest()
+    templates.setdefault(template_hash, (template_hash, subject, body))
+    return template_hash, message_args
+
+
+# Email rows as ({template_hash: (template_hash, subject, body)}, rows of
+# (user_id, date_time, subject, template_hash, message_args, success, error_message))
+def templated_email_rows(rows):
+    templates = {}
+    templated = []
+    for user_id, date_time, subject, message, success, error_message in rows:
+        template_hash, message_args = email_template(subject, message, templates)
+        templated.append((user_id, date_time, subject, template_hash, message_args, success, error_message))
+    return templates, templated
+
+
+# Selected email_logs rows (id, user_id, date_time, subject, message, template_id, message_args, success,
+# error_message) as (templates, email_logs_archive rows). Rows logged before email_templates existed carry
+# their template hash in place of template_id until the backend resolves it.
+def email_archive_rows(rows):
+    templates = {}
+    archive_rows = []
+    for log_id, user_id, date_time, subject, message, template_id, message_args, success, error_message in rows:
+        if template_id is None:
+            template_id, message_args = email_template(subject, message, templates)
+        archive_rows.append([log_id, user_id, date_time, template_id, message_args, success, error_message])
+    return templates, archive_rows
+
+
+# {template_hash: id} of committed email_templates rows, so repeated bodies skip the lookup
+class EmailTemplateCache:
+    def __init__(self, max_size=1024):
+        self.max_size = max_size
+        self._ids = {}
+        self._lock = threading.Lock()
+
+    def lookup(self, template_hashes):
+        with self._lock:
+            return {key: self._ids[key] for key in template_hashes if key in self._ids}
+
+    # Only add ids once the transaction that created them has committed
+    def update(self, ids):
+        with self._lock:
+            if len(self._ids) + len(ids) > self.max_size:
+                self._ids.clear()
+            self._ids.update(ids)
+
+
+# WHERE clause and params selecting pending hydration logs; after=(date_time, id) seeks past a page
+def pending_where(placeholder="%s", user_id=None, start=None, end=None, before=None, after=None):
+    where = ["status = 'pending'"]
+    params = []
+    if user_id is not None:
+        where.append(f"user_id = {placeholder}")
+        params.append(user_id)
+    if start is not None:
+        where.append(f"date_time >= {placeholder}")
+        params.append(start)
+    if end is not None:
+        where.append(f"date_time <= {placeholder}")
+        params.append(end)
+    if before is not None:
+        where.append(f"date_time < {placeholder}")
+        params.append(before)
+    if after is not None:
+        # Keyset pagination: seek past the previous page instead of using OFFSET
+        where.append(f"(date_time > {placeholder} OR (date_time = {placeholder} AND id > {placeholder}))")
+        params.extend([after[0], after[0], after[1]])
+    return " AND ".join(where), tuple(params)
+
+
+# Columns of a user_settings upsert; raises ValueError for names that are not settings
+def settings_columns(settings):
+    unknown = set(settings) - set(SETTING_NAMES)
+    if unknown:
+        raise ValueError(f"Unknown settings: {', '.join(sorted(unknown))}")
+    return [name for name in SETTING_NAMES if name in settings]
+
+
+# WHERE clause and parameters for the hydration logs in an export window
+def export_where(placeholder, start, end):
+    if start is None:
+        return f"date_time < {placeholder}", (end,)
+    return f"date_time >= {placeholder} AND date_time < {placeholder}", (start, end)
@@ -0,0 +1,305 @@
+# Behaviour every storage backend must share. Each check gets a freshly
+# initialized, empty storage and raises AssertionError on a mismatch.
+#
+#   python -m storage.contract --backend sqlite
+#   python -m storage.contract --backend mysql --database hydration_contract
+#
+# The MySQL scratch database is dropped and recreated.
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import date, datetime, timedelta
+
+MONDAY = datetime(2024, 1, 1, 9, 0)  # A Monday, so the whole week is in one rollup
+
+
+def hydration_row(user_id, date_time, is_drunk=False, status="pending"):
+    return (user_id, date_time, 0.5, is_drunk, status)
+
+
+def check_initialize_is_idempotent(storage):
+    version = storage.initialize()
+    assert storage.initialize() == version, "re-initializing changed the schema version"
+
+
+def check_last_reminder_times(storage):
+    assert storage.get_last_reminder_times() == {}
+    storage.insert_hydration_logs([hydration_row(1, MONDAY), hydration_row(1, MONDAY + timedelta(hours=1))])
+    storage.insert_email_logs([(2, MONDAY, "Subject", "Message", True, None)])
+    assert storage.get_last_reminder_times() == {
+        1: (MONDAY + timedelta(hours=1), None),
+        2: (None, MONDAY),
+    }
+    assert storage.load_user_state(1) == (MONDAY + timedelta(hours=1), None)
+    assert storage.load_user_state(2) == (None, MONDAY)
+    assert storage.load_user_state(3) == (None, None)
+
+
+def check_one_log_per_minute(storage):
+    rows = [hydration_row(1, MONDAY), hydration_row(1, MONDAY + timedelta(seconds=30)), hydration_row(2, MONDAY)]
+    assert storage.insert_hydration_logs(rows) == 2
+    # A minute that is already stored is skipped, and the rollups still count it once
+    assert storage.insert_hydration_logs([hydration_row(1, MONDAY + timedelta(seconds=45), is_drunk=True),
+                                          hydration_row(1, MONDAY + timedelta(minutes=1))]) == 1
+    assert len(storage.get_pending_hydration_logs(user_id=1)) == 2
+    assert storage.get_weekly_totals(1, MONDAY.date()) == (2, 0)
+
+
+def check_answer_latest_pending(storage):
+    storage.insert_hydration_logs([hydration_row(1, MONDAY), hydration_row(1, MONDAY + timedelta(hours=1))])
+    assert storage.answer_latest_pending(1, True, "completed") == 1
+    pending = storage.get_pending_hydration_logs(user_id=1)
+    assert [log["date_time"] for log in pending] == [MONDAY]
+    assert storage.get_weekly_totals(1, MONDAY.date()) == (2, 1)
+    assert storage.answer_latest_pending(2, True, "completed") == 0
+
+
+def check_pending_pages(storage):
+    storage.insert_hydration_logs([hydration_row(user_id, MONDAY + timedelta(minutes=minute))
+                                   for minute in range(5) for user_id in (1, 2)])
+    first = storage.get_pending_hydration_logs(limit=4)
+    assert [(log["date_time"], log["user_id"]) for log in first] == [
+        (MONDAY, 1), (MONDAY, 2), (MONDAY + timedelta(minutes=1), 1), (MONDAY + timedelta(minutes=1), 2)]
+    after = (first[-1]["date_time"], first[-1]["id"])
+    rest = storage.get_pending_hydration_logs(after=after, limit=10)
+    assert len(rest) == 6 and not {log["id"] for log in first} & {log["id"] for log in rest}
+    assert len(storage.get_pending_hydration_logs(user_id=2, limit=10)) == 5
+
+
+def check_bulk_statuses(storage):
+    storage.insert_hydration_logs([hydration_row(1, MONDAY + timedelta(minutes=minute)) for minute in range(6)])
+    ids = [log["id"] for log in storage.get_pending_hydration_logs(limit=10)]
+    assert storage.set_hydration_log_statuses(ids[:2], True, "completed") == 2
+    # pending_only leaves answered logs alone
+    assert storage.set_hydration_log_statuses(ids[:3], False, "skipped", pending_only=True) == 1
+    assert storage.set_hydration_log_statuses([], True, "completed") == 0
+    assert storage.get_weekly_totals(1, MONDAY.date()) == (6, 2)
+    # Changing an answer moves the drunk count back
+    assert storage.set_hydration_log_statuses(ids[:1], False, "skipped") == 1
+    assert storage.get_weekly_totals(1, MONDAY.date()) == (6, 1)
+
+
+def check_confirm_pending(storage):
+    storage.insert_hydration_logs([hydration_row(user_id, MONDAY + timedelta(days=day))
+                                   for day in range(4) for user_id in (1, 2)])
+    assert storage.confirm_pending(True, "completed", start=MONDAY, end=MONDAY + timedelta(days=1), user_id=1) == 2
+    assert storage.confirm_pending(True, "completed", before=MONDAY + timedelta(days=3)) == 4
+    assert storage.confirm_pending(True, "completed", before=MONDAY + timedelta(days=3)) == 0
+    assert storage.get_weekly_totals(1, MONDAY.date()) == (4, 3)
+    assert storage.get_weekly_totals(2, MONDAY.date()) == (4, 3)
+
+
+def check_period_totals(storage):
+    storage.insert_hydration_logs([hydration_row(1, MONDAY + timedelta(days=day), is_drunk=True, status="completed")
+                                   for day in range(3)])
+    storage.insert_hydration_logs([hydration_row(1, datetime(2024, 1, 31, 9, 0))])
+    assert storage.get_period_totals(1, "daily", MONDAY.date()) == (MONDAY.date(), MONDAY.date(), 1, 1)
+    assert storage.get_period_totals(1, "weekly", MONDAY + timedelta(days=2)) == (
+        MONDAY.date(), date(2024, 1, 7), 3, 3)
+    assert storage.get_period_totals(1, "monthly", MONDAY.date()) == (date(2024, 1, 1), date(2024, 1, 31), 4, 3)
+    assert storage.get_period_totals(2, "daily", MONDAY.date())[2:] == (0, 0)
+
+
+def check_weekly_goals(storage):
+    end = MONDAY.date() + timedelta(days=6)
+    assert storage.record_weekly_goal(1, MONDAY.date(), end, 28, True, True) is False
+    assert storage.record_weekly_goal(1, MONDAY.date(), end, 28, True, False) is True
+    storage.insert_hydration_logs([hydration_row(2, MONDAY + timedelta(minutes=minute), True, "completed")
+                                   for minute in range(3)])
+    # Three bottles meet a goal of 0.25 L a day of 1 L bottles, 1.75 bottles a week
+    storage.record_weekly_goals(MONDAY.date(), 0.25, 1, True)
+    storage.record_weekly_goals(MONDAY.date(), 0.25, 1, False)
+    assert storage.record_weekly_goal(2, MONDAY.date(), end, 3, True, False) is True
+
+
+def check_user_settings(storage):
+    empty = storage.get_settings_version()
+    assert storage.load_user_settings() == {}
+    storage.set_user_settings(0, {"daily_goal": 3, "prize_day": "Saturday"})
+    storage.set_user_settings(2, {"drink_interval": 60})
+    changed = storage.get_settings_version()
+    assert changed != empty
+    time.sleep(0.01)  # past the resolution of updated_at
+    storage.set_user_settings(2, {"drink_interval": None, "bottle_volume": 1})
+    assert storage.get_settings_version() != changed
+    settings = storage.load_user_settings()
+    assert settings[0]["daily_goal"] == 3 and settings[0]["prize_day"] == "Saturday"
+    assert settings[2]["drink_interval"] is None and settings[2]["bottle_volume"] == 1
+    # User 2 needs 3 / 1 * 7 = 21 bottles and user 3 the default 3 / 0.5 * 7 = 42
+    storage.insert_hydration_logs([hydration_row(user_id, MONDAY + timedelta(minutes=minute), True, "completed")
+                                   for user_id in (2, 3) for minute in range(21)])
+    storage.record_weekly_goals(MONDAY.date(), 3, 0.5, True)
+    end = MONDAY.date() + timedelta(days=6)
+    assert storage.record_weekly_goal(2, MONDAY.date(), end, 21, True, False) is True
+    assert storage.record_weekly_goal(3, MONDAY.date(), end, 21, False, False) is False
+
+
+def check_archive_old_logs(storage):
+    days = [MONDAY - timedelta(days=day) for day in range(5)]
+    storage.insert_hydration_logs([hydration_row(1, day) for day in days])
+    storage.insert_email_logs([(1, day, "Hydration Reminder", f"Next drink time: {day:%Y-%m-%d %H:%M:%S}", True, None)
+                               for day in days])
+    before = MONDAY - timedelta(days=2)  # the logs of days 3 and 4
+    for archive in (storage.archive_hydration_logs, storage.archive_email_logs):
+        assert archive(before, 1) == 1
+        assert archive(before, 10) == 1
+        assert archive(before, 10) == 0
+    assert len(storage.get_pending_hydration_logs(user_id=1)) == 3
+    assert storage.load_user_state(1) == (MONDAY, MONDAY)
+    # Statistics come from the rollups, which still count archived logs
+    assert storage.get_weekly_totals(1, MONDAY.date() - timedelta(days=7)) == (4, 0)
+
+
+def check_export_hydration_logs(storage):
+    days = [MONDAY - timedelta(days=day) for day in range(5)]
+    storage.insert_hydration_logs([hydration_row(user_id, day, is_drunk=user_id == 1, status="completed")
+                                   for day in days for user_id in (1, 2)])
+    assert storage.archive_hydration_logs(MONDAY - timedelta(days=2), 10) == 4
+    chunks = list(storage.export_hydration_logs(None, MONDAY, 3))
+    assert [len(chunk) for chunk in chunks] == [3, 1, 3, 1]  # the hot table, then the archive
+    rows = [row for chunk in chunks for row in chunk]
+    assert len({row[0] for row in rows}) == 8
+    assert sorted(row[2] for row in rows if row[1] == 1) == days[:0:-1]
+    assert {(row[1], row[3], row[4]) for row in rows} == {(1, True, "completed"), (2, False, "completed")}
+    # Incremental windows pick up where the last one ended
+    assert sum(len(chunk) for chunk in storage.export_hydration_logs(MONDAY, MONDAY + timedelta(days=1), 3)) == 2
+
+
+def outbox_row(user_id, reminder_time, available_at=None):
+    return (f"reminder:{user_id}:{reminder_time:%Y-%m-%dT%H:%M}", user_id, reminder_time, "Hydration Reminder",
+            "Drink water", reminder_time + timedelta(minutes=100), available_at or reminder_time)
+
+
+def check_outbox_idempotency(storage):
+    assert storage.enqueue_reminders([outbox_row(1, MONDAY), outbox_row(2, MONDAY)]) == 2
+    # Another process queuing the same user and slot adds nothing
+    assert storage.enqueue_reminders([outbox_row(1, MONDAY), outbox_row(1, MONDAY + timedelta(hours=2))]) == 1
+
+
+def check_outbox_claims(storage):
+    storage.enqueue_reminders([outbox_row(user_id, MONDAY) for user_id in (1, 2, 3)]
+                              + [outbox_row(4, MONDAY, available_at=MONDAY + timedelta(hours=1))])
+    first = storage.claim_reminders("worker-a", MONDAY, 60, limit=2, max_attempts=5)
+    assert [row["user_id"] for row in first] == [1, 2] and first[0]["attempts"] == 0
+    assert first[0]["next_drink_time"] == MONDAY + timedelta(minutes=100)
+    # Leased rows are skipped by other workers, and rows not yet available are left alone
+    assert [row["user_id"] for row in storage.claim_reminders("worker-b", MONDAY + timedelta(seconds=10), 60,
+                                                             limit=10, max_attempts=5)] == [3]
+    assert storage.claim_reminders("worker-b", MONDAY + timedelta(seconds=30), 60, limit=10, max_attempts=5) == []
+    # An expired lease is claimable again, as after a crash
+    reclaimed = storage.claim_reminders("worker-b", MONDAY + timedelta(seconds=61), 60, limit=10, max_attempts=5)
+    assert [row["user_id"] for row in reclaimed] == [1, 2] and reclaimed[0]["attempts"] == 1
+
+
+def check_outbox_completion(storage):
+    storage.enqueue_reminders([outbox_row(user_id, MONDAY) for user_id in (1, 2)])
+    claimed = storage.claim_reminders("worker-a", MONDAY, 60, limit=10, max_attempts=2)
+    sent, failed = claimed
+    assert storage.complete_reminders("worker-a", [sent["id"]], [hydration_row(1, MONDAY)], MONDAY) == [sent["id"]]
+    assert storage.load_user_state(1) == (MONDAY, None)
+    assert storage.get_weekly_totals(1, MONDAY.date()) == (1, 0)
+    # Released rows come back at available_at until they run out of attempts
+    retry_at = MONDAY + timedelta(minutes=1)
+    assert storage.release_reminders("worker-a", [failed["id"]], retry_at, max_attempts=2) == 0
+    assert storage.claim_reminders("worker-a", MONDAY, 60, limit=10, max_attempts=2) == []
+    again = storage.claim_reminders("worker-a", retry_at, 60, limit=10, max_attempts=2)
+    assert [row["id"] for row in again] == [failed["id"]]
+    assert storage.release_reminders("worker-a", [failed["id"]], retry_at, max_attempts=2) == 1
+    assert storage.claim_reminders("worker-a", retry_at + timedelta(hours=1), 60, limit=10, max_attempts=2) == []
+    assert storage.purge_reminder_outbox(MONDAY + timedelta(seconds=1), limit=1) == 1
+    assert storage.purge_reminder_outbox(MONDAY + timedelta(seconds=1), limit=10) == 1
+    assert storage.purge_reminder_outbox(MONDAY + timedelta(seconds=1), limit=10) == 0
+
+
+def check_outbox_leases(storage):
+    storage.enqueue_reminders([outbox_row(1, MONDAY)])
+    [first] = storage.claim_reminders("worker-a", MONDAY, 60, limit=10, max_attempts=2)
+    # worker-a stalls past its lease; worker-b claims the row, and only worker-b can complete or release it
+    [second] = storage.claim_reminders("worker-b", MONDAY + timedelta(seconds=61), 60, limit=10, max_attempts=2)
+    assert second["id"] == first["id"] and second["attempts"] == 1
+    assert storage.complete_reminders("worker-a", [first["id"]], [hydration_row(1, MONDAY)], MONDAY) == []
+    assert storage.release_reminders("worker-a", [first["id"]], MONDAY, max_attempts=2) == 0
+    assert storage.claim_reminders("worker-c", MONDAY + timedelta(seconds=62), 60, limit=10, max_attempts=2) == []
+    assert storage.get_weekly_totals(1, MONDAY.date()) == (0, 0)
+    # A lease that runs out after the last attempt, as when every worker crashes on the row, is not claimed again
+    assert storage.claim_reminders("worker-c", MONDAY + timedelta(seconds=122), 60, limit=10, max_attempts=2) == []
+    assert storage.complete_reminders("worker-b", [first["id"]], [hydration_row(1, MONDAY)], MONDAY) == []
+    assert storage.purge_reminder_outbox(MONDAY + timedelta(seconds=1), limit=10) == 1
+
+
+CHECKS = [
+    check_initialize_is_idempotent,
+    check_last_reminder_times,
+    check_one_log_per_minute,
+    check_answer_latest_pending,
+    check_pending_pages,
+    check_bulk_statuses,
+    check_confirm_pending,
+    check_period_totals,
+    check_weekly_goals,
+    check_user_settings,
+    check_archive_old_logs,
+    check_export_hydration_logs,
+    check_outbox_idempotency,
+    check_outbox_claims,
+    check_outbox_completion,
+    check_outbox_leases,
+]
+
+
+# Run every check against storages from make_storage(); returns {check name: error or None}
+def run_contract(make_storage, checks=CHECKS):
+    results = {}
+    for check in checks:
+        storage = make_storage()
+        try:
+            storage.initialize()
+            check(storage)
+            results[check.__name__] = None
+        except AssertionError as e:
+            results[check.__name__] = str(e) or "assertion failed"
+        except Exception as e:
+            results[check.__name__] = f"{type(e).__name__}: {e}"
+        finally:
+            storage.close()
+    return results
+
+
+def sqlite_factory(directory):
+    from storage.sqlite_storage import SQLiteStorage
+
+    counter = iter(range(1_000_000))
+    return lambda: SQLiteStorage(os.path.join(directory, f"contract-{next(counter)}.db"))
+
+
+def mysql_factory(database):
+    import mysql.connector
+    from storage.mysql_storage import MySQLStorage
+    from utils.db_utils import DB_CONFIG
+
+    config = dict(DB_CONFIG, database=database)
+
+    def make_storage():
+        server_config = {key: value for key, value in config.items() if key != "database"}
+        with mysql.connector.connect(**server_config) as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"DROP DATABASE IF EXISTS `{database}`")
+            cursor.execute(f"CREATE DATABASE `{database}`")
+        return MySQLStorage(config, pool_size=2)
+    return make_storage
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Storage backend contract checks")
+    parser.add_argument("--backend", choices=["sqlite", "mysql"], default="sqlite")
+    parser.add_argument("--database", default="hydration_contract", help="scratch MySQL database")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        factory = sqlite_factory(directory) if args.backend == "sqlite" else mysql_factory(args.database)
+        results = run_contract(factory)
+    for name, error in results.items():
+        print(f"{'ok  ' if error is None else 'FAIL'} {name}{'' if error is None else ': ' + error}")
+    sys.exit(1 if any(results.values()) else 0)
@@ -0,0 +1,563 @@
+import logging
+from contextlib import contextmanager
+from datetime import timedelta
+import mysql.connector
+from storage.base import (
+    Storage, StorageError, StorageUnavailableError, EmailTemplateCache, dedupe_by_minute, email_archive_rows,
+    export_where, pending_where, settings_columns, templated_email_rows,
+)
+from utils import rollups
+from utils.db_pool import ConnectionPool, PoolTimeoutError
+from utils.migrations import apply_migrations
+from utils.user_settings import SETTING_NAMES
+
+logger = logging.getLogger(__name__)
+
+# Larger id sets are joined through a temporary table instead of an IN list
+BULK_ID_LIST_LIMIT = 1000
+
+# Statements shared with the asyncio runtime (utils/async_db.py) through the plans below
+LAST_REMINDER_TIMES_SQL = """
+    SELECT user_id, MAX(last_hydration_log_time), MAX(last_email_log_time)
+    FROM (
+        SELECT user_id, MAX(date_time) AS last_hydration_log_time, NULL AS last_email_log_time
+        FROM hydration_logs GROUP BY user_id
+        UNION ALL
+        SELECT user_id, NULL, MAX(date_time)
+        FROM email_logs GROUP BY user_id
+    ) AS last_logs
+    GROUP BY user_id
+    """
+
+LOAD_USER_STATE_SQL = """
+    SELECT
+        (SELECT MAX(date_time) FROM hydration_logs WHERE user_id = %s),
+        (SELECT MAX(date_time) FROM email_logs WHERE user_id = %s)
+    """
+
+# uq_hydration_user_minute skips repeats of an already-logged minute; unlike
+# ON DUPLICATE KEY, rowcount then counts only the rows actually inserted
+INSERT_HYDRATION_LOGS_SQL = """
+    INSERT IGNORE INTO hydration_logs (user_id, date_time, bottle_volume, is_drunk, status)
+    VALUES (%s, %s, %s, %s, %s)
+    """
+
+INSERT_EMAIL_LOGS_SQL = """
+    INSERT INTO email_logs (user_id, date_time, subject, template_id, message_args, success, error_message)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
+
+INSERT_EMAIL_TEMPLATES_SQL = """
+    INSERT IGNORE INTO email_templates (template_hash, subject, body)
+    VALUES (%s, %s, %s)
+    """
+
+# Filled in with one placeholder per template hash
+EMAIL_TEMPLATE_IDS_SQL = """
+    SELECT template_hash, id FROM email_templates
+    WHERE template_hash IN ({placeholders})
+    """
+
+LATEST_PENDING_SQL = """
+    SELECT id FROM hydration_logs
+    WHERE user_id = %s AND status = 'pending'
+    ORDER BY date_time DESC
+    LIMIT 1
+    FOR UPDATE
+    """
+
+# Filled in with a WHERE clause over hydration_logs
+UPDATE_GROUPS_SQL = """
+    SELECT user_id, DATE(date_time), COUNT(*), COALESCE(SUM(is_drunk), 0)
+    FROM hydration_logs
+    WHERE {where}
+    GROUP BY user_id, DATE(date_time)
+    FOR UPDATE
+    """
+
+UPDATE_STATUS_SQL = """
+    UPDATE hydration_logs
+    SET is_drunk = %s, status = %s
+    WHERE {where}
+    """
+
+# uq_outbox_idempotency_key skips a slot another process has already queued
+INSERT_OUTBOX_SQL = """
+    INSERT IGNORE INTO reminder_outbox
+        (idempotency_key, user_id, reminder_time, subject, message, next_drink_time, available_at)
+    VALUES (%s, %s, %s, %s, %s, %s, %s)
+    """
+
+# Rows whose lease ran out after their last attempt, e.g. when a worker keeps crashing mid-delivery
+EXPIRE_OUTBOX_SQL = """
+    UPDATE reminder_outbox
+    SET status = 'failed', claimed_by = NULL
+    WHERE status = 'sending' AND available_at <= %s AND attempts >= %s
+    """
+
+# SKIP LOCKED (MySQL 8.0+) lets several workers claim from the queue at once without waiting on each other
+CLAIM_OUTBOX_SQL = """
+    SELECT id, idempotency_key, user_id, reminder_time, subject, message, next_drink_time, attempts
+    FROM reminder_outbox
+    WHERE status IN ('pending', 'sending') AND available_at <= %s AND attempts < %s
+    ORDER BY available_at, id
+    LIMIT %s
+    FOR UPDATE SKIP LOCKED
+    """
+
+OUTBOX_COLUMNS = ("id", "idempotency_key", "user_id", "reminder_time", "subject", "message", "next_drink_time",
+                  "attempts")
+
+# Filled in with one placeholder per outbox id, after the listed parameters
+LEASE_OUTBOX_SQL = """
+    UPDATE reminder_outbox
+    SET status = 'sending', claimed_by = %s, available_at = %s, attempts = attempts + 1
+    WHERE id IN ({placeholders})
+    """
+
+# The rows still leased to a worker; one whose lease ran out may have been claimed by another since
+OWNED_OUTBOX_SQL = """
+    SELECT id FROM reminder_outbox
+    WHERE status = 'sending' AND claimed_by = %s AND id IN ({placeholders})
+    FOR UPDATE
+    """
+
+COMPLETE_OUTBOX_SQL = """
+    UPDATE reminder_outbox
+    SET status = 'sent', sent_at = %s
+    WHERE id IN ({placeholders})
+    """
+
+RELEASE_OUTBOX_SQL = """
+    UPDATE reminder_outbox
+    SET status = IF(attempts >= %s, 'failed', 'pending'), available_at = %s, claimed_by = NULL
+    WHERE status = 'sending' AND claimed_by = %s AND id IN ({placeholders})
+    """
+
+FAILED_OUTBOX_SQL = """
+    SELECT COUNT(*) FROM reminder_outbox
+    WHERE status = 'failed' AND id IN ({placeholders})
+    """
+
+# Params: (is_prize_day, default daily_goal, default bottle_volume, week_start)
+RECORD_WEEKLY_GOALS_SQL = """
+    INSERT INTO weekly_goals (user_id, start_date, end_date, total_bottles, goal_met, prize_awarded)
+    SELECT user_id, week_start, week_start + INTERVAL 6 DAY, bottles_drunk,
+           bottles_drunk >= bottle_goal, bottles_drunk >= bottle_goal AND %s
+    FROM (
+        SELECT r.user_id, r.week_start, r.bottles_drunk,
+               COALESCE(s.daily_goal, %s) / COALESCE(s.bottle_volume, %s) * 7 AS bottle_goal
+        FROM hydration_weekly_rollups r
+        LEFT JOIN user_settings s ON s.user_id = r.user_id
+        WHERE r.week_start = %s
+    ) goals
+    ON DUPLICATE KEY UPDATE
+        total_bottles = VALUES(total_bottles),
+        goal_met = VALUES(goal_met),
+        prize_awarded = prize_awarded OR VALUES(prize_awarded)
+    """
+
+
+# Statement plans, shared with the asyncio runtime so both run the same statements and map rows
+# the same way. A plan is a generator that yields (method, sql, params) steps and is sent each
+# step's result: the rowcount for "execute" and "executemany", the rows for "fetchall" and the
+# row for "fetchone". run_plan drives one on a mysql.connector cursor, utils/async_db.py on an
+# aiomysql one. A failing step is thrown into the plan, so its finally clauses still run.
+def run_plan(cursor, plan):
+    try:
+        step = next(plan)
+        while True:
+            try:
+                result = run_step(cursor, *step)
+            except Exception as err:
+                step = plan.throw(err)
+            else:
+                step = plan.send(result)
+    except StopIteration as stop:
+        return stop.value
+
+
+def run_step(cursor, method, sql, params):
+    if method == "executemany":
+        cursor.executemany(sql, params)
+        return cursor.rowcount
+    cursor.execute(sql, params)
+    if method == "fetchall":
+        return cursor.fetchall()
+    if method == "fetchone":
+        return cursor.fetchone()
+    return cursor.rowcount
+
+
+def last_reminder_times_plan():
+    rows = yield "fetchall", LAST_REMINDER_TIMES_SQL, ()
+    return {user_id: (last_hydration_log_time, last_email_log_time)
+            for user_id, last_hydration_log_time, last_email_log_time in rows}
+
+
+def load_user_state_plan(user_id):
+    row = yield "fetchone", LOAD_USER_STATE_SQL, (user_id, user_id)
+    return tuple(row)
+
+
+def rollup_deltas_plan(deltas):
+    if deltas:
+        daily, weekly = rollups.delta_params(deltas)
+        yield "executemany", rollups.DAILY_DELTA_SQL, daily
+        yield "executemany", rollups.WEEKLY_DELTA_SQL, weekly
+
+
+# Insert hydration rows, at most one per user per minute, and update the rollups in the same transaction
+def insert_hydration_logs_plan(rows):
+    # Drop rows that fall in a minute already seen in this batch
+    by_minute = dedupe_by_minute(rows)
+    if not by_minute:
+        return 0
+    inserted = yield "executemany", INSERT_HYDRATION_LOGS_SQL, list(by_minute.values())
+    if inserted == len(by_minute):
+        yield from rollup_deltas_plan(rollups.reminder_deltas([(user_id, date_time, is_drunk)
+                                                               for user_id, date_time, _, is_drunk, _
+                                                               in by_minute.values()]))
+    else:
+        # Some minutes were already logged; recount just the affected days
+        for sql, params in rollups.rebuild_statements({(user_id, date_time.date()) for user_id, date_time in by_minute}):
+            yield "execute", sql, params
+    return inserted
+
+
+# {template_hash: id} for templates, inserting the ones not stored yet
+def template_ids_plan(email_templates, templates):
+    template_ids = email_templates.lookup(templates)
+    missing = [template for template_hash, template in templates.items() if template_hash not in template_ids]
+    if missing:
+        yield "executemany", INSERT_EMAIL_TEMPLATES_SQL, missing
+        placeholders = ", ".join(["%s"] * len(missing))
+        template_ids.update((yield "fetchall", EMAIL_TEMPLATE_IDS_SQL.format(placeholders=placeholders),
+                             [template_hash for template_hash, _, _ in missing]))
+    return template_ids
+
+
+# Insert email logs with their templates; returns the template ids to cache once committed
+def insert_email_logs_plan(email_templates, rows):
+    templates, rows = templated_email_rows(rows)
+    template_ids = yield from template_ids_plan(email_templates, templates)
+    yield "executemany", INSERT_EMAIL_LOGS_SQL, [(*row[:3], template_ids[row[3]], *row[4:]) for row in rows]
+    return template_ids
+
+
+# Update the hydration logs matching a WHERE clause, and their rollups
+def update_where_plan(where, params, is_drunk, status):
+    # One grouped locking read gives the rollup deltas, however many rows match
+    groups = yield "fetchall", UPDATE_GROUPS_SQL.format(where=where), params
+    if not groups:
+        return 0
+    yield "execute", UPDATE_STATUS_SQL.format(where=where), (is_drunk, status, *params)
+    yield from rollup_deltas_plan(rollups.confirmation_deltas(groups, is_drunk))
+    return sum(group[2] for group in groups)
+
+
+# Update hydration logs by id, and their rollups
+def set_statuses_plan(log_ids, is_drunk, status, pending_only=False, bulk_id_list_limit=BULK_ID_LIST_LIMIT):
+    if not log_ids:
+        return 0
+    pending = " AND status = 'pending'" if pending_only else ""
+    if len(log_ids) <= bulk_id_list_limit:
+        placeholders = ", ".join(["%s"] * len(log_ids))
+        return (yield from update_where_plan(f"id IN ({placeholders}){pending}", tuple(log_ids), is_drunk, status))
+
+    # Very large id sets are joined through a temporary table instead of a huge IN list
+    yield "execute", "CREATE TEMPORARY TABLE IF NOT EXISTS bulk_hydration_ids (id INT PRIMARY KEY)", ()
+    yield "execute", "DELETE FROM bulk_hydration_ids", ()
+    yield "executemany", "INSERT IGNORE INTO bulk_hydration_ids (id) VALUES (%s)", [(log_id,) for log_id in log_ids]
+    try:
+        return (yield from update_where_plan(f"id IN (SELECT id FROM bulk_hydration_ids){pending}", (),
+                                             is_drunk, status))
+    finally:
+        yield "execute", "DROP TEMPORARY TABLE IF EXISTS bulk_hydration_ids", ()
+
+
+# Answer a user's latest pending hydration log
+def answer_latest_pending_plan(user_id, is_drunk, status):
+    row = yield "fetchone", LATEST_PENDING_SQL, (user_id,)
+    if not row:
+        return 0
+    return (yield from set_statuses_plan([row[0]], is_drunk, status))
+
+
+def enqueue_reminders_plan(rows):
+    return (yield "executemany", INSERT_OUTBOX_SQL, rows)
+
+
+def claim_reminders_plan(worker_id, now, lease_seconds, limit, max_attempts):
+    yield "execute", EXPIRE_OUTBOX_SQL, (now, max_attempts)
+    claimed = [dict(zip(OUTBOX_COLUMNS, row))
+               for row in (yield "fetchall", CLAIM_OUTBOX_SQL, (now, max_attempts, limit))]
+    if claimed:
+        placeholders = ", ".join(["%s"] * len(claimed))
+        yield ("execute", LEASE_OUTBOX_SQL.format(placeholders=placeholders),
+               (worker_id, now + timedelta(seconds=lease_seconds), *[row["id"] for row in claimed]))
+    return claimed
+
+
+# Complete the outbox rows still leased to worker_id; returns their ids
+def complete_reminders_plan(worker_id, outbox_ids, hydration_rows, sent_at):
+    outbox_ids = list(outbox_ids)
+    if not outbox_ids:
+        return []
+    placeholders = ", ".join(["%s"] * len(outbox_ids))
+    owned = {row[0] for row in (yield "fetchall", OWNED_OUTBOX_SQL.format(placeholders=placeholders),
+                                (worker_id, *outbox_ids))}
+    completed = [outbox_id for outbox_id in outbox_ids if outbox_id in owned]
+    if completed:
+        yield ("execute", COMPLETE_OUTBOX_SQL.format(placeholders=", ".join(["%s"] * len(completed))),
+               (sent_at, *completed))
+        yield from insert_hydration_logs_plan([row for outbox_id, row in zip(outbox_ids, hydration_rows)
+                                               if outbox_id in owned])
+    return completed
+
+
+# Release the outbox rows still leased to worker_id; returns the number marked failed
+def release_reminders_plan(worker_id, outbox_ids, available_at, max_attempts):
+    outbox_ids = list(outbox_ids)
+    if not outbox_ids:
+        return 0
+    placeholders = ", ".join(["%s"] * len(outbox_ids))
+    yield ("execute", RELEASE_OUTBOX_SQL.format(placeholders=placeholders),
+           (max_attempts, available_at, worker_id, *outbox_ids))
+    return (yield "fetchone", FAILED_OUTBOX_SQL.format(placeholders=placeholders), outbox_ids)[0]
+
+
+def record_weekly_goals_plan(week_start, daily_goal, bottle_volume, is_prize_day):
+    yield "execute", RECORD_WEEKLY_GOALS_SQL, (is_prize_day, daily_goal, bottle_volume, week_start)
+
+
+# Storage on a MySQL server through pooled mysql.connector connections
+class MySQLStorage(Storage):
+    name = "mysql"
+
+    def __init__(self, config, pool_size=5, pool_timeout=10, idle_timeout=300, health_check_interval=30,
+                 bulk_id_list_limit=BULK_ID_LIST_LIMIT):
+        self.config = config
+        self.bulk_id_list_limit = bulk_id_list_limit
+        self.email_templates = EmailTemplateCache()
+        self.pool = ConnectionPool(
+            lambda: mysql.connector.connect(**config),
+            max_size=pool_size,
+            timeout=pool_timeout,
+            idle_timeout=idle_timeout,
+            health_check_interval=health_check_interval,
+        )
+
+    # Borrow a pooled connection, translating driver errors into StorageError
+    @contextmanager
+    def connection(self):
+        try:
+            conn = self.pool.acquire()
+        except PoolTimeoutError as err:
+            raise StorageUnavailableError(f"Database connection pool exhausted: {err}") from err
+        except mysql.connector.Error as err:
+            raise StorageUnavailableError(f"Error connecting to database: {err}") from err
+        try:
+            with conn:
+                yield conn
+        except mysql.connector.Error as err:
+            raise StorageError(str(err)) from err
+
+    def initialize(self):
+        with self.connection() as conn:
+            return apply_migrations(conn)
+
+    def get_last_reminder_times(self):
+        return self._run(last_reminder_times_plan())
+
+    def load_user_state(self, user_id):
+        return self._run(load_user_state_plan(user_id))
+
+    def insert_hydration_logs(self, rows):
+        return self._run(insert_hydration_logs_plan(rows))
+
+    def insert_email_logs(self, rows):
+        self.email_templates.update(self._run(insert_email_logs_plan(self.email_templates, rows)))
+
+    def answer_latest_pending(self, user_id, is_drunk, status):
+        return self._run(answer_latest_pending_plan(user_id, is_drunk, status))
+
+    def set_hydration_log_statuses(self, log_ids, is_drunk, status, pending_only=False):
+        return self._run(set_statuses_plan(list(log_ids), is_drunk, status, pending_only, self.bulk_id_list_limit))
+
+    def confirm_pending(self, is_drunk, status, start=None, end=None, before=None, user_id=None):
+        where, params = pending_where(user_id=user_id, start=start, end=end, before=before)
+        return self._run(update_where_plan(where, params, is_drunk, status))
+
+    def get_pending_hydration_logs(self, after=None, limit=20, user_id=None):
+        where, params = pending_where(user_id=user_id, after=after)
+        with self.connection() as conn:
+            cursor = conn.cursor(dictionary=True)
+            cursor.execute(f"""
+            SELECT id, user_id, date_time
+            FROM hydration_logs
+            WHERE {where}
+            ORDER BY date_time, id
+            LIMIT %s
+            """, (*params, limit))
+            return cursor.fetchall()
+
+    def get_weekly_totals(self, user_id, week_start):
+        with self.connection() as conn:
+            return rollups.get_weekly_totals(conn.cursor(), user_id, week_start)
+
+    def get_period_totals(self, user_id, period, today):
+        with self.connection() as conn:
+            return rollups.get_period_totals(conn.cursor(), user_id, period, today)
+
+    def record_weekly_goal(self, user_id, start_date, end_date, total_bottles, goal_met, prize_awarded):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+            SELECT prize_awarded FROM weekly_goals WHERE user_id = %s AND start_date = %s
+            """, (user_id, start_date))
+            existing = cursor.fetchone()
+            cursor.execute("""
+            INSERT INTO weekly_goals (user_id, start_date, end_date, total_bottles, goal_met, prize_awarded)
+            VALUES (%s, %s, %s, %s, %s, %s)
+            ON DUPLICATE KEY UPDATE
+                total_bottles = VALUES(total_bottles),
+                goal_met = VALUES(goal_met),
+                prize_awarded = prize_awarded OR VALUES(prize_awarded)
+            """, (user_id, start_date, end_date, total_bottles, goal_met, prize_awarded))
+            conn.commit()
+            return bool(existing and existing[0])
+
+    def record_weekly_goals(self, week_start, daily_goal, bottle_volume, is_prize_day):
+        self._run(record_weekly_goals_plan(week_start, daily_goal, bottle_volume, is_prize_day))
+
+    def get_settings_version(self):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("SELECT COUNT(*), MAX(updated_at) FROM user_settings")
+            return cursor.fetchone()
+
+    def load_user_settings(self):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"SELECT user_id, {', '.join(SETTING_NAMES)} FROM user_settings")
+            return {row[0]: dict(zip(SETTING_NAMES, row[1:])) for row in cursor.fetchall()}
+
+    def set_user_settings(self, user_id, settings):
+        columns = settings_columns(settings)
+        updates = [f"{name} = VALUES({name})" for name in columns] + ["updated_at = CURRENT_TIMESTAMP(6)"]
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute(f"""
+            INSERT INTO user_settings (user_id{''.join(', ' + name for name in columns)})
+            VALUES (%s{', %s' * len(columns)})
+            ON DUPLICATE KEY UPDATE {', '.join(updates)}
+            """, (user_id, *(settings[name] for name in columns)))
+            conn.commit()
+
+    def archive_hydration_logs(self, before, limit):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            # Oldest first through idx_hydration_date; only the selected rows are locked
+            cursor.execute("""
+            SELECT id FROM hydration_logs
+            WHERE date_time < %s
+            ORDER BY date_time, id
+            LIMIT %s
+            FOR UPDATE
+            """, (before, limit))
+            log_ids = [row[0] for row in cursor.fetchall()]
+            if log_ids:
+                placeholders = ", ".join(["%s"] * len(log_ids))
+                cursor.execute(f"""
+                INSERT INTO hydration_logs_archive (id, user_id, date_time, bottle_volume, is_drunk, status)
+                SELECT id, user_id, date_time, bottle_volume, is_drunk, status
+                FROM hydration_logs
+                WHERE id IN ({placeholders})
+                """, log_ids)
+                cursor.execute(f"DELETE FROM hydration_logs WHERE id IN ({placeholders})", log_ids)
+            conn.commit()
+            return len(log_ids)
+
+    def archive_email_logs(self, before, limit):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+            SELECT id, user_id, date_time, subject, message, template_id, message_args, success, error_message
+            FROM email_logs
+            WHERE date_time < %s
+            ORDER BY date_time, id
+            LIMIT %s
+            FOR UPDATE
+            """, (before, limit))
+            templates, archive_rows = email_archive_rows(cursor.fetchall())
+            template_ids = run_plan(cursor, template_ids_plan(self.email_templates, templates))
+            if archive_rows:
+                for row in archive_rows:
+                    if row[3] in template_ids:
+                        row[3] = template_ids[row[3]]
+                cursor.executemany("""
+                INSERT INTO email_logs_archive (id, user_id, date_time, template_id, message_args, success, error_message)
+                VALUES (%s, %s, %s, %s, %s, %s, %s)
+                """, archive_rows)
+                placeholders = ", ".join(["%s"] * len(archive_rows))
+                cursor.execute(f"DELETE FROM email_logs WHERE id IN ({placeholders})", [row[0] for row in archive_rows])
+            conn.commit()
+        self.email_templates.update(template_ids)
+        return len(archive_rows)
+
+    def enqueue_reminders(self, rows):
+        return self._run(enqueue_reminders_plan(rows))
+
+    def claim_reminders(self, worker_id, now, lease_seconds, limit, max_attempts):
+        return self._run(claim_reminders_plan(worker_id, now, lease_seconds, limit, max_attempts))
+
+    def complete_reminders(self, worker_id, outbox_ids, hydration_rows, sent_at):
+        return self._run(complete_reminders_plan(worker_id, outbox_ids, hydration_rows, sent_at))
+
+    def release_reminders(self, worker_id, outbox_ids, available_at, max_attempts):
+        return self._run(release_reminders_plan(worker_id, outbox_ids, available_at, max_attempts))
+
+    def purge_reminder_outbox(self, before, limit):
+        with self.connection() as conn:
+            cursor = conn.cursor()
+            cursor.execute("""
+            DELETE FROM reminder_outbox
+            WHERE status IN ('sent', 'failed') AND reminder_time < %s
+            ORDER BY reminder_time
+            LIMIT %s
+            """, (before, limit))
+            conn.commit()
+            return cursor.rowcount
+
+    # Streamed through an unbuffered cursor, so only one chunk is held in memory; the consistent
+    # snapshot keeps the two tables in step while the archiver moves rows between them
+    def export_hydration_logs(self, start, end, chunk_size):
+        where, params = export_where("%s", start, end)
+        with self.connection() as conn:
+            conn.start_transaction(consistent_snapshot=True, readonly=True)
+            for table in ("hydration_logs", "hydration_logs_archive"):
+                cursor = conn.cursor(buffered=False)
+                cursor.execute(f"SELECT id, user_id, date_time, is_drunk, status FROM {table} WHERE {where}", params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield [(log_id, user_id, date_time, bool(is_drunk), status)
+                           for log_id, user_id, date_time, is_drunk, status in rows]
+                cursor.close()
+            conn.commit()
+
+    def stats(self):
+        return self.pool.stats()
+
+    # Close idle pooled connections
+    def close(self):
+        self.pool.close_all()
+
+    # Run a statement plan in one transaction
+    def _run(self, plan):
+        with self.connection() as conn:
+            result = run_plan(conn.cursor(), plan)
+            conn.commit()
+            return result
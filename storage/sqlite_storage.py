@@ -0,0 +1,748 @@
+import logging
+import os
+import queue
+import sqlite3
+import threading
+from concurrent.futures import Future
+from datetime import date, datetime, timedelta
+from storage.base import (
+    Storage, StorageError, StorageUnavailableError, EmailTemplateCache, dedupe_by_minute, email_archive_rows,
+    export_where, pending_where, settings_columns, templated_email_rows,
+)
+from utils import rollups
+from utils.migrations import latest_version
+from utils.user_settings import SETTING_NAMES
+
+logger = logging.getLogger(__name__)
+
+# Times are stored as "YYYY-MM-DD HH:MM:SS[.ffffff]" text, which sorts and compares like DATETIME
+sqlite3.register_adapter(datetime, lambda value: value.isoformat(sep=" "))
+sqlite3.register_adapter(date, lambda value: value.isoformat())
+
+EMAIL_LOGS_TABLE = """
+    CREATE TABLE IF NOT EXISTS email_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL DEFAULT 1,
+        date_time TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        template_id INTEGER,
+        message_args TEXT,
+        message TEXT,
+        success INTEGER NOT NULL,
+        error_message TEXT
+    )
+    """
+
+# Schema equivalent to MySQL migrations 1-9. When a MySQL migration changes the
+# schema, extend this to match, and add an UPGRADES step for changes that
+# CREATE ... IF NOT EXISTS cannot make; PRAGMA user_version records the version.
+SCHEMA = [
+    """
+    CREATE TABLE IF NOT EXISTS hydration_logs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL DEFAULT 1,
+        date_time TEXT NOT NULL,
+        bottle_volume REAL NOT NULL,
+        is_drunk INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'pending',
+        minute_bucket TEXT GENERATED ALWAYS AS (substr(date_time, 1, 16)) VIRTUAL
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_hydration_status_date ON hydration_logs (status, date_time)",
+    "CREATE INDEX IF NOT EXISTS idx_hydration_date ON hydration_logs (date_time)",
+    "CREATE INDEX IF NOT EXISTS idx_hydration_user_date ON hydration_logs (user_id, date_time)",
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_hydration_user_minute ON hydration_logs (user_id, minute_bucket)",
+    EMAIL_LOGS_TABLE,
+    "CREATE INDEX IF NOT EXISTS idx_email_user_date ON email_logs (user_id, date_time)",
+    "CREATE INDEX IF NOT EXISTS idx_email_date ON email_logs (date_time)",
+    """
+    CREATE TABLE IF NOT EXISTS email_templates (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        template_hash TEXT NOT NULL UNIQUE,
+        subject TEXT NOT NULL,
+        body TEXT NOT NULL
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hydration_logs_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        date_time TEXT NOT NULL,
+        bottle_volume REAL NOT NULL,
+        is_drunk INTEGER DEFAULT 0,
+        status TEXT DEFAULT 'pending'
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_hydration_archive_user_date ON hydration_logs_archive (user_id, date_time)",
+    "CREATE INDEX IF NOT EXISTS idx_hydration_archive_date ON hydration_logs_archive (date_time)",
+    """
+    CREATE TABLE IF NOT EXISTS email_logs_archive (
+        id INTEGER PRIMARY KEY,
+        user_id INTEGER NOT NULL,
+        date_time TEXT NOT NULL,
+        template_id INTEGER NOT NULL,
+        message_args TEXT,
+        success INTEGER NOT NULL,
+        error_message TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_email_archive_user_date ON email_logs_archive (user_id, date_time)",
+    """
+    CREATE TABLE IF NOT EXISTS weekly_goals (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        user_id INTEGER NOT NULL DEFAULT 1,
+        start_date TEXT NOT NULL,
+        end_date TEXT NOT NULL,
+        total_bottles INTEGER NOT NULL,
+        goal_met INTEGER DEFAULT 0,
+        prize_awarded INTEGER DEFAULT 0,
+        UNIQUE (user_id, start_date)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hydration_daily_rollups (
+        user_id INTEGER NOT NULL,
+        day TEXT NOT NULL,
+        reminders INTEGER NOT NULL DEFAULT 0,
+        bottles_drunk INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, day)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS hydration_weekly_rollups (
+        user_id INTEGER NOT NULL,
+        week_start TEXT NOT NULL,
+        reminders INTEGER NOT NULL DEFAULT 0,
+        bottles_drunk INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (user_id, week_start)
+    )
+    """,
+    """
+    CREATE TABLE IF NOT EXISTS reminder_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        idempotency_key TEXT NOT NULL UNIQUE,
+        user_id INTEGER NOT NULL,
+        reminder_time TEXT NOT NULL,
+        subject TEXT NOT NULL,
+        message TEXT NOT NULL,
+        next_drink_time TEXT,
+        status TEXT NOT NULL DEFAULT 'pending',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        available_at TEXT NOT NULL,
+        claimed_by TEXT,
+        sent_at TEXT
+    )
+    """,
+    "CREATE INDEX IF NOT EXISTS idx_outbox_status_available ON reminder_outbox (status, available_at)",
+    "CREATE INDEX IF NOT EXISTS idx_outbox_status_time ON reminder_outbox (status, reminder_time)",
+    """
+    CREATE TABLE IF NOT EXISTS user_settings (
+        user_id INTEGER PRIMARY KEY,
+        drink_interval INTEGER,
+        bottle_volume REAL,
+        daily_goal REAL,
+        prize_day TEXT,
+        reminder_start_hour INTEGER,
+        reminder_end_hour INTEGER,
+        updated_at TEXT NOT NULL DEFAULT (strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime'))
+    )
+    """,
+    # The ON UPDATE CURRENT_TIMESTAMP(6) of MySQL, for rows edited by hand
+    """
+    CREATE TRIGGER IF NOT EXISTS user_settings_updated_at AFTER UPDATE ON user_settings
+    WHEN NEW.updated_at = OLD.updated_at
+    BEGIN
+        UPDATE user_settings SET updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')
+        WHERE user_id = NEW.user_id;
+    END
+    """,
+]
+
+# Steps that bring a database created at an older user_version up to date before SCHEMA runs
+UPGRADES = [
+    # SQLite cannot drop NOT NULL from email_logs.message in place, so the table is rebuilt
+    (6, [
+        "ALTER TABLE email_logs RENAME TO email_logs_v5",
+        EMAIL_LOGS_TABLE,
+        """
+        INSERT INTO email_logs (id, user_id, date_time, subject, message, success, error_message)
+        SELECT id, user_id, date_time, subject, message, success, error_message FROM email_logs_v5
+        """,
+        "DROP TABLE email_logs_v5",
+    ]),
+]
+
+INSERT_HYDRATION_LOGS_SQL = """
+    INSERT OR IGNORE INTO hydration_logs (user_id, date_time, bottle_volume, is_drunk, status)
+    VALUES (?, ?, ?, ?, ?)
+    """
+
+INSERT_EMAIL_LOGS_SQL = """
+    INSERT INTO email_logs (user_id, date_time, subject, template_id, message_args, success, error_message)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """
+
+INSERT_EMAIL_TEMPLATES_SQL = """
+    INSERT OR IGNORE INTO email_templates (template_hash, subject, body)
+    VALUES (?, ?, ?)
+    """
+
+DAILY_DELTA_SQL = """
+    INSERT INTO hydration_daily_rollups (user_id, day, reminders, bottles_drunk)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, day) DO UPDATE SET
+        reminders = reminders + excluded.reminders,
+        bottles_drunk = bottles_drunk + excluded.bottles_drunk
+    """
+
+WEEKLY_DELTA_SQL = """
+    INSERT INTO hydration_weekly_rollups (user_id, week_start, reminders, bottles_drunk)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (user_id, week_start) DO UPDATE SET
+        reminders = reminders + excluded.reminders,
+        bottles_drunk = bottles_drunk + excluded.bottles_drunk
+    """
+
+# SQLite forms of the rollups rebuild statements, with the same parameters
+REBUILD_SQL = {
+    rollups.REBUILD_DAILY_SQL: """
+    REPLACE INTO hydration_daily_rollups (user_id, day, reminders, bottles_drunk)
+    SELECT ?, ?, COUNT(*), COALESCE(SUM(is_drunk), 0)
+    FROM hydration_logs
+    WHERE user_id = ? AND date_time >= ? AND date_time < ?
+    """,
+    rollups.REBUILD_WEEKLY_SQL: """
+    REPLACE INTO hydration_weekly_rollups (user_id, week_start, reminders, bottles_drunk)
+    SELECT ?, ?, COALESCE(SUM(reminders), 0), COALESCE(SUM(bottles_drunk), 0)
+    FROM hydration_daily_rollups
+    WHERE user_id = ? AND day >= ? AND day < ?
+    """,
+}
+
+INSERT_OUTBOX_SQL = """
+    INSERT OR IGNORE INTO reminder_outbox
+        (idempotency_key, user_id, reminder_time, subject, message, next_drink_time, available_at)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    """
+
+# Params: (is_prize_day, default daily_goal, default bottle_volume, week_start)
+RECORD_WEEKLY_GOALS_SQL = """
+    INSERT INTO weekly_goals (user_id, start_date, end_date, total_bottles, goal_met, prize_awarded)
+    SELECT user_id, week_start, date(week_start, '+6 days'), bottles_drunk,
+           bottles_drunk >= bottle_goal, bottles_drunk >= bottle_goal AND ?
+    FROM (
+        SELECT r.user_id, r.week_start, r.bottles_drunk,
+               COALESCE(s.daily_goal, ?) / COALESCE(s.bottle_volume, ?) * 7 AS bottle_goal
+        FROM hydration_weekly_rollups r
+        LEFT JOIN user_settings s ON s.user_id = r.user_id
+        WHERE r.week_start = ?
+    )
+    WHERE true
+    ON CONFLICT (user_id, start_date) DO UPDATE SET
+        total_bottles = excluded.total_bottles,
+        goal_met = excluded.goal_met,
+        prize_awarded = prize_awarded OR excluded.prize_awarded
+    """
+
+
+def parse_datetime(value):
+    return datetime.fromisoformat(value) if value else None
+
+
+def export_rows(rows):
+    return [(log_id, user_id, parse_datetime(date_time), bool(is_drunk), status)
+            for log_id, user_id, date_time, is_drunk, status in rows]
+
+
+# Embedded storage in one SQLite file in WAL mode. Every write runs on a single
+# writer thread, so writers never contend for the database lock; readers use
+# their own per-thread connections and see committed data without blocking it.
+# Statements are constant SQL with ? parameters, so each connection prepares
+# them once and reuses them from its statement cache.
+class SQLiteStorage(Storage):
+    name = "sqlite"
+
+    def __init__(self, path="hydration.db", busy_timeout=5, cached_statements=256):
+        self.path = path
+        self.busy_timeout = busy_timeout
+        self.cached_statements = cached_statements
+        self._local = threading.local()
+        self._readers = []
+        self._readers_lock = threading.Lock()
+        self._writes = queue.Queue()
+        self._writer = None
+        self._writer_lock = threading.Lock()
+        self._stats = {"writes": 0, "reads": 0}
+        self.email_templates = EmailTemplateCache()
+
+    def _connect(self):
+        directory = os.path.dirname(self.path)
+        try:
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=self.busy_timeout, cached_statements=self.cached_statements,
+                                   check_same_thread=False, isolation_level=None)
+        except (sqlite3.Error, OSError) as err:
+            raise StorageUnavailableError(f"Error opening {self.path}: {err}") from err
+        conn.execute("PRAGMA journal_mode = WAL")
+        conn.execute("PRAGMA synchronous = NORMAL")  # Durable at checkpoints; WAL keeps the file consistent
+        conn.execute("PRAGMA foreign_keys = ON")
+        return conn
+
+    # Run fn(conn) in one transaction on the writer thread and return its result
+    def _write(self, fn, *args):
+        if threading.current_thread() is self._writer:
+            return self._run_write(self._writer_conn, fn, args)
+        self._start_writer()
+        future = Future()
+        self._writes.put((fn, args, future))
+        return future.result()
+
+    def _start_writer(self):
+        with self._writer_lock:
+            if self._writer is not None:
+                return
+            self._writer_conn = self._connect()
+            self._writer = threading.Thread(target=self._run_writer, name="sqlite-writer", daemon=True)
+            self._writer.start()
+
+    def _run_writer(self):
+        while True:
+            job = self._writes.get()
+            if job is None:
+                break
+            fn, args, future = job
+            try:
+                future.set_result(self._run_write(self._writer_conn, fn, args))
+            except Exception as e:
+                future.set_exception(e)
+        self._writer_conn.close()
+
+    def _run_write(self, conn, fn, args):
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(conn, *args)
+            except BaseException:
+                conn.execute("ROLLBACK")
+                raise
+            conn.execute("COMMIT")
+        except sqlite3.Error as err:
+            raise StorageError(str(err)) from err
+        self._stats["writes"] += 1
+        return result
+
+    # Run fn(conn) on this thread's read connection
+    def _read(self, fn, *args):
+        if self.path == ":memory:":
+            # Every connection to :memory: is a separate database, so read through the writer
+            return self._write(fn, *args)
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._local.conn = self._connect()
+            conn.execute("PRAGMA query_only = ON")
+            with self._readers_lock:
+                self._readers.append(conn)
+        try:
+            result = fn(conn, *args)
+        except sqlite3.Error as err:
+            raise StorageError(str(err)) from err
+        self._stats["reads"] += 1
+        return result
+
+    def initialize(self):
+        return self._write(self._initialize)
+
+    @staticmethod
+    def _initialize(conn):
+        version = conn.execute("PRAGMA user_version").fetchone()[0]
+        if version < latest_version():
+            for upgrade_version, statements in UPGRADES if version else []:
+                if upgrade_version > version:
+                    for statement in statements:
+                        conn.execute(statement)
+            for statement in SCHEMA:
+                conn.execute(statement)
+            conn.execute(f"PRAGMA user_version = {latest_version()}")
+            version = latest_version()
+        return version
+
+    def get_last_reminder_times(self):
+        def query(conn):
+            rows = conn.execute("""
+            SELECT user_id, MAX(last_hydration_log_time), MAX(last_email_log_time)
+            FROM (
+                SELECT user_id, MAX(date_time) AS last_hydration_log_time, NULL AS last_email_log_time
+                FROM hydration_logs GROUP BY user_id
+                UNION ALL
+                SELECT user_id, NULL, MAX(date_time)
+                FROM email_logs GROUP BY user_id
+            )
+            GROUP BY user_id
+            """).fetchall()
+            return {user_id: (parse_datetime(last_hydration), parse_datetime(last_email))
+                    for user_id, last_hydration, last_email in rows}
+        return self._read(query)
+
+    def load_user_state(self, user_id):
+        def query(conn):
+            row = conn.execute("""
+            SELECT
+                (SELECT MAX(date_time) FROM hydration_logs WHERE user_id = ?),
+                (SELECT MAX(date_time) FROM email_logs WHERE user_id = ?)
+            """, (user_id, user_id)).fetchone()
+            return parse_datetime(row[0]), parse_datetime(row[1])
+        return self._read(query)
+
+    def insert_hydration_logs(self, rows):
+        return self._write(self._insert_hydration_logs, dedupe_by_minute(rows))
+
+    def _insert_hydration_logs(self, conn, by_minute):
+        before = conn.total_changes
+        conn.executemany(INSERT_HYDRATION_LOGS_SQL, list(by_minute.values()))
+        inserted = conn.total_changes - before
+        if inserted == len(by_minute):
+            self._apply_deltas(conn, rollups.reminder_deltas([(user_id, date_time, is_drunk)
+                                                               for user_id, date_time, _, is_drunk, _ in by_minute.values()]))
+        else:
+            # Some minutes were already logged; recount just the affected days
+            for sql, params in rollups.rebuild_statements({(user_id, date_time.date()) for user_id, date_time in by_minute}):
+                conn.execute(REBUILD_SQL[sql], params)
+        return inserted
+
+    def insert_email_logs(self, rows):
+        templates, rows = templated_email_rows(rows)
+
+        def insert(conn):
+            template_ids = self._template_ids(conn, templates)
+            conn.executemany(INSERT_EMAIL_LOGS_SQL, [(*row[:3], template_ids[row[3]], *row[4:]) for row in rows])
+            return template_ids
+        self.email_templates.update(self._write(insert))
+
+    def answer_latest_pending(self, user_id, is_drunk, status):
+        def update(conn):
+            row = conn.execute("""
+            SELECT id FROM hydration_logs
+            WHERE user_id = ? AND status = 'pending'
+            ORDER BY date_time DESC
+            LIMIT 1
+            """, (user_id,)).fetchone()
+            return self._update_where(conn, "id = ?", (row[0],), is_drunk, status) if row else 0
+        return self._write(update)
+
+    def set_hydration_log_statuses(self, log_ids, is_drunk, status, pending_only=False):
+        log_ids = list(log_ids)
+        if not log_ids:
+            return 0
+        pending = " AND status = 'pending'" if pending_only else ""
+
+        def update(conn):
+            # A temporary table keeps the statement the same however many ids there are
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS bulk_hydration_ids (id INTEGER PRIMARY KEY)")
+            conn.execute("DELETE FROM bulk_hydration_ids")
+            conn.executemany("INSERT OR IGNORE INTO bulk_hydration_ids (id) VALUES (?)", [(log_id,) for log_id in log_ids])
+            return self._update_where(conn, f"id IN (SELECT id FROM bulk_hydration_ids){pending}", (), is_drunk, status)
+        return self._write(update)
+
+    def confirm_pending(self, is_drunk, status, start=None, end=None, before=None, user_id=None):
+        where, params = pending_where("?", user_id=user_id, start=start, end=end, before=before)
+        return self._write(self._update_where, where, params, is_drunk, status)
+
+    def get_pending_hydration_logs(self, after=None, limit=20, user_id=None):
+        where, params = pending_where("?", user_id=user_id, after=after)
+
+        def query(conn):
+            rows = conn.execute(f"""
+            SELECT id, user_id, date_time
+            FROM hydration_logs
+            WHERE {where}
+            ORDER BY date_time, id
+            LIMIT ?
+            """, (*params, limit)).fetchall()
+            return [{"id": log_id, "user_id": user_id, "date_time": parse_datetime(date_time)}
+                    for log_id, user_id, date_time in rows]
+        return self._read(query)
+
+    def get_weekly_totals(self, user_id, week_start):
+        def query(conn):
+            row = conn.execute("""
+            SELECT reminders, bottles_drunk FROM hydration_weekly_rollups
+            WHERE user_id = ? AND week_start = ?
+            """, (user_id, week_start)).fetchone()
+            return (row[0], row[1]) if row else (0, 0)
+        return self._read(query)
+
+    def get_period_totals(self, user_id, period, today):
+        today = today or date.today()
+        if isinstance(today, datetime):
+            today = today.date()
+        if period == "daily":
+            start, end = today, today
+        elif period == "weekly":
+            start = rollups.week_start(today)
+            end = start + timedelta(days=6)
+        elif period == "monthly":
+            start = today.replace(day=1)
+            end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        else:
+            raise ValueError(f"Unknown statistics period: {period}")
+
+        def query(conn):
+            return conn.execute("""
+            SELECT COALESCE(SUM(reminders), 0), COALESCE(SUM(bottles_drunk), 0)
+            FROM hydration_daily_rollups
+            WHERE user_id = ? AND day BETWEEN ? AND ?
+            """, (user_id, start, end)).fetchone()
+        reminders, bottles_drunk = self._read(query)
+        return start, end, int(reminders), int(bottles_drunk)
+
+    def record_weekly_goal(self, user_id, start_date, end_date, total_bottles, goal_met, prize_awarded):
+        def upsert(conn):
+            existing = conn.execute("""
+            SELECT prize_awarded FROM weekly_goals WHERE user_id = ? AND start_date = ?
+            """, (user_id, start_date)).fetchone()
+            conn.execute("""
+            INSERT INTO weekly_goals (user_id, start_date, end_date, total_bottles, goal_met, prize_awarded)
+            VALUES (?, ?, ?, ?, ?, ?)
+            ON CONFLICT (user_id, start_date) DO UPDATE SET
+                total_bottles = excluded.total_bottles,
+                goal_met = excluded.goal_met,
+                prize_awarded = prize_awarded OR excluded.prize_awarded
+            """, (user_id, start_date, end_date, total_bottles, goal_met, prize_awarded))
+            return bool(existing and existing[0])
+        return self._write(upsert)
+
+    def record_weekly_goals(self, week_start, daily_goal, bottle_volume, is_prize_day):
+        self._write(lambda conn: conn.execute(RECORD_WEEKLY_GOALS_SQL,
+                                              (is_prize_day, daily_goal, bottle_volume, week_start)))
+
+    def get_settings_version(self):
+        return self._read(lambda conn: conn.execute(
+            "SELECT COUNT(*), MAX(updated_at) FROM user_settings").fetchone())
+
+    def load_user_settings(self):
+        def query(conn):
+            rows = conn.execute(f"SELECT user_id, {', '.join(SETTING_NAMES)} FROM user_settings").fetchall()
+            return {row[0]: dict(zip(SETTING_NAMES, row[1:])) for row in rows}
+        return self._read(query)
+
+    def set_user_settings(self, user_id, settings):
+        columns = settings_columns(settings)
+        updates = [f"{name} = excluded.{name}" for name in columns]
+        updates.append("updated_at = strftime('%Y-%m-%d %H:%M:%f', 'now', 'localtime')")
+        self._write(lambda conn: conn.execute(f"""
+            INSERT INTO user_settings (user_id{''.join(', ' + name for name in columns)})
+            VALUES (?{', ?' * len(columns)})
+            ON CONFLICT (user_id) DO UPDATE SET {', '.join(updates)}
+            """, (user_id, *(settings[name] for name in columns))))
+
+    def archive_hydration_logs(self, before, limit):
+        # Both statements see the same oldest rows: nothing else writes until this transaction ends
+        oldest = """
+            SELECT id FROM hydration_logs
+            WHERE date_time < ?
+            ORDER BY date_time, id
+            LIMIT ?
+            """
+
+        def archive(conn):
+            archived = conn.execute(f"""
+            INSERT INTO hydration_logs_archive (id, user_id, date_time, bottle_volume, is_drunk, status)
+            SELECT id, user_id, date_time, bottle_volume, is_drunk, status
+            FROM hydration_logs
+            WHERE id IN ({oldest})
+            """, (before, limit)).rowcount
+            conn.execute(f"DELETE FROM hydration_logs WHERE id IN ({oldest})", (before, limit))
+            return archived
+        return self._write(archive)
+
+    def archive_email_logs(self, before, limit):
+        def archive(conn):
+            templates, archive_rows = email_archive_rows(conn.execute("""
+            SELECT id, user_id, date_time, subject, message, template_id, message_args, success, error_message
+            FROM email_logs
+            WHERE date_time < ?
+            ORDER BY date_time, id
+            LIMIT ?
+            """, (before, limit)).fetchall())
+            template_ids = self._template_ids(conn, templates)
+            for row in archive_rows:
+                if row[3] in template_ids:
+                    row[3] = template_ids[row[3]]
+            conn.executemany("""
+            INSERT INTO email_logs_archive (id, user_id, date_time, template_id, message_args, success, error_message)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+            """, archive_rows)
+            conn.executemany("DELETE FROM email_logs WHERE id = ?", [(row[0],) for row in archive_rows])
+            return template_ids, len(archive_rows)
+        template_ids, archived = self._write(archive)
+        self.email_templates.update(template_ids)
+        return archived
+
+    def enqueue_reminders(self, rows):
+        def insert(conn):
+            before = conn.total_changes
+            conn.executemany(INSERT_OUTBOX_SQL, rows)
+            return conn.total_changes - before
+        return self._write(insert)
+
+    # Writes are serialized (BEGIN IMMEDIATE, across processes too), so a claim never races another one
+    # and needs no SKIP LOCKED
+    def claim_reminders(self, worker_id, now, lease_seconds, limit, max_attempts):
+        def claim(conn):
+            conn.execute("""
+            UPDATE reminder_outbox
+            SET status = 'failed', claimed_by = NULL
+            WHERE status = 'sending' AND available_at <= ? AND attempts >= ?
+            """, (now, max_attempts))
+            rows = conn.execute("""
+            SELECT id, idempotency_key, user_id, reminder_time, subject, message, next_drink_time, attempts
+            FROM reminder_outbox
+            WHERE status IN ('pending', 'sending') AND available_at <= ? AND attempts < ?
+            ORDER BY available_at, id
+            LIMIT ?
+            """, (now, max_attempts, limit)).fetchall()
+            conn.executemany("""
+            UPDATE reminder_outbox
+            SET status = 'sending', claimed_by = ?, available_at = ?, attempts = attempts + 1
+            WHERE id = ?
+            """, [(worker_id, now + timedelta(seconds=lease_seconds), row[0]) for row in rows])
+            return rows
+        return [{"id": outbox_id, "idempotency_key": key, "user_id": user_id,
+                 "reminder_time": parse_datetime(reminder_time), "subject": subject, "message": message,
+                 "next_drink_time": parse_datetime(next_drink_time), "attempts": attempts}
+                for outbox_id, key, user_id, reminder_time, subject, message, next_drink_time, attempts
+                in self._write(claim)]
+
+    def complete_reminders(self, worker_id, outbox_ids, hydration_rows, sent_at):
+        outbox_ids = list(outbox_ids)
+        if not outbox_ids:
+            return []
+
+        def complete(conn):
+            completed, rows = [], []
+            for outbox_id, row in zip(outbox_ids, hydration_rows):
+                # Only rows still leased to this worker; another may have claimed one whose lease ran out
+                if conn.execute("""
+                UPDATE reminder_outbox SET status = 'sent', sent_at = ?
+                WHERE id = ? AND status = 'sending' AND claimed_by = ?
+                """, (sent_at, outbox_id, worker_id)).rowcount:
+                    completed.append(outbox_id)
+                    rows.append(row)
+            if rows:
+                self._insert_hydration_logs(conn, dedupe_by_minute(rows))
+            return completed
+        return self._write(complete)
+
+    def release_reminders(self, worker_id, outbox_ids, available_at, max_attempts):
+        outbox_ids = list(outbox_ids)
+        if not outbox_ids:
+            return 0
+
+        def release(conn):
+            conn.executemany("""
+            UPDATE reminder_outbox
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END, available_at = ?, claimed_by = NULL
+            WHERE id = ? AND status = 'sending' AND claimed_by = ?
+            """, [(max_attempts, available_at, outbox_id, worker_id) for outbox_id in outbox_ids])
+            return sum(conn.execute("SELECT status = 'failed' FROM reminder_outbox WHERE id = ?",
+                                    (outbox_id,)).fetchone()[0] for outbox_id in outbox_ids)
+        return self._write(release)
+
+    def purge_reminder_outbox(self, before, limit):
+        return self._write(lambda conn: conn.execute("""
+        DELETE FROM reminder_outbox
+        WHERE id IN (
+            SELECT id FROM reminder_outbox
+            WHERE status IN ('sent', 'failed') AND reminder_time < ?
+            ORDER BY reminder_time
+            LIMIT ?
+        )
+        """, (before, limit)).rowcount)
+
+    def export_hydration_logs(self, start, end, chunk_size):
+        where, params = export_where("?", start, end)
+        statements = [(f"SELECT id, user_id, date_time, is_drunk, status FROM {table} WHERE {where}", params)
+                      for table in ("hydration_logs", "hydration_logs_archive")]
+        if self.path == ":memory:":
+            # Every connection to :memory: is a separate database, so read through the writer
+            rows = self._write(lambda conn: [row for sql, params in statements for row in conn.execute(sql, params)])
+            for i in range(0, len(rows), chunk_size):
+                yield export_rows(rows[i:i + chunk_size])
+            return
+
+        # A connection of its own, so the read transaction that keeps both tables on one snapshot
+        # does not hold this thread's read connection for the whole export
+        conn = self._connect()
+        try:
+            conn.execute("PRAGMA query_only = ON")
+            conn.execute("BEGIN")
+            for sql, params in statements:
+                cursor = conn.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(chunk_size)
+                    if not rows:
+                        break
+                    yield export_rows(rows)
+            conn.execute("COMMIT")
+        except sqlite3.Error as err:
+            raise StorageError(str(err)) from err
+        finally:
+            conn.close()
+
+    def stats(self):
+        with self._readers_lock:
+            readers = len(self._readers)
+        size = readers + (1 if self._writer is not None else 0)
+        return dict(self._stats, pending_writes=self._writes.qsize(), size=size)
+
+    # Finish queued writes, then close every connection
+    def close(self):
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            self._writes.put(None)
+            writer.join()
+        with self._readers_lock:
+            readers, self._readers = self._readers, []
+        for conn in readers:
+            conn.close()
+        self._local = threading.local()
+
+    # {template_hash: id} for templates, inserting the ones not stored yet, inside a write
+    def _template_ids(self, conn, templates):
+        template_ids = self.email_templates.lookup(templates)
+        for template_hash, subject, body in templates.values():
+            if template_hash not in template_ids:
+                conn.execute(INSERT_EMAIL_TEMPLATES_SQL, (template_hash, subject, body))
+                template_ids[template_hash] = conn.execute("""
+                SELECT id FROM email_templates WHERE template_hash = ?
+                """, (template_hash,)).fetchone()[0]
+        return template_ids
+
+    # Update the hydration logs matching a WHERE clause, and their rollups, inside a write
+    def _update_where(self, conn, where, params, is_drunk, status):
+        groups = conn.execute(f"""
+        SELECT user_id, date(date_time), COUNT(*), COALESCE(SUM(is_drunk), 0)
+        FROM hydration_logs
+        WHERE {where}
+        GROUP BY user_id, date(date_time)
+        """, params).fetchall()
+        if not groups:
+            return 0
+        conn.execute(f"""
+        UPDATE hydration_logs
+        SET is_drunk = ?, status = ?
+        WHERE {where}
+        """, (is_drunk, status, *params))
+        groups = [(user_id, date.fromisoformat(day), count, drunk) for user_id, day, count, drunk in groups]
+        self._apply_deltas(conn, rollups.confirmation_deltas(groups, is_drunk))
+        return sum(group[2] for group in groups)
+
+    @staticmethod
+    def _apply_deltas(conn, deltas):
+        if not deltas:
+            return
+        daily, weekly = rollups.delta_params(deltas)
+        conn.executemany(DAILY_DELTA_SQL, daily)
+        conn.executemany(WEEKLY_DELTA_SQL, weekly)
@@ -0,0 +1,303 @@
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import time
+from datetime import date, datetime, timedelta
+from dotenv import load_dotenv
+from utils.metrics import registry
+from utils.user_settings import DEFAULT_SETTINGS
+
+logger = logging.getLogger(__name__)
+
+# Load environment variables
+load_dotenv()
+
+# Analytics Export Configuration
+ANALYTICS_EXPORT_DIR = os.getenv("ANALYTICS_EXPORT_DIR", "data/analytics")
+ANALYTICS_EXPORT_FORMAT = os.getenv("ANALYTICS_EXPORT_FORMAT", "auto")  # "parquet" (pyarrow), "npz" (numpy) or "auto"
+ANALYTICS_CHUNK_SIZE = int(os.getenv("ANALYTICS_CHUNK_SIZE", 50000))  # rows streamed per chunk, one file each
+ANALYTICS_SETTLE_DAYS = int(os.getenv("ANALYTICS_SETTLE_DAYS", 1))  # recent days not exported yet, so answers land first
+ANALYTICS_PENDING_DAYS = int(os.getenv("ANALYTICS_PENDING_DAYS", 7))  # days an unanswered reminder holds the export back
+ANALYTICS_DB_HOST = os.getenv("ANALYTICS_DB_HOST", "")  # MySQL replica to export from; empty reads the primary
+
+BOTTLE_VOLUME = DEFAULT_SETTINGS["bottle_volume"]  # liters; reports use the built-in defaults, not per-user settings
+DAILY_GOAL = DEFAULT_SETTINGS["daily_goal"]  # liters
+PERIODS = ("daily", "weekly", "monthly")
+
+# Status codes stored in the exported files; any other status is stored as -1
+STATUSES = ("pending", "completed", "skipped")
+STATUS_CODES = {status: code for code, status in enumerate(STATUSES)}
+
+COLUMNS = ("id", "user_id", "date_time", "is_drunk", "status")
+PART_PREFIX = "hydration_logs-"
+WATERMARK_FILE = "watermark.json"
+USER_SHIFT = 20  # period keys are user_id << USER_SHIFT | days since 1970-01-01
+
+# Metrics
+EXPORTED_ROWS = registry.counter("hydration_analytics_exported_rows_total", "Hydration log rows exported for analytics")
+
+
+# "parquet" when pyarrow is installed, else "npz" when numpy is
+def export_format(fmt=ANALYTICS_EXPORT_FORMAT):
+    if fmt != "auto":
+        return fmt
+    if importlib.util.find_spec("pyarrow") is not None:
+        return "parquet"
+    if importlib.util.find_spec("numpy") is not None:
+        return "npz"
+    raise RuntimeError("Analytics export needs pyarrow or numpy: pip install pyarrow")
+
+
+# Storage to export from: a dedicated MySQL connection to the replica when one is configured
+def open_export_storage():
+    from utils.db_utils import DB_CONFIG, STORAGE_BACKEND, storage
+
+    if not ANALYTICS_DB_HOST or STORAGE_BACKEND != "mysql":
+        return storage
+    from storage.base import create_storage
+
+    return create_storage("mysql", config={**DB_CONFIG, "host": ANALYTICS_DB_HOST}, pool_size=1)
+
+
+# End of everything exported so far, or None before the first export
+def read_watermark(directory):
+    try:
+        with open(os.path.join(directory, WATERMARK_FILE)) as f:
+            return datetime.fromisoformat(json.load(f)["hydration_logs"])
+    except FileNotFoundError:
+        return None
+
+
+def write_watermark(directory, end):
+    path = os.path.join(directory, WATERMARK_FILE)
+    with open(path + ".tmp", "w") as f:
+        json.dump({"hydration_logs": end.isoformat()}, f)
+    os.replace(path + ".tmp", path)
+
+
+# Where an export up to end has to stop so that it only writes answered logs: at the earliest reminder
+# sent since start that is still pending. Reminders left unanswered for pending_days no longer hold it
+# back and are exported as pending.
+def export_end(storage, start, end, pending_days=ANALYTICS_PENDING_DAYS, now=None):
+    cutoff = (now or datetime.now()) - timedelta(days=pending_days)
+    pending = storage.get_pending_hydration_logs(after=(max(start, cutoff) if start else cutoff, 0), limit=1)
+    if pending and pending[0]["date_time"] < end:
+        return pending[0]["date_time"]
+    return end
+
+
+# Part files are named after their export window, so re-running an interrupted export replaces them
+def part_prefix(start, end):
+    return f"{PART_PREFIX}{start:%Y%m%d%H%M%S}-{end:%Y%m%d%H%M%S}-" if start else f"{PART_PREFIX}0-{end:%Y%m%d%H%M%S}-"
+
+
+# Columns of one chunk of (id, user_id, date_time, is_drunk, status) rows
+def chunk_columns(rows):
+    ids, user_ids, times, drunk, statuses = zip(*rows)
+    return {"id": ids, "user_id": user_ids, "date_time": times, "is_drunk": drunk,
+            "status": [STATUS_CODES.get(status, -1) for status in statuses]}
+
+
+def write_part(path, columns, fmt):
+    if fmt == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        table = pa.table({
+            "id": pa.array(columns["id"], pa.int64()),
+            "user_id": pa.array(columns["user_id"], pa.int32()),
+            "date_time": pa.array(columns["date_time"], pa.timestamp("us")),
+            "is_drunk": pa.array(columns["is_drunk"], pa.bool_()),
+            "status": pa.array(columns["status"], pa.int8()),
+        })
+        pq.write_table(table, path + ".tmp", compression="zstd")
+    else:
+        import numpy as np
+
+        with open(path + ".tmp", "wb") as f:
+            np.savez_compressed(
+                f,
+                id=np.array(columns["id"], dtype=np.int64),
+                user_id=np.array(columns["user_id"], dtype=np.int32),
+                date_time=np.array(columns["date_time"], dtype="datetime64[us]"),
+                is_drunk=np.array(columns["is_drunk"], dtype=np.bool_),
+                status=np.array(columns["status"], dtype=np.int8),
+            )
+    os.replace(path + ".tmp", path)
+
+
+def read_part(path):
+    if path.endswith(".parquet"):
+        import pyarrow.parquet as pq
+
+        table = pq.read_table(path, columns=list(COLUMNS))
+        return {column: table.column(column).to_numpy() for column in COLUMNS}
+    import numpy as np
+
+    with np.load(path) as part:
+        return {column: part[column] for column in COLUMNS}
+
+
+# Export the hydration logs written since the last export, up to midnight ANALYTICS_SETTLE_DAYS ago, as
+# columnar part files of chunk_size rows. Exported rows are never rewritten, so the export stops at the
+# first reminder still waiting for an answer (see export_end) and resumes there once it is answered.
+# The logs are streamed from the database a chunk at a time and the watermark moves only once every
+# part is written, so an interrupted export is redone from the start.
+def export_hydration_logs(storage=None, directory=ANALYTICS_EXPORT_DIR, until=None, fmt=ANALYTICS_EXPORT_FORMAT,
+                          chunk_size=ANALYTICS_CHUNK_SIZE, pending_days=ANALYTICS_PENDING_DAYS):
+    fmt = export_format(fmt)
+    storage = storage or open_export_storage()
+    os.makedirs(directory, exist_ok=True)
+    start = read_watermark(directory)
+    until = until or datetime.combine(date.today() - timedelta(days=ANALYTICS_SETTLE_DAYS), datetime.min.time())
+    end = export_end(storage, start, until, pending_days)
+    summary = {"start": start, "end": end, "format": fmt, "rows": 0, "files": 0}
+    if end < until:
+        logger.info("Analytics export held back to %s by a reminder still waiting for an answer.", end)
+    if start is not None and end <= start:
+        return summary
+
+    started = time.perf_counter()
+    prefix = part_prefix(start, end)
+    # Parts left behind by an interrupted run of this window
+    for name in os.listdir(directory):
+        if name.startswith(prefix):
+            os.remove(os.path.join(directory, name))
+    for rows in storage.export_hydration_logs(start, end, chunk_size):
+        write_part(os.path.join(directory, f"{prefix}{summary['files']:05d}.{fmt}"), chunk_columns(rows), fmt)
+        summary["rows"] += len(rows)
+        summary["files"] += 1
+    write_watermark(directory, end)
+
+    EXPORTED_ROWS.inc(summary["rows"])
+    summary["seconds"] = time.perf_counter() - started
+    logger.info("Exported %s hydration logs from %s to %s in %s file(s).", summary["rows"], start or "the start",
+                end, summary["files"])
+    return summary
+
+
+# Yield the exported logs one part file at a time as numpy arrays, filtered to start <= date_time < end and user_ids
+def read_hydration_logs(directory=ANALYTICS_EXPORT_DIR, start=None, end=None, user_ids=None):
+    import numpy as np
+
+    for name in sorted(os.listdir(directory)):
+        if not name.startswith(PART_PREFIX) or not name.endswith((".parquet", ".npz")):
+            continue
+        logs = read_part(os.path.join(directory, name))
+        mask = np.ones(len(logs["id"]), dtype=np.bool_)
+        if start is not None:
+            mask &= logs["date_time"] >= np.datetime64(start, "us")
+        if end is not None:
+            mask &= logs["date_time"] < np.datetime64(end, "us")
+        if user_ids is not None:
+            mask &= np.isin(logs["user_id"], list(user_ids))
+        if not mask.all():
+            logs = {column: values[mask] for column, values in logs.items()}
+        if len(logs["id"]):
+            yield logs
+
+
+# First day of the period each time falls in; weeks start on Monday
+def period_starts(times, period):
+    import numpy as np
+
+    days = times.astype("datetime64[D]")
+    if period == "daily":
+        return days
+    if period == "weekly":
+        return days - (days.astype(np.int64) + 3) % 7  # 1970-01-01 was a Thursday
+    return times.astype("datetime64[M]").astype("datetime64[D]")
+
+
+# Reminders and bottles drunk per user and period, sorted by user and period. Every part is reduced
+# on its own and the partial totals are merged, so memory follows the number of user periods, not logs.
+def period_totals(parts, period="daily"):
+    import numpy as np
+
+    keys, reminders, drunk = [], [], []
+    for logs in parts:
+        days = period_starts(logs["date_time"], period).astype(np.int64)
+        part_keys, inverse = np.unique(logs["user_id"].astype(np.int64) << USER_SHIFT | days, return_inverse=True)
+        keys.append(part_keys)
+        reminders.append(np.bincount(inverse, minlength=len(part_keys)))
+        drunk.append(np.bincount(inverse, weights=logs["is_drunk"], minlength=len(part_keys)).astype(np.int64))
+    if not keys:
+        keys, reminders, drunk = [[np.zeros(0, dtype=np.int64)]] * 3
+    merged, inverse = np.unique(np.concatenate(keys), return_inverse=True)
+    return {
+        "user_id": merged >> USER_SHIFT,
+        "period_start": (merged & ((1 << USER_SHIFT) - 1)).astype("datetime64[D]"),
+        "reminders": np.bincount(inverse, weights=np.concatenate(reminders), minlength=len(merged)).astype(np.int64),
+        "bottles_drunk": np.bincount(inverse, weights=np.concatenate(drunk), minlength=len(merged)).astype(np.int64),
+    }
+
+
+# Per-user intake over the periods with at least one reminder: liters drunk in total and per period
+# (mean, median, max), the share of reminders answered by drinking and the periods that met the goal
+def intake_statistics(totals, period="daily", daily_goal=DAILY_GOAL, bottle_volume=BOTTLE_VOLUME):
+    import numpy as np
+
+    liters = totals["bottles_drunk"] * bottle_volume
+    if period == "monthly":
+        period_days = ((totals["period_start"].astype("datetime64[M]") + 1).astype("datetime64[D]")
+                       - totals["period_start"]).astype(np.int64)
+    else:
+        period_days = 7 if period == "weekly" else 1
+    goal_met = liters >= daily_goal * period_days
+
+    # Totals are sorted by user, so each user's periods are one contiguous run
+    user_ids, first, periods = np.unique(totals["user_id"], return_index=True, return_counts=True)
+    if not len(user_ids):
+        return {}
+    reminders = np.add.reduceat(totals["reminders"], first)
+    bottles_drunk = np.add.reduceat(totals["bottles_drunk"], first)
+    sorted_liters = liters[np.lexsort((liters, totals["user_id"]))]
+    return {
+        "user_id": user_ids,
+        "periods": periods,
+        "reminders": reminders,
+        "bottles_drunk": bottles_drunk,
+        "liters": bottles_drunk * bottle_volume,
+        "mean_liters": bottles_drunk * bottle_volume / periods,
+        "median_liters": (sorted_liters[first + (periods - 1) // 2] + sorted_liters[first + periods // 2]) / 2,
+        "max_liters": np.maximum.reduceat(liters, first),
+        "drink_rate": bottles_drunk / reminders,
+        "goal_met_periods": np.add.reduceat(goal_met.astype(np.int64), first),
+    }
+
+
+# One JSON-ready dict per user
+def statistics_records(statistics):
+    columns = list(statistics)
+    return [dict(zip(columns, (value.item() for value in values)))
+            for values in zip(*(statistics[column] for column in columns))]
+
+
+# Intake statistics per user from the exported logs, without touching the database
+def hydration_report(period="daily", directory=ANALYTICS_EXPORT_DIR, start=None, end=None, user_ids=None):
+    totals = period_totals(read_hydration_logs(directory, start, end, user_ids), period)
+    return statistics_records(intake_statistics(totals, period))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export hydration logs and report intake statistics from the export")
+    parser.add_argument("--directory", default=ANALYTICS_EXPORT_DIR)
+    commands = parser.add_subparsers(dest="command", required=True)
+    export = commands.add_parser("export", help="export the logs written since the last export")
+    export.add_argument("--format", choices=["auto", "parquet", "npz"], default=ANALYTICS_EXPORT_FORMAT)
+    export.add_argument("--until", type=date.fromisoformat, help="export up to this date (default: settled days)")
+    report = commands.add_parser("report", help="per-user intake statistics from the exported logs")
+    report.add_argument("--period", choices=PERIODS, default="daily")
+    report.add_argument("--start", type=date.fromisoformat)
+    report.add_argument("--end", type=date.fromisoformat, help="exclusive")
+    report.add_argument("--user", type=int, action="append", help="repeat for several users (default: all)")
+    args = parser.parse_args()
+
+    if args.command == "export":
+        until = datetime.combine(args.until, datetime.min.time()) if args.until else None
+        print(json.dumps(export_hydration_logs(directory=args.directory, until=until, fmt=args.format),
+                         indent=2, default=str))
+    else:
+        print(json.dumps(hydration_report(args.period, args.directory, args.start, args.end, args.user), indent=2))
@@ -0,0 +1,275 @@
+import asyncio
+import logging
+import os
+from datetime import datetime, timedelta
+from storage.base import StorageError, EmailTemplateCache
+from storage.mysql_storage import (
+    last_reminder_times_plan, load_user_state_plan, insert_hydration_logs_plan, insert_email_logs_plan,
+    answer_latest_pending_plan, set_statuses_plan, enqueue_reminders_plan, claim_reminders_plan,
+    complete_reminders_plan, release_reminders_plan, record_weekly_goals_plan,
+)
+from utils.db_utils import (
+    DB_CONFIG, DEFAULT_USER_ID, LOG_BUFFER_SIZE, LOG_BUFFER_FLUSH_INTERVAL, STORAGE_BACKEND, DB_QUERY_SECONDS,
+    REMINDERS_CONFIRMED, OUTBOX_WORKER_ID, OUTBOX_BATCH_SIZE, OUTBOX_LEASE_SECONDS, OUTBOX_MAX_ATTEMPTS,
+    OUTBOX_RETRY_DELAY, weekly_goals_params, record_enqueued, user_state_cache, user_settings,
+)
+from utils.metrics import timed
+from utils.state_cache import UserState
+
+logger = logging.getLogger(__name__)
+
+# Async Connection Pool Configuration
+ASYNC_DB_POOL_SIZE = int(os.getenv("ASYNC_DB_POOL_SIZE", 10))
+
+
+# The asyncio counterpart of the db_utils API, backed by an aiomysql pool.
+# Writes are buffered in memory and flushed as batches by a background task,
+# and share their statement plans and the user state cache with the threaded runtime.
+class AsyncDatabase:
+    def __init__(self, config=DB_CONFIG, pool_size=ASYNC_DB_POOL_SIZE, buffer_size=LOG_BUFFER_SIZE,
+                 flush_interval=LOG_BUFFER_FLUSH_INTERVAL):
+        self.config = config
+        self.pool_size = pool_size
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self._pool = None
+        self._hydration_rows = []
+        self._email_rows = []
+        self._flush_lock = None
+        self._flush_task = None
+        self._wakeup = None
+        self.outbox_ready = None  # set whenever new reminders reach the outbox
+        self.email_templates = EmailTemplateCache()
+
+    async def open(self):
+        if STORAGE_BACKEND != "mysql":
+            raise StorageError(f"The async runtime needs STORAGE_BACKEND=mysql, not {STORAGE_BACKEND}")
+        import aiomysql
+
+        self._pool = await aiomysql.create_pool(
+            host=self.config["host"],
+            port=self.config["port"],
+            user=self.config["user"],
+            password=self.config["password"],
+            db=self.config["database"],
+            maxsize=self.pool_size,
+            autocommit=False,
+        )
+        self._flush_lock = asyncio.Lock()
+        self._wakeup = asyncio.Event()
+        self.outbox_ready = asyncio.Event()
+        self._flush_task = asyncio.create_task(self._flush_periodically())
+
+    # Write out buffered rows and close every connection
+    async def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            try:
+                await self._flush_task
+            except asyncio.CancelledError:
+                pass
+            self._flush_task = None
+        await self.flush()
+        if self._pool is not None:
+            self._pool.close()
+            await self._pool.wait_closed()
+            self._pool = None
+
+    # Get the last hydration and email log times of every tracked user in one query
+    @timed(DB_QUERY_SECONDS, function="get_last_reminder_times")
+    async def get_last_reminder_times(self):
+        reminder_times = await self._run(last_reminder_times_plan())
+        reminder_times.setdefault(DEFAULT_USER_ID, (None, None))
+        return reminder_times
+
+    # Seed the shared user state cache and return the seeded times
+    async def seed_user_state_cache(self):
+        reminder_times = await self.get_last_reminder_times()
+        user_state_cache.seed(reminder_times)
+        logger.info("User state cache seeded for %s user(s).", len(user_state_cache))
+        return reminder_times
+
+    # A user's cached log state; a miss is loaded through the pool, so it never blocks the loop
+    async def get_user_state(self, user_id=DEFAULT_USER_ID):
+        state = user_state_cache.lookup(user_id)
+        if state is None:
+            state = user_state_cache.add(user_id, await self.load_user_state(user_id))
+        return state
+
+    # Load one user's log state on a cache miss
+    @timed(DB_QUERY_SECONDS, function="load_user_state")
+    async def load_user_state(self, user_id):
+        try:
+            # Buffered rows are not visible to the query until they are flushed
+            await self.flush()
+            return UserState(*await self._run(load_user_state_plan(user_id)))
+        except Exception as e:
+            logger.error("Error loading log state for user %s: %s", user_id, e)
+            return UserState()
+
+    # Log a hydration reminder, or answer the user's latest pending one when update_pending is set
+    async def log_hydration_reminder(self, is_drunk, status='pending', log_time=None, update_pending=False,
+                                     user_id=DEFAULT_USER_ID):
+        now = log_time if log_time else datetime.now()
+        if not update_pending:
+            self._hydration_rows.append((user_id, now, user_settings.rules(user_id).bottle_volume, is_drunk, status))
+            user_state_cache.record_hydration(user_id, now)
+            logger.info("Hydration reminder logged: %s, Drunk: %s, Status: %s", now, is_drunk, status)
+            self._maybe_wake()
+            return
+
+        # The pending entry may still be buffered, so write it out before updating it
+        await self.flush()
+        await self._answer_latest_pending(user_id, is_drunk, status)
+        logger.info("Hydration reminder logged: %s, Drunk: %s, Status: %s", now, is_drunk, status)
+
+    # Answer a user's latest pending hydration log
+    @timed(DB_QUERY_SECONDS, function="answer_latest_pending")
+    async def _answer_latest_pending(self, user_id, is_drunk, status):
+        updated = await self._run(answer_latest_pending_plan(user_id, is_drunk, status))
+        REMINDERS_CONFIRMED.labels(status).inc(updated)
+        return updated
+
+    # Update the status of several hydration logs in one transaction
+    @timed(DB_QUERY_SECONDS, function="update_hydration_log_statuses")
+    async def update_hydration_log_statuses(self, log_ids, is_drunk, status):
+        log_ids = list(log_ids)
+        if not log_ids:
+            return 0
+        await self.flush()
+        updated = await self._run(set_statuses_plan(log_ids, is_drunk, status))
+        REMINDERS_CONFIRMED.labels(status).inc(updated)
+        logger.info("%s hydration log(s) updated to %s.", updated, status)
+        return updated
+
+    # Log email status
+    async def log_email_status(self, subject, message, success, error_message=None, user_id=DEFAULT_USER_ID):
+        now = datetime.now()
+        self._email_rows.append((user_id, now, subject, message, success, error_message))
+        user_state_cache.record_email(user_id, now)
+        logger.info("Email log: %s, Success: %s, Error: %s", subject, success, error_message)
+        self._maybe_wake()
+
+    # Queue a reminder in the outbox under an idempotency key for its user and slot, committed before this
+    # returns; see db_utils.enqueue_reminder
+    @timed(DB_QUERY_SECONDS, function="enqueue_reminder")
+    async def enqueue_reminder(self, idempotency_key, user_id, reminder_time, subject, message, next_drink_time=None):
+        try:
+            queued = await self._run(enqueue_reminders_plan([(idempotency_key, user_id, reminder_time, subject,
+                                                              message, next_drink_time, reminder_time)]))
+        except Exception as e:
+            logger.error("Error queuing a reminder for user %s in the outbox: %s", user_id, e)
+            return False
+        record_enqueued(user_id, reminder_time, queued)
+        self.outbox_ready.set()
+        return True
+
+    # Lease up to limit outbox reminders that are due to this process
+    @timed(DB_QUERY_SECONDS, function="claim_reminders")
+    async def claim_reminders(self, limit=OUTBOX_BATCH_SIZE):
+        return await self._run(claim_reminders_plan(OUTBOX_WORKER_ID, datetime.now(), OUTBOX_LEASE_SECONDS, limit,
+                                                    OUTBOX_MAX_ATTEMPTS))
+
+    # Mark delivered outbox reminders still leased to this process sent and log them as pending hydration
+    # reminders in one transaction; returns the reminders completed
+    @timed(DB_QUERY_SECONDS, function="complete_reminders")
+    async def complete_reminders(self, reminders):
+        completed = set(await self._run(complete_reminders_plan(
+            OUTBOX_WORKER_ID, [reminder["id"] for reminder in reminders],
+            [(reminder["user_id"], reminder["reminder_time"], user_settings.rules(reminder["user_id"]).bottle_volume,
+              False, 'pending') for reminder in reminders], datetime.now())))
+        if len(completed) < len(reminders):
+            logger.warning("%s outbox reminder(s) were claimed by another worker after their lease ran out.",
+                           len(reminders) - len(completed))
+        return [reminder for reminder in reminders if reminder["id"] in completed]
+
+    # Put undelivered outbox reminders back for a retry; returns how many ran out of attempts
+    @timed(DB_QUERY_SECONDS, function="release_reminders")
+    async def release_reminders(self, reminders):
+        return await self._run(release_reminders_plan(
+            OUTBOX_WORKER_ID, [reminder["id"] for reminder in reminders],
+            datetime.now() + timedelta(seconds=OUTBOX_RETRY_DELAY), OUTBOX_MAX_ATTEMPTS))
+
+    # Check and log every user's weekly goal in one statement
+    @timed(DB_QUERY_SECONDS, function="check_weekly_goals")
+    async def check_weekly_goals(self, today=None):
+        await self.flush()
+        start_of_week, (is_prize_day, daily_goal, bottle_volume, _) = weekly_goals_params(today or datetime.now())
+        await self._run(record_weekly_goals_plan(start_of_week, daily_goal, bottle_volume, is_prize_day))
+        logger.info("Weekly goals recorded for the week of %s.", start_of_week)
+
+    # Write out every buffered row
+    async def flush(self):
+        if self._pool is None:
+            return
+        async with self._flush_lock:
+            hydration_rows, self._hydration_rows = self._hydration_rows, []
+            email_rows, self._email_rows = self._email_rows, []
+            try:
+                if hydration_rows:
+                    await self._flush_hydration_logs(hydration_rows)
+                    hydration_rows = []
+                if email_rows:
+                    await self._flush_email_logs(email_rows)
+            except Exception:
+                # Keep the rows for the next attempt
+                self._hydration_rows[:0] = hydration_rows
+                self._email_rows[:0] = email_rows
+                raise
+
+    @timed(DB_QUERY_SECONDS, function="flush_hydration_logs")
+    async def _flush_hydration_logs(self, rows):
+        inserted = await self._run(insert_hydration_logs_plan(rows))
+        logger.debug("Flushed %s of %s buffered hydration logs.", inserted, len(rows))
+
+    @timed(DB_QUERY_SECONDS, function="flush_email_logs")
+    async def _flush_email_logs(self, rows):
+        self.email_templates.update(await self._run(insert_email_logs_plan(self.email_templates, rows)))
+        logger.debug("Flushed %s buffered email logs.", len(rows))
+
+    # Run a statement plan from storage/mysql_storage.py in one transaction
+    async def _run(self, plan):
+        async with self._pool.acquire() as conn:
+            async with conn.cursor() as cursor:
+                try:
+                    step = next(plan)
+                    while True:
+                        try:
+                            result = await self._run_step(cursor, *step)
+                        except Exception as err:
+                            step = plan.throw(err)
+                        else:
+                            step = plan.send(result)
+                except StopIteration as stop:
+                    result = stop.value
+            await conn.commit()
+        return result
+
+    @staticmethod
+    async def _run_step(cursor, method, sql, params):
+        if method == "executemany":
+            await cursor.executemany(sql, params)
+            return cursor.rowcount
+        await cursor.execute(sql, params)
+        if method == "fetchall":
+            return await cursor.fetchall()
+        if method == "fetchone":
+            return await cursor.fetchone()
+        return cursor.rowcount
+
+    def _maybe_wake(self):
+        if self._wakeup is not None and len(self._hydration_rows) + len(self._email_rows) >= self.buffer_size:
+            self._wakeup.set()
+
+    async def _flush_periodically(self):
+        while True:
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wakeup.clear()
+            try:
+                await self.flush()
+            except Exception as e:
+                logger.error("Error flushing buffered logs: %s", e)
+                await asyncio.sleep(self.flush_interval)
@@ -0,0 +1,186 @@
+import logging
+import threading
+import time
+from collections import deque
+
+logger = logging.getLogger(__name__)
+
+
+class PoolTimeoutError(Exception):
+    pass
+
+
+# Connection borrowed from the pool; returns itself to the pool on close/exit
+class PooledConnection:
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+
+    def __getattr__(self, name):
+        if self._conn is None:
+            raise AttributeError(f"Connection already returned to the pool: {name}")
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        if self._conn is not None:
+            conn, self._conn = self._conn, None
+            self._pool.release(conn)
+
+
+# Bounded pool of reusable database connections
+class ConnectionPool:
+    def __init__(self, factory, max_size=5, timeout=10, idle_timeout=300, health_check_interval=30,
+                 health_check=None):
+        self.factory = factory
+        self.max_size = max_size
+        self.timeout = timeout
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.health_check = health_check or (lambda conn: conn.is_connected())
+
+        self._idle = deque()  # (conn, last_used), oldest on the left
+        self._size = 0
+        self._cond = threading.Condition()
+        self._stats = {
+            "hits": 0,
+            "misses": 0,
+            "timeouts": 0,
+            "waits": 0,
+            "wait_time_total": 0.0,
+            "wait_time_max": 0.0,
+            "evicted_idle": 0,
+            "evicted_unhealthy": 0,
+        }
+
+    # Borrow a connection, reusing an idle one when possible. Connections are only picked under the
+    # lock; health checks, closes and opens run outside it so other borrowers are not blocked.
+    def acquire(self):
+        start = time.monotonic()
+        deadline = start + self.timeout
+        waited = False
+
+        while True:
+            with self._cond:
+                while True:
+                    expired = self._evict_idle()
+                    if self._idle or self._size < self.max_size:
+                        break
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._stats["timeouts"] += 1
+                        raise PoolTimeoutError(f"Timed out after {self.timeout}s waiting for a database connection.")
+                    waited = True
+                    self._cond.wait(remaining)
+
+                conn = None
+                if self._idle:
+                    conn, last_used = self._idle.pop()
+                else:
+                    self._size += 1
+                    self._stats["misses"] += 1
+                    self._record_wait(start, waited)
+            self._close(expired)
+
+            if conn is None:
+                break
+            if time.monotonic() - last_used >= self.health_check_interval and not self._is_healthy(conn):
+                with self._cond:
+                    self._discard(conn)
+                    self._stats["evicted_unhealthy"] += 1
+                self._close([conn])
+                continue
+            with self._cond:
+                self._stats["hits"] += 1
+                self._record_wait(start, waited)
+            return PooledConnection(self, conn)
+
+        # Open the new connection outside the lock too
+        try:
+            conn = self.factory()
+        except Exception:
+            with self._cond:
+                self._size -= 1
+                self._cond.notify()
+            raise
+        return PooledConnection(self, conn)
+
+    # Return a connection to the pool, dropping it if it is no longer usable
+    def release(self, conn):
+        try:
+            if getattr(conn, "in_transaction", False):
+                conn.rollback()
+        except Exception as e:
+            logger.warning("Discarding pooled connection after failed rollback: %s", e)
+            with self._cond:
+                self._discard(conn)
+            self._close([conn])
+            return
+
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    # Close every idle connection
+    def close_all(self):
+        with self._cond:
+            idle = [conn for conn, _ in self._idle]
+            self._idle.clear()
+            for conn in idle:
+                self._discard(conn)
+            self._cond.notify_all()
+        self._close(idle)
+
+    def stats(self):
+        with self._cond:
+            stats = dict(self._stats)
+            stats["size"] = self._size
+            stats["idle"] = len(self._idle)
+            stats["in_use"] = self._size - len(self._idle)
+            requests = stats["hits"] + stats["misses"]
+            stats["hit_ratio"] = stats["hits"] / requests if requests else 0.0
+            stats["wait_time_avg"] = stats["wait_time_total"] / stats["waits"] if stats["waits"] else 0.0
+            return stats
+
+    # Drop idle connections past idle_timeout and return them, to be closed outside the lock
+    def _evict_idle(self):
+        now = time.monotonic()
+        expired = []
+        while self._idle and now - self._idle[0][1] >= self.idle_timeout:
+            conn, _ = self._idle.popleft()
+            self._discard(conn)
+            self._stats["evicted_idle"] += 1
+            expired.append(conn)
+        return expired
+
+    def _is_healthy(self, conn):
+        try:
+            return self.health_check(conn)
+        except Exception:
+            return False
+
+    # Stop counting a connection against max_size; the caller closes it after releasing the lock
+    def _discard(self, conn):
+        self._size -= 1
+        self._cond.notify()
+
+    @staticmethod
+    def _close(conns):
+        for conn in conns:
+            try:
+                conn.close()
+            except Exception as e:
+                logger.debug("Error closing pooled connection: %s", e)
+
+    def _record_wait(self, start, waited):
+        if not waited:
+            return
+        wait_time = time.monotonic() - start
+        self._stats["waits"] += 1
+        self._stats["wait_time_total"] += wait_time
+        self._stats["wait_time_max"] = max(self._stats["wait_time_max"], wait_time)
@@ -1,17 +1,28 @@
-import mysql.connector
 import logging
 from datetime import datetime, timedelta
 from dotenv import load_dotenv
 import os
-import smtplib
-import tkinter as tk
-from tkinter import messagebox
+import socket
 import threading
-import sys
+from storage.base import StorageError, create_storage
+from utils.write_buffer import WriteBehindBuffer
+from utils.log_archiver import LogArchiver
+from utils import rollups
+from utils.state_cache import UserStateCache, UserState
+from utils.user_settings import DEFAULT_SETTINGS, DEFAULTS_USER_ID, UserSettingsCache, compile_rules
+from utils.metrics import registry, timed
+import atexit
+
+logger = logging.getLogger(__name__)
 
 # Load environment variables
 load_dotenv()
 
+# Storage Backend Configuration
+STORAGE_BACKEND = os.getenv("STORAGE_BACKEND", "mysql")  # "mysql" or "sqlite"
+SQLITE_PATH = os.getenv("SQLITE_PATH", "data/hydration.db")
+SQLITE_BUSY_TIMEOUT = float(os.getenv("SQLITE_BUSY_TIMEOUT", 5))  # seconds a reader waits for a locked database
+
 # Database Configuration
 DB_CONFIG = {
     "host": os.getenv("DB_HOST", "127.0.0.1"),
@@ -21,299 +32,515 @@ DB_CONFIG = {
     "database": os.getenv("DB_DATABASE", "hydration"),
 }
 
-# Email Configuration
-EMAIL = os.getenv("MAIL_USERNAME")
-PASSWORD = os.getenv("MAIL_PASSWORD")
-TO_EMAIL = os.getenv("MAIL_TO")
-MAIL_HOST = os.getenv("MAIL_HOST")
-MAIL_PORT = int(os.getenv("MAIL_PORT"))
-MAIL_ENCRYPTION = os.getenv("MAIL_ENCRYPTION")
+# User that owns reminders logged without an explicit user id
+DEFAULT_USER_ID = 1
 
-# Initialize DB Connection
-def db_connect():
-    try:
-        logging.debug("Attempting to connect to the database.")
-        return mysql.connector.connect(**DB_CONFIG)
-    except mysql.connector.Error as err:
-        logging.error(f"Error connecting to database: {err}")
-        sys.exit(1)
+# Connection Pool Configuration
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", 5))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", 10))  # seconds to wait for a free connection
+DB_POOL_IDLE_TIMEOUT = float(os.getenv("DB_POOL_IDLE_TIMEOUT", 300))  # seconds before an idle connection is closed
+DB_POOL_HEALTH_CHECK_INTERVAL = float(os.getenv("DB_POOL_HEALTH_CHECK_INTERVAL", 30))  # seconds idle before a ping
+
+# Write-Behind Log Buffer Configuration
+LOG_BUFFER_SIZE = int(os.getenv("LOG_BUFFER_SIZE", 100))  # rows pending before a flush
+LOG_BUFFER_FLUSH_INTERVAL = float(os.getenv("LOG_BUFFER_FLUSH_INTERVAL", 5))  # seconds between flushes
+
+# User State Cache Configuration
+STATE_CACHE_SIZE = int(os.getenv("STATE_CACHE_SIZE", 10000))  # users kept in memory
+
+# Bulk Update Configuration
+BULK_ID_LIST_LIMIT = int(os.getenv("BULK_ID_LIST_LIMIT", 1000))  # larger id sets are joined through a temp table
+PENDING_PAGE_SIZE = int(os.getenv("PENDING_PAGE_SIZE", 20))  # pending logs listed per CLI page
+
+# Log Retention Configuration; older logs move to the *_archive tables, 0 keeps them in the hot tables
+HYDRATION_LOG_RETENTION_DAYS = int(os.getenv("HYDRATION_LOG_RETENTION_DAYS", 90))
+EMAIL_LOG_RETENTION_DAYS = int(os.getenv("EMAIL_LOG_RETENTION_DAYS", 30))
+ARCHIVE_BATCH_SIZE = int(os.getenv("ARCHIVE_BATCH_SIZE", 500))  # rows moved per transaction
+ARCHIVE_BATCH_PAUSE = float(os.getenv("ARCHIVE_BATCH_PAUSE", 0.5))  # seconds between batches
+ARCHIVE_INTERVAL = float(os.getenv("ARCHIVE_INTERVAL", 3600))  # seconds between archive runs
+
+# Reminder Outbox Configuration
+OUTBOX_WORKER_ID = os.getenv("OUTBOX_WORKER_ID") or f"{socket.gethostname()}:{os.getpid()}"  # names this process's claims
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", 20))  # reminders claimed at once
+OUTBOX_LEASE_SECONDS = float(os.getenv("OUTBOX_LEASE_SECONDS", 300))  # claimed reminders are retried after this
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", 5))  # deliveries tried before a reminder is marked failed
+OUTBOX_RETRY_DELAY = float(os.getenv("OUTBOX_RETRY_DELAY", 60))  # seconds before an undelivered reminder is retried
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", 7))  # sent and failed reminders are purged after this
+
+# User Settings Configuration
+SETTINGS_RELOAD_INTERVAL = float(os.getenv("SETTINGS_RELOAD_INTERVAL", 30))  # seconds between settings change checks
+
+# Metrics
+DB_QUERY_SECONDS = registry.histogram("hydration_db_query_seconds", "Storage call latency by db_utils function",
+                                      labels=("function",))
+REMINDERS_CONFIRMED = registry.counter("hydration_reminders_confirmed_total",
+                                       "Hydration logs answered, by the status they were set to", labels=("status",))
+DB_CONNECTIONS = registry.gauge("hydration_db_connections", "Open storage connections by state", labels=("state",))
+LOG_BUFFER_PENDING = registry.gauge("hydration_log_buffer_pending", "Log rows buffered and not yet written")
+
+# Create the configured storage backend
+def open_storage(backend=STORAGE_BACKEND):
+    if backend == "sqlite":
+        return create_storage("sqlite", path=SQLITE_PATH, busy_timeout=SQLITE_BUSY_TIMEOUT)
+    return create_storage(
+        backend,
+        config=DB_CONFIG,
+        pool_size=DB_POOL_SIZE,
+        pool_timeout=DB_POOL_TIMEOUT,
+        idle_timeout=DB_POOL_IDLE_TIMEOUT,
+        health_check_interval=DB_POOL_HEALTH_CHECK_INTERVAL,
+        bulk_id_list_limit=BULK_ID_LIST_LIMIT,
+    )
+
+storage = open_storage()
+
+# Connection counts by state, read from the storage stats when /metrics is scraped
+def connection_counts():
+    stats = storage.stats()
+    counts = {("open",): stats.get("size", 0)}
+    for state in ("idle", "in_use"):
+        if state in stats:
+            counts[(state,)] = stats[state]
+    return counts
+
+DB_CONNECTIONS.set_function(connection_counts)
+
+# Get storage statistics (connection pool or SQLite writer counters)
+def get_db_pool_stats():
+    return storage.stats()
+
+# Close the storage backend's connections
+def close_db_pool():
+    logger.info("Storage stats (%s): %s", storage.name, storage.stats())
+    storage.close()
 
-# Initialize Database Tables
+# Initialize Database Tables; raises StorageError when the database is unavailable
+@timed(DB_QUERY_SECONDS, function="initialize_database")
 def initialize_database():
     try:
-        with db_connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS hydration_logs (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                date_time DATETIME NOT NULL,
-                bottle_volume FLOAT NOT NULL,
-                is_drunk BOOLEAN DEFAULT FALSE,
-                status VARCHAR(10) DEFAULT 'pending'
-            )
-            """)
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS weekly_goals (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                start_date DATE NOT NULL,
-                end_date DATE NOT NULL,
-                total_bottles INT NOT NULL,
-                goal_met BOOLEAN DEFAULT FALSE,
-                prize_awarded BOOLEAN DEFAULT FALSE
-            )
-            """)
-            cursor.execute("""
-            CREATE TABLE IF NOT EXISTS email_logs (
-                id INT AUTO_INCREMENT PRIMARY KEY,
-                date_time DATETIME NOT NULL,
-                subject VARCHAR(255) NOT NULL,
-                message TEXT NOT NULL,
-                success BOOLEAN NOT NULL,
-                error_message TEXT
-            )
-            """)
-            conn.commit()
-            logging.info("Database tables initialized successfully.")
-    except mysql.connector.Error as err:
-        logging.error(f"Error initializing database: {err}")
-        sys.exit(1)
+        version = storage.initialize()
+        logger.info("Database tables initialized successfully (schema version %s).", version)
+    except StorageError as err:
+        logger.error("Error initializing database: %s", err)
+        raise
 
 # Get the last hydration log time
-def get_last_hydration_log_time():
-    try:
-        with db_connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-            SELECT MAX(date_time) FROM hydration_logs
-            """)
-            last_log_time = cursor.fetchone()[0]
-            return last_log_time
-    except mysql.connector.Error as err:
-        logging.error(f"Error fetching last hydration log time: {err}")
-        return None
+def get_last_hydration_log_time(user_id=DEFAULT_USER_ID):
+    return user_state_cache.get(user_id).last_hydration_log_time
 
 # Get the last email log time
-def get_last_email_log_time():
+def get_last_email_log_time(user_id=DEFAULT_USER_ID):
+    return user_state_cache.get(user_id).last_email_log_time
+
+# Get a user's cached log state
+def get_user_state(user_id=DEFAULT_USER_ID):
+    return user_state_cache.get(user_id)
+
+# Load one user's log state on a cache miss
+@timed(DB_QUERY_SECONDS, function="load_user_state")
+def load_user_state(user_id):
+    # Buffered rows are not visible to the query until they are flushed
+    log_buffer.flush()
     try:
-        with db_connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-            SELECT MAX(date_time) FROM email_logs
-            """)
-            last_email_time = cursor.fetchone()[0]
-            return last_email_time
-    except mysql.connector.Error as err:
-        logging.error(f"Error fetching last email log time: {err}")
-        return None
+        return UserState(*storage.load_user_state(user_id))
+    except StorageError as err:
+        logger.error("Error loading log state for user %s: %s", user_id, err)
+        return UserState()
 
-# Log hydration reminder
-def log_hydration_reminder(is_drunk, status='pending', log_time=None, update_pending=False):
+user_state_cache = UserStateCache(max_users=STATE_CACHE_SIZE, loader=load_user_state)
+
+# Seed the user state cache with one grouped query and return the seeded times
+def seed_user_state_cache():
+    reminder_times = get_last_reminder_times()
+    user_state_cache.seed(reminder_times)
+    logger.info("User state cache seeded for %s user(s).", len(user_state_cache))
+    return reminder_times
+
+# Week start and record_weekly_goals params for the week containing today
+def weekly_goals_params(today):
+    start_of_week = rollups.week_start(today)
+    defaults = user_settings.default_rules
+    return start_of_week, (defaults.is_prize_day(today), defaults.daily_goal, defaults.bottle_volume, start_of_week)
+
+# Get the last hydration and email log times of every tracked user in one query
+@timed(DB_QUERY_SECONDS, function="get_last_reminder_times")
+def get_last_reminder_times():
     try:
-        with db_connect() as conn:
-            cursor = conn.cursor()
-            now = log_time if log_time else datetime.now()
-            if update_pending:
-                # Update the latest pending log entry to completed
-                cursor.execute("""
-                UPDATE hydration_logs
-                SET is_drunk = %s, status = %s
-                WHERE status = 'pending'
-                ORDER BY date_time DESC
-                LIMIT 1
-                """, (is_drunk, status))
-            else:
-                # Check if a log entry already exists within the same minute
-                cursor.execute("""
-                SELECT COUNT(*) FROM hydration_logs
-                WHERE DATE_FORMAT(date_time, '%Y-%m-%d %H:%i') = DATE_FORMAT(%s, '%Y-%m-%d %H:%i')
-                """, (now,))
-                if cursor.fetchone()[0] == 0:
-                    cursor.execute("""
-                    INSERT INTO hydration_logs (date_time, bottle_volume, is_drunk, status)
-                    VALUES (%s, %s, %s, %s)
-                    """, (now, 0.5, is_drunk, status))
-            conn.commit()
-            logging.info(f"Hydration reminder logged: {now}, Drunk: {is_drunk}, Status: {status}")
-    except mysql.connector.Error as err:
-        logging.error(f"Error logging hydration reminder: {err}")
+        reminder_times = storage.get_last_reminder_times()
+        reminder_times.setdefault(DEFAULT_USER_ID, (None, None))
+        return reminder_times
+    except StorageError as err:
+        logger.error("Error fetching last reminder times: %s", err)
+        return {DEFAULT_USER_ID: (None, None)}
 
-# Log email status
-def log_email_status(subject, message, success, error_message=None):
+# Insert buffered hydration reminders, at most one per user per minute
+@timed(DB_QUERY_SECONDS, function="flush_hydration_logs")
+def flush_hydration_logs(rows):
+    inserted = storage.insert_hydration_logs(rows)
+    logger.debug("Flushed %s of %s buffered hydration logs.", inserted, len(rows))
+
+# Insert buffered email statuses
+@timed(DB_QUERY_SECONDS, function="flush_email_logs")
+def flush_email_logs(rows):
+    storage.insert_email_logs(rows)
+    logger.debug("Flushed %s buffered email logs.", len(rows))
+
+# Set whenever new reminders reach the outbox, so local workers claim them without waiting for a poll
+outbox_ready = threading.Event()
+
+log_buffer = WriteBehindBuffer(
+    {"hydration": flush_hydration_logs, "email": flush_email_logs},
+    max_size=LOG_BUFFER_SIZE,
+    flush_interval=LOG_BUFFER_FLUSH_INTERVAL,
+)
+
+LOG_BUFFER_PENDING.set_function(lambda: len(log_buffer))
+
+# Start flushing buffered logs in the background until stop_event is set
+def start_log_buffer(stop_event=None):
+    log_buffer.start(stop_event)
+
+# Write out every buffered log
+def flush_log_buffer():
+    log_buffer.flush()
+
+# Stop the background flusher after writing out every buffered log
+def stop_log_buffer(timeout=None):
+    log_buffer.stop(timeout)
+
+atexit.register(stop_log_buffer)
+
+# Move one batch of hydration logs logged before a time to hydration_logs_archive
+@timed(DB_QUERY_SECONDS, function="archive_hydration_logs")
+def archive_hydration_logs(before, limit=ARCHIVE_BATCH_SIZE):
+    return storage.archive_hydration_logs(before, limit)
+
+# Move one batch of email logs logged before a time to email_logs_archive
+@timed(DB_QUERY_SECONDS, function="archive_email_logs")
+def archive_email_logs(before, limit=ARCHIVE_BATCH_SIZE):
+    return storage.archive_email_logs(before, limit)
+
+# Delete one batch of sent and failed outbox reminders from before a time
+@timed(DB_QUERY_SECONDS, function="purge_reminder_outbox")
+def purge_reminder_outbox(before, limit=ARCHIVE_BATCH_SIZE):
+    return storage.purge_reminder_outbox(before, limit)
+
+log_archiver = LogArchiver(
+    {"hydration_logs": archive_hydration_logs, "email_logs": archive_email_logs,
+     "reminder_outbox": purge_reminder_outbox},
+    {"hydration_logs": HYDRATION_LOG_RETENTION_DAYS, "email_logs": EMAIL_LOG_RETENTION_DAYS,
+     "reminder_outbox": OUTBOX_RETENTION_DAYS},
+    batch_size=ARCHIVE_BATCH_SIZE,
+    batch_pause=ARCHIVE_BATCH_PAUSE,
+    interval=ARCHIVE_INTERVAL,
+)
+
+# Archive logs past retention in the background until stop_event is set
+def start_log_archiver(stop_event=None):
+    log_archiver.start(stop_event)
+
+# Stop the archiver; a batch in progress finishes first
+def stop_log_archiver(timeout=None):
+    log_archiver.stop(timeout)
+
+# Compiled schedule rules per user, reloaded when the user_settings table changes
+user_settings = UserSettingsCache(
+    load_version=storage.get_settings_version,
+    load_settings=storage.load_user_settings,
+    reload_interval=SETTINGS_RELOAD_INTERVAL,
+)
+
+# Load changed user settings now; the current ones stay in use if the database is unavailable
+def reload_user_settings():
     try:
-        with db_connect() as conn:
-            cursor = conn.cursor()
-            now = datetime.now()
-            cursor.execute("""
-            INSERT INTO email_logs (date_time, subject, message, success, error_message)
-            VALUES (%s, %s, %s, %s, %s)
-            """, (now, subject, message, success, error_message))
-            conn.commit()
-            logging.info(f"Email log: {subject}, Success: {success}, Error: {error_message}")
-    except mysql.connector.Error as err:
-        logging.error(f"Error logging email status: {err}")
-
-# Check and log weekly goals
-def check_weekly_goal():
+        return user_settings.reload()
+    except StorageError as err:
+        logger.error("Error loading user settings: %s", err)
+        return False
+
+# Start checking for changed user settings in the background; on_change(user_ids) is called after
+# each reload that changed some, with None when the defaults changed
+def start_settings_reload(stop_event=None, on_change=None):
+    if on_change is not None:
+        user_settings.add_listener(on_change)
+    user_settings.start(stop_event)
+
+# Stop checking for changed user settings
+def stop_settings_reload(timeout=None):
+    user_settings.stop(timeout)
+
+# Get a user's effective settings, with the defaults filled in
+def get_user_settings(user_id=DEFAULT_USER_ID):
+    user_settings.reload()
+    return user_settings.settings(user_id)
+
+# Change some of a user's settings; None clears one back to the default. Raises ValueError for
+# settings that do not compile, so a bad value never reaches the trackers.
+def set_user_settings(user_id, settings):
+    if user_id != DEFAULTS_USER_ID and settings.get("prize_day") is not None:
+        raise ValueError(f"The prize day is shared by everyone; set it for user {DEFAULTS_USER_ID}")
+    user_settings.reload()
+    stored = storage.load_user_settings().get(user_id, {})
+    compile_rules({**stored, **settings}, DEFAULT_SETTINGS if user_id == DEFAULTS_USER_ID else user_settings.defaults)
+    storage.set_user_settings(user_id, settings)
+    logger.info("Settings of user %s changed: %s", user_id, settings)
+    user_settings.reload()
+
+# Log hydration reminder
+def log_hydration_reminder(is_drunk, status='pending', log_time=None, update_pending=False, user_id=DEFAULT_USER_ID):
+    now = log_time if log_time else datetime.now()
+    if not update_pending:
+        log_buffer.add("hydration", (user_id, now, user_settings.rules(user_id).bottle_volume, is_drunk, status))
+        user_state_cache.record_hydration(user_id, now)
+        logger.info("Hydration reminder logged: %s, Drunk: %s, Status: %s", now, is_drunk, status)
+        return
+
+    # The pending entry may still be buffered, so write it out before updating it
+    log_buffer.flush()
     try:
-        today = datetime.now()
-        start_of_week = today - timedelta(days=today.weekday())
-        end_of_week = start_of_week + timedelta(days=6)
+        answer_latest_pending(user_id, is_drunk, status)
+        logger.info("Hydration reminder logged: %s, Drunk: %s, Status: %s", now, is_drunk, status)
+    except StorageError as err:
+        logger.error("Error logging hydration reminder: %s", err)
 
-        with db_connect() as conn:
-            cursor = conn.cursor()
-            # Check if the week is already recorded
-            cursor.execute("""
-            SELECT COUNT(*), SUM(is_drunk)
-            FROM hydration_logs
-            WHERE date_time BETWEEN %s AND %s
-            """, (start_of_week, end_of_week))
-            total_reminders, bottles_drunk = cursor.fetchone()
-
-            goal_met = bottles_drunk >= (2 / 0.5) * 7
-            prize_awarded = goal_met and today.strftime('%A') == "Sunday"
-
-            # Insert weekly data
-            cursor.execute("""
-            INSERT INTO weekly_goals (start_date, end_date, total_bottles, goal_met, prize_awarded)
-            VALUES (%s, %s, %s, %s, %s)
-            """, (start_of_week.date(), end_of_week.date(), bottles_drunk, goal_met, prize_awarded))
-            conn.commit()
-
-            if prize_awarded:
-                logging.info("Congratulations! You've won this week's hydration prize!")
-                print("Congratulations! You've won this week's hydration prize!")
-    except mysql.connector.Error as err:
-        logging.error(f"Error checking weekly goal: {err}")
-
-# Send Email
-def send_email(subject, message):
+# Answer a user's latest pending hydration log
+@timed(DB_QUERY_SECONDS, function="answer_latest_pending")
+def answer_latest_pending(user_id, is_drunk, status):
+    updated = storage.answer_latest_pending(user_id, is_drunk, status)
+    REMINDERS_CONFIRMED.labels(status).inc(updated)
+    return updated
+
+# Queue a reminder in the outbox under an idempotency key for its user and slot, committed before this
+# returns (unlike the buffered logs); an outbox worker delivers it and logs it as a pending hydration reminder.
+# Returns False if the database is unavailable; a slot another process already queued counts as queued.
+@timed(DB_QUERY_SECONDS, function="enqueue_reminder")
+def enqueue_reminder(idempotency_key, user_id, reminder_time, subject, message, next_drink_time=None):
     try:
-        with smtplib.SMTP(MAIL_HOST, MAIL_PORT) as server:
-            server.starttls()
-            server.login(EMAIL, PASSWORD)
-            server.sendmail(EMAIL, TO_EMAIL, f"Subject: {subject}\n\n{message}")
-        log_email_status(subject, message, True)
-        logging.info("Email sent successfully.")
-    except Exception as e:
-        log_email_status(subject, message, False, str(e))
-        logging.error(f"Failed to send email: {e}")
-
-# Show popup for hydration response with timeout
-def show_hydration_popup():
-    def on_yes():
-        nonlocal is_drunk
-        is_drunk = True
-        root.destroy()
-
-    def on_no():
-        nonlocal is_drunk
-        is_drunk = False
-        root.destroy()
-
-    def on_timeout():
-        nonlocal is_drunk
-        is_drunk = None  # Set to None to indicate pending status
-        root.destroy()
-
-    root = tk.Tk()
-    root.withdraw()  # Hide the main window
-    root.title("Hydration Check")
-    root.geometry("300x100")
-
-    is_drunk = None
-
-    response = messagebox.askyesno(
-        "Hydration Check", "Did you drink 0.5L of water as prompted?"
-    )
+        queued = storage.enqueue_reminders([(idempotency_key, user_id, reminder_time, subject, message,
+                                             next_drink_time, reminder_time)])
+    except StorageError as err:
+        logger.error("Error queuing a reminder for user %s in the outbox: %s", user_id, err)
+        return False
+    record_enqueued(user_id, reminder_time, queued)
+    outbox_ready.set()
+    return True
 
-    if response:
-        on_yes()
+# Track a queued reminder in the user state cache. When another process had already queued the slot,
+# the user's state is reloaded from its logs instead, so the next key follows that process's reminder.
+def record_enqueued(user_id, reminder_time, queued):
+    if queued:
+        user_state_cache.record_hydration(user_id, reminder_time)
     else:
-        on_no()
+        logger.info("Reminder for user %s was already queued by another process.", user_id)
+        user_state_cache.invalidate(user_id)
+
+# Lease up to limit outbox reminders that are due to this process
+@timed(DB_QUERY_SECONDS, function="claim_reminders")
+def claim_reminders(limit=OUTBOX_BATCH_SIZE):
+    try:
+        return storage.claim_reminders(OUTBOX_WORKER_ID, datetime.now(), OUTBOX_LEASE_SECONDS, limit,
+                                       OUTBOX_MAX_ATTEMPTS)
+    except StorageError as err:
+        logger.error("Error claiming reminders from the outbox: %s", err)
+        return []
+
+# Mark delivered outbox reminders sent and log them as pending hydration reminders in one transaction;
+# returns the reminders completed. If this fails the lease runs out and they are delivered again; one whose
+# lease already ran out and was claimed by another worker is left to that worker.
+@timed(DB_QUERY_SECONDS, function="complete_reminders")
+def complete_reminders(reminders):
+    try:
+        completed = set(storage.complete_reminders(
+            OUTBOX_WORKER_ID, [reminder["id"] for reminder in reminders],
+            [(reminder["user_id"], reminder["reminder_time"], user_settings.rules(reminder["user_id"]).bottle_volume,
+              False, 'pending') for reminder in reminders], datetime.now()))
+    except StorageError as err:
+        logger.error("Error completing %s outbox reminder(s): %s", len(reminders), err)
+        return []
+    if len(completed) < len(reminders):
+        logger.warning("%s outbox reminder(s) were claimed by another worker after their lease ran out.",
+                       len(reminders) - len(completed))
+    return [reminder for reminder in reminders if reminder["id"] in completed]
+
+# Put undelivered outbox reminders back for a retry; returns how many ran out of attempts
+@timed(DB_QUERY_SECONDS, function="release_reminders")
+def release_reminders(reminders):
+    try:
+        return storage.release_reminders(OUTBOX_WORKER_ID, [reminder["id"] for reminder in reminders],
+                                         datetime.now() + timedelta(seconds=OUTBOX_RETRY_DELAY), OUTBOX_MAX_ATTEMPTS)
+    except StorageError as err:
+        logger.error("Error releasing %s outbox reminder(s): %s", len(reminders), err)
+        return 0
+
+# Log email status
+def log_email_status(subject, message, success, error_message=None, user_id=DEFAULT_USER_ID):
+    now = datetime.now()
+    log_buffer.add("email", (user_id, now, subject, message, success, error_message))
+    user_state_cache.record_email(user_id, now)
+    logger.info("Email log: %s, Success: %s, Error: %s", subject, success, error_message)
 
-    # Set a timer to automatically close the popup after the timeout
-    timer = threading.Timer(60, on_timeout)
-    timer.start()
+# Check and log a user's weekly goal; re-running it for the same week updates the same row
+@timed(DB_QUERY_SECONDS, function="check_weekly_goal")
+def check_weekly_goal(user_id=DEFAULT_USER_ID, today=None):
+    try:
+        today = today or datetime.now()
+        start_of_week = rollups.week_start(today)
+        end_of_week = start_of_week + timedelta(days=6)
+
+        total_reminders, bottles_drunk = storage.get_weekly_totals(user_id, start_of_week)
+        rules = user_settings.rules(user_id)
+        goal_met = bottles_drunk >= rules.weekly_bottle_goal
+        prize_awarded = goal_met and rules.is_prize_day(today)
 
-    root.mainloop()
-    timer.cancel()  # Cancel the timer if the user responds in time
-    return is_drunk
+        # Record weekly data
+        already_awarded = storage.record_weekly_goal(user_id, start_of_week, end_of_week, bottles_drunk, goal_met,
+                                                     prize_awarded)
+
+        if prize_awarded and not already_awarded:
+            logger.info("Congratulations! You've won this week's hydration prize!")
+            print("Congratulations! You've won this week's hydration prize!")
+    except StorageError as err:
+        logger.error("Error checking weekly goal: %s", err)
+
+# Check and log every user's weekly goal in one statement
+@timed(DB_QUERY_SECONDS, function="check_weekly_goals")
+def check_weekly_goals(today=None):
+    try:
+        start_of_week, (is_prize_day, daily_goal, bottle_volume, _) = weekly_goals_params(today or datetime.now())
+        storage.record_weekly_goals(start_of_week, daily_goal, bottle_volume, is_prize_day)
+        logger.info("Weekly goals recorded for the week of %s.", start_of_week)
+    except StorageError as err:
+        logger.error("Error checking weekly goals: %s", err)
 
-# Get pending hydration logs
-def get_pending_hydration_logs():
+# Get daily, weekly or monthly hydration statistics from the rollups
+@timed(DB_QUERY_SECONDS, function="get_hydration_statistics")
+def get_hydration_statistics(period='daily', user_id=DEFAULT_USER_ID, today=None):
     try:
-        with db_connect() as conn:
-            cursor = conn.cursor(dictionary=True)
-            cursor.execute("""
-            SELECT id, date_time
-            FROM hydration_logs
-            WHERE status = 'pending'
-            """)
-            pending_logs = cursor.fetchall()
-            return pending_logs
-    except mysql.connector.Error as err:
-        logging.error(f"Error fetching pending hydration logs: {err}")
+        start_date, end_date, reminders, bottles_drunk = storage.get_period_totals(user_id, period, today)
+        return {
+            "period": period,
+            "start_date": start_date,
+            "end_date": end_date,
+            "reminders": reminders,
+            "bottles_drunk": bottles_drunk,
+            "liters": bottles_drunk * user_settings.rules(user_id).bottle_volume,
+        }
+    except StorageError as err:
+        logger.error("Error fetching %s hydration statistics: %s", period, err)
+        return None
+
+# Get a page of pending hydration logs ordered by time; pass the last row's (date_time, id) as `after` for the next page
+@timed(DB_QUERY_SECONDS, function="get_pending_hydration_logs")
+def get_pending_hydration_logs(after=None, limit=PENDING_PAGE_SIZE, user_id=None):
+    try:
+        return storage.get_pending_hydration_logs(after=after, limit=limit, user_id=user_id)
+    except StorageError as err:
+        logger.error("Error fetching pending hydration logs: %s", err)
         return []
 
+# Confirm pending hydration logs in bulk: by ids, by a date range, or everything pending before a time
+@timed(DB_QUERY_SECONDS, function="confirm_hydration_logs")
+def confirm_hydration_logs(log_ids=None, start=None, end=None, before=None, user_id=None, is_drunk=True,
+                           status='completed'):
+    if log_ids is None and start is None and end is None and before is None:
+        raise ValueError("Select logs by log_ids, a start/end range or before.")
+    try:
+        if log_ids is not None:
+            updated = storage.set_hydration_log_statuses(log_ids, is_drunk, status, pending_only=True)
+        else:
+            updated = storage.confirm_pending(is_drunk, status, start=start, end=end, before=before, user_id=user_id)
+        REMINDERS_CONFIRMED.labels(status).inc(updated)
+        logger.info("%s pending hydration log(s) updated to %s.", updated, status)
+        return updated
+    except StorageError as err:
+        logger.error("Error confirming hydration logs: %s", err)
+        return 0
+
 # Update hydration log status
+@timed(DB_QUERY_SECONDS, function="update_hydration_log_status")
 def update_hydration_log_status(log_id, is_drunk, status):
     try:
-        with db_connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-            UPDATE hydration_logs
-            SET is_drunk = %s, status = %s
-            WHERE id = %s
-            """, (is_drunk, status, log_id))
-            conn.commit()
-            logging.info(f"Hydration log {log_id} updated to {status}.")
-    except mysql.connector.Error as err:
-        logging.error(f"Error updating hydration log {log_id}: {err}")
-
-# CLI to update pending hydration logs
-def update_hydration_logs(stop_event):
-    logging.debug("Starting CLI to update pending hydration logs.")
+        updated = storage.set_hydration_log_statuses([log_id], is_drunk, status)
+        REMINDERS_CONFIRMED.labels(status).inc(updated)
+        logger.info("Hydration log %s updated to %s.", log_id, status)
+    except StorageError as err:
+        logger.error("Error updating hydration log %s: %s", log_id, err)
+
+# Update the status of several hydration logs in one transaction
+@timed(DB_QUERY_SECONDS, function="update_hydration_log_statuses")
+def update_hydration_log_statuses(log_ids, is_drunk, status):
+    try:
+        updated = storage.set_hydration_log_statuses(log_ids, is_drunk, status)
+        REMINDERS_CONFIRMED.labels(status).inc(updated)
+        logger.info("%s hydration log(s) updated to %s.", updated, status)
+        return updated
+    except StorageError as err:
+        logger.error("Error updating hydration logs %s: %s", log_ids, err)
+        return 0
+
+# CLI to update pending hydration logs; with an inbox, responses are posted to it instead of applied inline
+def update_hydration_logs(stop_event, inbox=None):
+    logger.debug("Starting CLI to update pending hydration logs.")
+    after = None
     while not stop_event.is_set():
-        with db_connect() as conn:
-            cursor = conn.cursor()
-            cursor.execute("""
-            SELECT id, date_time
-            FROM hydration_logs
-            WHERE status = 'pending'
-            """)
-            pending_logs = cursor.fetchall()
+        pending_logs = get_pending_hydration_logs(after=after)
 
         if not pending_logs:
+            if after is not None:
+                # Ran off the last page; start again from the oldest pending log
+                after = None
+                continue
             print("No pending hydration logs.")
-            logging.info("No pending hydration logs.")
-            break
-
-        print("Pending hydration logs:")
-        for i, (log_id, date_time) in enumerate(pending_logs, start=1):
-            print(f"{i}. {date_time}")
+            logger.info("No pending hydration logs.")
+            if inbox is None:
+                break
+        else:
+            print("Pending hydration logs:")
+            for i, log in enumerate(pending_logs, start=1):
+                print(f"{i}. {log['date_time']}")
 
-        selection = input("Enter the numbers of the logs you want to update (comma-separated, or 'q' to quit): ")
+        prompt = "Enter the numbers of the logs you want to update (comma-separated), 'all', 'n' for the next page, or 'q' to quit: "
+        if inbox is not None:
+            prompt = ("Enter 'yes'/'no' for the latest reminder, log numbers to mark as drunk (comma-separated), "
+                      "'all', 'n' for the next page, or 'q' to quit: ")
+        selection = input(prompt).strip()
         if selection.lower() == 'q':
             break
 
+        if selection.lower() == 'n':
+            after = (pending_logs[-1]['date_time'], pending_logs[-1]['id']) if pending_logs else None
+            continue
+
+        if selection.lower() == 'all':
+            updated = confirm_hydration_logs(before=datetime.now())
+            print(f"Updated {updated} pending hydration reminder(s).")
+            after = None
+            continue
+
+        if inbox is not None and selection.lower() in ('yes', 'no', 'drank', 'skipped'):
+            inbox.post(selection)
+            print("Response recorded.")
+            continue
+
         try:
-            indices = [int(x) for x in selection.split(',') if x.isdigit()]
+            indices = [int(x) for x in selection.split(',') if x.strip().isdigit()]
+            log_ids = []
             for i in indices:
                 if 1 <= i <= len(pending_logs):
-                    log_id = pending_logs[i - 1][0]
-                    with db_connect() as conn:
-                        cursor = conn.cursor()
-                        cursor.execute("""
-                        UPDATE hydration_logs
-                        SET is_drunk = %s, status = 'completed'
-                        WHERE id = %s
-                        """, (True, log_id))
-                        conn.commit()
-                    print(f"Updated hydration reminder for log ID {log_id}.")
-                    logging.info(f"Updated hydration reminder for log ID {log_id}.")
+                    log_ids.append(pending_logs[i - 1]['id'])
                 else:
                     print(f"Invalid selection: {i}. Please try again.")
-                    logging.warning(f"Invalid selection: {i}.")
+                    logger.warning("Invalid selection: %s.", i)
+            if not log_ids:
+                continue
+
+            if inbox is not None:
+                for log_id in log_ids:
+                    inbox.post('drank', log_id=log_id)
+            else:
+                confirm_hydration_logs(log_ids=log_ids)
+            print(f"Updated hydration reminders for log IDs {', '.join(map(str, log_ids))}.")
+            logger.info("Updated hydration reminders for log IDs %s.", log_ids)
         except ValueError:
             print("Invalid input. Please enter numbers separated by commas.")
-            logging.warning("Invalid input. Please enter numbers separated by commas.")
\ No newline at end of file
+            logger.warning("Invalid input. Please enter numbers separated by commas.")
@@ -0,0 +1,88 @@
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Metrics
+ARCHIVED_ROWS = registry.counter("hydration_archived_rows_total", "Rows moved to the archive tables or purged",
+                                 labels=("table",))
+ARCHIVE_BATCH_SECONDS = registry.histogram("hydration_archive_batch_seconds", "Time to archive one batch of log rows",
+                                           labels=("table",))
+
+
+# Moves log rows older than each table's retention into its archive table (or
+# purges them, for transient tables such as the outbox) on a background
+# thread. Every batch is its own short transaction and the job pauses between
+# batches, so it never holds locks for long or crowds out reminder writes; a
+# run stops early when stop_event is set.
+class LogArchiver:
+    def __init__(self, archive_handlers, retention_days, batch_size=500, batch_pause=0.5, interval=3600):
+        self.archive_handlers = archive_handlers  # table -> callable(before, limit) -> rows moved or purged
+        self.retention_days = retention_days  # table -> days kept in the hot table; 0 keeps everything
+        self.batch_size = batch_size
+        self.batch_pause = batch_pause
+        self.interval = interval
+
+        self._thread = None
+        self._stop_event = None
+        self._batch_seconds = {table: ARCHIVE_BATCH_SECONDS.labels(table) for table in archive_handlers}
+        self.stats = {"runs": 0, "batches": 0, "failed_runs": 0, "archived": dict.fromkeys(archive_handlers, 0)}
+
+    # Start archiving every interval seconds until stop_event is set
+    def start(self, stop_event=None):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event = stop_event or threading.Event()
+        self._thread = threading.Thread(target=self._run, name="log-archiver", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop_event.set()
+            thread.join(timeout)
+
+    # Cutoff for a table: midnight retention days ago, so whole days move together
+    def cutoff(self, table, now=None):
+        days = self.retention_days.get(table, 0)
+        if not days:
+            return None
+        now = now or datetime.now()
+        return datetime.combine(now.date() - timedelta(days=days), datetime.min.time())
+
+    # Archive everything past retention in batches; returns {table: rows moved}
+    def run_once(self, now=None, stop_event=None):
+        stop_event = stop_event or self._stop_event or threading.Event()
+        archived = dict.fromkeys(self.archive_handlers, 0)
+        for table, archive in self.archive_handlers.items():
+            before = self.cutoff(table, now)
+            if before is None:
+                continue
+            while not stop_event.is_set():
+                start = time.perf_counter()
+                moved = archive(before, self.batch_size)
+                self._batch_seconds[table].observe(time.perf_counter() - start)
+                self.stats["batches"] += 1
+                archived[table] += moved
+                if moved < self.batch_size:
+                    break
+                stop_event.wait(self.batch_pause)
+            if archived[table]:
+                ARCHIVED_ROWS.labels(table).inc(archived[table])
+                self.stats["archived"][table] += archived[table]
+                logger.info("Cleared %s %s rows older than %s from the hot table.", archived[table], table, before)
+        self.stats["runs"] += 1
+        return archived
+
+    def _run(self):
+        stop_event = self._stop_event
+        while not stop_event.is_set():
+            try:
+                self.run_once(stop_event=stop_event)
+            except Exception as e:
+                self.stats["failed_runs"] += 1
+                logger.error("Error archiving old logs, will retry: %s", e)
+            stop_event.wait(self.interval)
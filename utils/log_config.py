@@ -0,0 +1,125 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime
+from concurrent_log_handler import ConcurrentRotatingFileHandler
+
+# Logging Configuration
+LOG_FILE = os.getenv("LOG_FILE", "logs/hydration_tracker.log")
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_LEVELS = os.getenv("LOG_LEVELS", "")  # per-module overrides, e.g. "utils.db_utils=WARNING,handlers=DEBUG"
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")  # "json" for JSON lines, "text" for the classic format
+LOG_SAMPLE_RATE = int(os.getenv("LOG_SAMPLE_RATE", 1))  # keep 1 in N repeats of the same message; 1 keeps all
+LOG_SAMPLE_MAX_LEVEL = os.getenv("LOG_SAMPLE_MAX_LEVEL", "INFO")  # never sample above this level
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))  # 10 MB per log file
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 7))
+TEXT_FORMAT = '%(asctime)s %(levelname)s:%(message)s'
+
+
+# One JSON object per line
+class JsonLinesFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": datetime.fromtimestamp(record.created).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "thread": record.threadName,
+            "message": record.getMessage(),
+        }
+        sampled = getattr(record, "sampled", None)
+        if sampled:
+            entry["sampled"] = sampled
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc_info"] = record.exc_text
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+# Keeps 1 in every `rate` records per message template at or below max_level.
+# Sampling keys on the unformatted template, so it costs one dict lookup per call.
+class SamplingFilter(logging.Filter):
+    def __init__(self, rate=LOG_SAMPLE_RATE, max_level=LOG_SAMPLE_MAX_LEVEL):
+        super().__init__()
+        self.rate = rate
+        self.max_level = logging.getLevelName(max_level) if isinstance(max_level, str) else max_level
+        self._counts = {}
+        self._lock = threading.Lock()
+
+    def filter(self, record):
+        if self.rate <= 1 or record.levelno > self.max_level:
+            return True
+        key = (record.name, record.msg)
+        with self._lock:
+            count = self._counts.get(key, 0) + 1
+            self._counts[key] = count
+        if count % self.rate == 1:
+            if count > 1:
+                record.sampled = self.rate  # this record stands for `rate` occurrences
+            return True
+        return False
+
+
+# QueueHandler that only merges the message args on the caller's thread
+class LazyQueueHandler(logging.handlers.QueueHandler):
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Tracebacks cannot cross the queue safely, so render them now
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+
+# Parse "name=LEVEL,name=LEVEL" into {name: LEVEL}
+def parse_module_levels(spec):
+    levels = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, level = (part.strip() for part in item.split("=", 1))
+        if name and level:
+            levels[name] = level.upper()
+    return levels
+
+
+# Stop a queue listener, flushing queued records; safe to call more than once
+def stop_logging(listener):
+    if getattr(listener, "_thread", None) is not None:
+        listener.stop()
+
+
+# Route all logging through a queue to a listener thread that owns the file handler
+def configure_logging(log_file=LOG_FILE, level=LOG_LEVEL, module_levels=LOG_LEVELS, log_format=LOG_FORMAT,
+                      sample_rate=LOG_SAMPLE_RATE, file_handler=None):
+    if file_handler is None:
+        log_dir = os.path.dirname(log_file)
+        if log_dir:
+            os.makedirs(log_dir, exist_ok=True)
+        file_handler = ConcurrentRotatingFileHandler(log_file, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT)
+    file_handler.setFormatter(JsonLinesFormatter() if log_format == "json" else logging.Formatter(TEXT_FORMAT))
+
+    log_queue = queue.SimpleQueue()
+    queue_handler = LazyQueueHandler(log_queue)
+    if sample_rate > 1:
+        queue_handler.addFilter(SamplingFilter(sample_rate))
+
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(queue_handler)
+    root.setLevel(level.upper())
+    if isinstance(module_levels, str):
+        module_levels = parse_module_levels(module_levels)
+    for name, module_level in module_levels.items():
+        logging.getLogger(name).setLevel(module_level)
+
+    listener = logging.handlers.QueueListener(log_queue, file_handler, respect_handler_level=True)
+    listener.start()
+    atexit.register(stop_logging, listener)
+    return listener
@@ -0,0 +1,272 @@
+import logging
+
+logger = logging.getLogger(__name__)
+
+MIGRATION_BATCH_SIZE = 10000  # ids per batch when a migration deletes rows
+
+
+# Remove same-minute duplicate hydration logs, keeping the first of each user's minute. One grouped
+# pass collects the ids to keep; the delete then walks the primary key in batches joined on id,
+# committing each, so no statement compares every row with every other or holds locks for long.
+def delete_duplicate_minutes(conn, cursor):
+    cursor.execute("""
+    CREATE TEMPORARY TABLE hydration_minute_keep (id INT PRIMARY KEY)
+    SELECT MIN(id) AS id
+    FROM hydration_logs
+    GROUP BY user_id, DATE_FORMAT(date_time, '%Y-%m-%d %H:%i')
+    """)
+    cursor.execute("SELECT COALESCE(MIN(id), 0), COALESCE(MAX(id), 0) FROM hydration_logs")
+    low, high = cursor.fetchone()
+    deleted = 0
+    try:
+        for start in range(low, high + 1, MIGRATION_BATCH_SIZE):
+            cursor.execute("""
+            DELETE dup FROM hydration_logs dup
+            LEFT JOIN hydration_minute_keep keep ON keep.id = dup.id
+            WHERE keep.id IS NULL AND dup.id >= %s AND dup.id < %s
+            """, (start, start + MIGRATION_BATCH_SIZE))
+            deleted += cursor.rowcount
+            conn.commit()
+    finally:
+        cursor.execute("DROP TEMPORARY TABLE IF EXISTS hydration_minute_keep")
+    if deleted:
+        logger.info("Removed %s same-minute duplicate hydration log(s).", deleted)
+
+
+# Versioned schema migrations, applied in order and recorded in schema_migrations.
+# Append new migrations to the end; never edit one that has already shipped. A step
+# is a statement, or a function(conn, cursor) for one that has to run in batches.
+MIGRATIONS = [
+    (1, "Create base tables", [
+        """
+        CREATE TABLE IF NOT EXISTS hydration_logs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            date_time DATETIME NOT NULL,
+            bottle_volume FLOAT NOT NULL,
+            is_drunk BOOLEAN DEFAULT FALSE,
+            status VARCHAR(10) DEFAULT 'pending'
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS weekly_goals (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            start_date DATE NOT NULL,
+            end_date DATE NOT NULL,
+            total_bottles INT NOT NULL,
+            goal_met BOOLEAN DEFAULT FALSE,
+            prize_awarded BOOLEAN DEFAULT FALSE
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS email_logs (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            date_time DATETIME NOT NULL,
+            subject VARCHAR(255) NOT NULL,
+            message TEXT NOT NULL,
+            success BOOLEAN NOT NULL,
+            error_message TEXT
+        )
+        """,
+    ]),
+    (2, "Key hydration and email logs by user", [
+        "ALTER TABLE hydration_logs ADD COLUMN user_id INT NOT NULL DEFAULT 1 AFTER id",
+        "ALTER TABLE email_logs ADD COLUMN user_id INT NOT NULL DEFAULT 1 AFTER id",
+    ]),
+    (3, "Index hot hydration_logs and email_logs queries", [
+        # Pending scans: WHERE status = 'pending' ORDER BY date_time
+        "CREATE INDEX idx_hydration_status_date ON hydration_logs (status, date_time)",
+        # Weekly range scans: WHERE date_time BETWEEN ...
+        "CREATE INDEX idx_hydration_date ON hydration_logs (date_time)",
+        # Per-user MAX(date_time) and latest-pending lookups
+        "CREATE INDEX idx_hydration_user_date ON hydration_logs (user_id, date_time)",
+        "CREATE INDEX idx_email_user_date ON email_logs (user_id, date_time)",
+    ]),
+    (4, "Enforce one hydration reminder per user per minute", [
+        # Remove existing same-minute duplicates so the unique key can be built
+        delete_duplicate_minutes,
+        """
+        ALTER TABLE hydration_logs
+            ADD COLUMN minute_bucket DATETIME
+                GENERATED ALWAYS AS (DATE_FORMAT(date_time, '%Y-%m-%d %H:%i:00')) STORED,
+            ADD UNIQUE KEY uq_hydration_user_minute (user_id, minute_bucket)
+        """,
+    ]),
+    (5, "Add daily and weekly hydration rollups and key weekly goals by user and week", [
+        """
+        CREATE TABLE IF NOT EXISTS hydration_daily_rollups (
+            user_id INT NOT NULL,
+            day DATE NOT NULL,
+            reminders INT NOT NULL DEFAULT 0,
+            bottles_drunk INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, day)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS hydration_weekly_rollups (
+            user_id INT NOT NULL,
+            week_start DATE NOT NULL,
+            reminders INT NOT NULL DEFAULT 0,
+            bottles_drunk INT NOT NULL DEFAULT 0,
+            PRIMARY KEY (user_id, week_start)
+        )
+        """,
+        """
+        INSERT INTO hydration_daily_rollups (user_id, day, reminders, bottles_drunk)
+        SELECT user_id, DATE(date_time), COUNT(*), COALESCE(SUM(is_drunk), 0)
+        FROM hydration_logs
+        GROUP BY user_id, DATE(date_time)
+        """,
+        """
+        INSERT INTO hydration_weekly_rollups (user_id, week_start, reminders, bottles_drunk)
+        SELECT user_id, day - INTERVAL WEEKDAY(day) DAY, SUM(reminders), SUM(bottles_drunk)
+        FROM hydration_daily_rollups
+        GROUP BY user_id, day - INTERVAL WEEKDAY(day) DAY
+        """,
+        "ALTER TABLE weekly_goals ADD COLUMN user_id INT NOT NULL DEFAULT 1 AFTER id",
+        # Keep the latest evaluation of each week so the unique key can be built
+        """
+        DELETE dup FROM weekly_goals dup
+        JOIN weekly_goals newer
+            ON newer.user_id = dup.user_id
+            AND newer.start_date = dup.start_date
+            AND newer.id > dup.id
+        """,
+        "ALTER TABLE weekly_goals ADD UNIQUE KEY uq_weekly_goal_user_week (user_id, start_date)",
+    ]),
+    (6, "Add log archive tables and store email bodies once in email_templates", [
+        """
+        CREATE TABLE IF NOT EXISTS email_templates (
+            id INT AUTO_INCREMENT PRIMARY KEY,
+            template_hash CHAR(64) NOT NULL,
+            subject VARCHAR(255) NOT NULL,
+            body TEXT NOT NULL,
+            UNIQUE KEY uq_email_template_hash (template_hash)
+        )
+        """,
+        # New rows reference a template and keep only the timestamps that vary in message_args
+        """
+        ALTER TABLE email_logs
+            ADD COLUMN template_id INT NULL AFTER subject,
+            ADD COLUMN message_args VARCHAR(255) NULL AFTER template_id,
+            MODIFY message TEXT NULL
+        """,
+        # Retention scans: WHERE date_time < ... ORDER BY date_time
+        "CREATE INDEX idx_email_date ON email_logs (date_time)",
+        """
+        CREATE TABLE IF NOT EXISTS hydration_logs_archive (
+            id INT PRIMARY KEY,
+            user_id INT NOT NULL,
+            date_time DATETIME NOT NULL,
+            bottle_volume FLOAT NOT NULL,
+            is_drunk BOOLEAN DEFAULT FALSE,
+            status VARCHAR(10) DEFAULT 'pending',
+            KEY idx_hydration_archive_user_date (user_id, date_time)
+        )
+        """,
+        """
+        CREATE TABLE IF NOT EXISTS email_logs_archive (
+            id INT PRIMARY KEY,
+            user_id INT NOT NULL,
+            date_time DATETIME NOT NULL,
+            template_id INT NOT NULL,
+            message_args VARCHAR(255),
+            success BOOLEAN NOT NULL,
+            error_message TEXT,
+            KEY idx_email_archive_user_date (user_id, date_time)
+        )
+        """,
+    ]),
+    (7, "Add the reminder outbox", [
+        """
+        CREATE TABLE IF NOT EXISTS reminder_outbox (
+            id BIGINT AUTO_INCREMENT PRIMARY KEY,
+            idempotency_key VARCHAR(64) NOT NULL,
+            user_id INT NOT NULL,
+            reminder_time DATETIME NOT NULL,
+            subject VARCHAR(255) NOT NULL,
+            message TEXT NOT NULL,
+            next_drink_time DATETIME NULL,
+            status VARCHAR(10) NOT NULL DEFAULT 'pending',
+            attempts INT NOT NULL DEFAULT 0,
+            available_at DATETIME NOT NULL,
+            claimed_by VARCHAR(64) NULL,
+            sent_at DATETIME NULL,
+            UNIQUE KEY uq_outbox_idempotency_key (idempotency_key),
+            -- Claims: WHERE status IN ('pending', 'sending') AND available_at <= ...
+            KEY idx_outbox_status_available (status, available_at),
+            -- Purges: WHERE status IN ('sent', 'failed') AND reminder_time < ...
+            KEY idx_outbox_status_time (status, reminder_time)
+        )
+        """,
+    ]),
+    (8, "Index archived hydration logs by time", [
+        # Analytics exports: WHERE date_time >= ... AND date_time < ...
+        "CREATE INDEX idx_hydration_archive_date ON hydration_logs_archive (date_time)",
+    ]),
+    (9, "Add per-user settings", [
+        # user_id 0 holds everyone's defaults; NULL columns fall back to them
+        """
+        CREATE TABLE IF NOT EXISTS user_settings (
+            user_id INT PRIMARY KEY,
+            drink_interval INT NULL,
+            bottle_volume FLOAT NULL,
+            daily_goal FLOAT NULL,
+            prize_day VARCHAR(9) NULL,
+            reminder_start_hour TINYINT NULL,
+            reminder_end_hour TINYINT NULL,
+            -- Trackers reload the settings when COUNT(*) or MAX(updated_at) moves
+            updated_at DATETIME(6) NOT NULL DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6)
+        )
+        """,
+    ]),
+]
+
+MIGRATION_LOCK = "hydration_schema_migrations"
+MIGRATION_LOCK_TIMEOUT = 60  # seconds
+
+# Latest schema version known to this code
+def latest_version():
+    return MIGRATIONS[-1][0]
+
+# Get the schema version recorded in the database
+def get_schema_version(cursor):
+    cursor.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migrations (
+        version INT PRIMARY KEY,
+        description VARCHAR(255) NOT NULL,
+        applied_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    cursor.execute("SELECT COALESCE(MAX(version), 0) FROM schema_migrations")
+    return cursor.fetchone()[0]
+
+# Apply every pending migration up to target (default: latest) and return the resulting version
+def apply_migrations(conn, target=None):
+    target = latest_version() if target is None else target
+    cursor = conn.cursor()
+
+    # Serialise migrations across processes sharing the database
+    cursor.execute("SELECT GET_LOCK(%s, %s)", (MIGRATION_LOCK, MIGRATION_LOCK_TIMEOUT))
+    if cursor.fetchone()[0] != 1:
+        raise RuntimeError("Timed out waiting for the schema migration lock.")
+    try:
+        version = get_schema_version(cursor)
+        for migration_version, description, statements in MIGRATIONS:
+            if migration_version <= version or migration_version > target:
+                continue
+            logger.info("Applying schema migration %s: %s", migration_version, description)
+            # MySQL commits DDL implicitly, so each migration is recorded as soon as it completes
+            for statement in statements:
+                if callable(statement):
+                    statement(conn, cursor)
+                else:
+                    cursor.execute(statement)
+            cursor.execute("""
+            INSERT INTO schema_migrations (version, description) VALUES (%s, %s)
+            """, (migration_version, description))
+            conn.commit()
+            version = migration_version
+        return version
+    finally:
+        cursor.execute("SELECT RELEASE_LOCK(%s)", (MIGRATION_LOCK,))
+        cursor.fetchone()
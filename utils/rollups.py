@@ -0,0 +1,125 @@
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+
+# Per-user daily and weekly hydration counters, kept up to date in the same
+# transaction as the hydration_logs writes they summarise. The storage backends
+# apply the deltas and statements built here; the readers take an open cursor.
+
+# Monday of the week containing day
+def week_start(day):
+    if isinstance(day, datetime):
+        day = day.date()
+    return day - timedelta(days=day.weekday())
+
+DAILY_DELTA_SQL = """
+    INSERT INTO hydration_daily_rollups (user_id, day, reminders, bottles_drunk)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        reminders = reminders + VALUES(reminders),
+        bottles_drunk = bottles_drunk + VALUES(bottles_drunk)
+    """
+
+WEEKLY_DELTA_SQL = """
+    INSERT INTO hydration_weekly_rollups (user_id, week_start, reminders, bottles_drunk)
+    VALUES (%s, %s, %s, %s)
+    ON DUPLICATE KEY UPDATE
+        reminders = reminders + VALUES(reminders),
+        bottles_drunk = bottles_drunk + VALUES(bottles_drunk)
+    """
+
+REBUILD_DAILY_SQL = """
+    REPLACE INTO hydration_daily_rollups (user_id, day, reminders, bottles_drunk)
+    SELECT %s, %s, COUNT(*), COALESCE(SUM(is_drunk), 0)
+    FROM hydration_logs
+    WHERE user_id = %s AND date_time >= %s AND date_time < %s
+    """
+
+REBUILD_WEEKLY_SQL = """
+    REPLACE INTO hydration_weekly_rollups (user_id, week_start, reminders, bottles_drunk)
+    SELECT %s, %s, COALESCE(SUM(reminders), 0), COALESCE(SUM(bottles_drunk), 0)
+    FROM hydration_daily_rollups
+    WHERE user_id = %s AND day >= %s AND day < %s
+    """
+
+# Split {(user_id, day): (reminders, bottles_drunk)} deltas into DAILY_DELTA_SQL and WEEKLY_DELTA_SQL params
+def delta_params(deltas):
+    daily = defaultdict(lambda: [0, 0])
+    weekly = defaultdict(lambda: [0, 0])
+    for (user_id, day), (reminders, bottles_drunk) in deltas.items():
+        for counters in (daily[(user_id, day)], weekly[(user_id, week_start(day))]):
+            counters[0] += reminders
+            counters[1] += bottles_drunk
+    return ([(user_id, day, reminders, bottles) for (user_id, day), (reminders, bottles) in daily.items()],
+            [(user_id, start, reminders, bottles) for (user_id, start), (reminders, bottles) in weekly.items()])
+
+# Deltas for newly inserted reminders; rows are (user_id, date_time, is_drunk)
+def reminder_deltas(rows):
+    deltas = defaultdict(lambda: [0, 0])
+    for user_id, date_time, is_drunk in rows:
+        counters = deltas[(user_id, date_time.date())]
+        counters[0] += 1
+        counters[1] += int(bool(is_drunk))
+    return deltas
+
+# Deltas for is_drunk changes from grouped rows of (user_id, day, rows_updated, rows_already_drunk)
+def confirmation_deltas(groups, is_drunk):
+    deltas = {}
+    for user_id, day, rows_updated, rows_already_drunk in groups:
+        change = int(rows_updated) * int(bool(is_drunk)) - int(rows_already_drunk or 0)
+        if change:
+            deltas[(user_id, day)] = (0, change)
+    return deltas
+
+# (sql, params) statements that recompute the counters of the given (user_id, day) pairs
+def rebuild_statements(user_days):
+    statements = []
+    weeks = set()
+    for user_id, day in user_days:
+        statements.append((REBUILD_DAILY_SQL, (user_id, day, user_id, day, day + timedelta(days=1))))
+        weeks.add((user_id, week_start(day)))
+    for user_id, start in weeks:
+        statements.append((REBUILD_WEEKLY_SQL, (user_id, start, user_id, start, start + timedelta(days=7))))
+    return statements
+
+# Get (reminders, bottles_drunk) for one user's week
+def get_weekly_totals(cursor, user_id, start):
+    cursor.execute("""
+    SELECT reminders, bottles_drunk FROM hydration_weekly_rollups
+    WHERE user_id = %s AND week_start = %s
+    """, (user_id, start))
+    row = cursor.fetchone()
+    return (row[0], row[1]) if row else (0, 0)
+
+# Get (start_date, end_date, reminders, bottles_drunk) for the day, week or month containing today
+def get_period_totals(cursor, user_id, period, today=None):
+    today = today or date.today()
+    if isinstance(today, datetime):
+        today = today.date()
+
+    if period == "daily":
+        cursor.execute("""
+        SELECT reminders, bottles_drunk FROM hydration_daily_rollups
+        WHERE user_id = %s AND day = %s
+        """, (user_id, today))
+        start, end = today, today
+    elif period == "weekly":
+        start = week_start(today)
+        end = start + timedelta(days=6)
+        cursor.execute("""
+        SELECT reminders, bottles_drunk FROM hydration_weekly_rollups
+        WHERE user_id = %s AND week_start = %s
+        """, (user_id, start))
+    elif period == "monthly":
+        start = today.replace(day=1)
+        end = (start + timedelta(days=32)).replace(day=1) - timedelta(days=1)
+        cursor.execute("""
+        SELECT COALESCE(SUM(reminders), 0), COALESCE(SUM(bottles_drunk), 0)
+        FROM hydration_daily_rollups
+        WHERE user_id = %s AND day BETWEEN %s AND %s
+        """, (user_id, start, end))
+    else:
+        raise ValueError(f"Unknown statistics period: {period}")
+
+    row = cursor.fetchone()
+    reminders, bottles_drunk = (int(row[0]), int(row[1])) if row else (0, 0)
+    return start, end, reminders, bottles_drunk
@@ -0,0 +1,96 @@
+import threading
+from collections import OrderedDict
+
+
+class UserState:
+    __slots__ = ("last_hydration_log_time", "last_email_log_time")
+
+    def __init__(self, last_hydration_log_time=None, last_email_log_time=None):
+        self.last_hydration_log_time = last_hydration_log_time
+        self.last_email_log_time = last_email_log_time
+
+    # Time of the user's latest reminder, from either log
+    @property
+    def last_reminder_time(self):
+        times = [t for t in (self.last_hydration_log_time, self.last_email_log_time) if t is not None]
+        return max(times) if times else None
+
+
+# LRU cache of per-user log state, updated write-through by the log functions.
+# Users evicted or never seeded are loaded on demand with loader(user_id).
+class UserStateCache:
+    def __init__(self, max_users=10000, loader=None):
+        self.max_users = max_users
+        self.loader = loader
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def __contains__(self, user_id):
+        with self._lock:
+            return user_id in self._entries
+
+    # Replace the cache contents with {user_id: (last_hydration_log_time, last_email_log_time)}
+    def seed(self, reminder_times):
+        with self._lock:
+            self._entries.clear()
+            for user_id, (last_hydration_log_time, last_email_log_time) in reminder_times.items():
+                self._entries[user_id] = UserState(last_hydration_log_time, last_email_log_time)
+            self._evict()
+
+    def get(self, user_id):
+        state = self.lookup(user_id)
+        if state is None:
+            state = self.add(user_id, self.loader(user_id) if self.loader else UserState())
+        return state
+
+    # The cached state of a user, or None on a miss, without loading it; for callers that load misses themselves
+    def lookup(self, user_id):
+        with self._lock:
+            state = self._entries.get(user_id)
+            if state is not None:
+                self._entries.move_to_end(user_id)
+                self.stats["hits"] += 1
+                return state
+            self.stats["misses"] += 1
+            return None
+
+    # Cache a state loaded after a miss and return the cached one
+    def add(self, user_id, state):
+        with self._lock:
+            # Another thread may have loaded or updated the user meanwhile
+            state = self._entries.setdefault(user_id, state)
+            self._entries.move_to_end(user_id)
+            self._evict()
+            return state
+
+    # Drop a user's state so the next get() loads it again
+    def invalidate(self, user_id):
+        with self._lock:
+            self._entries.pop(user_id, None)
+
+    def record_hydration(self, user_id, log_time):
+        with self._lock:
+            state = self._entries.get(user_id)
+            if state is None:
+                # Unknown users are loaded lazily on their next get()
+                return
+            if state.last_hydration_log_time is None or log_time > state.last_hydration_log_time:
+                state.last_hydration_log_time = log_time
+
+    def record_email(self, user_id, log_time):
+        with self._lock:
+            state = self._entries.get(user_id)
+            if state is None:
+                return
+            if state.last_email_log_time is None or log_time > state.last_email_log_time:
+                state.last_email_log_time = log_time
+
+    def _evict(self):
+        while len(self._entries) > self.max_users:
+            self._entries.popitem(last=False)
+            self.stats["evictions"] += 1
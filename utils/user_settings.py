@@ -0,0 +1,204 @@
+import logging
+import threading
+from datetime import timedelta
+from utils.metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# Built-in settings; the user_settings row of DEFAULTS_USER_ID overrides them for everyone,
+# and a user's own row overrides both. A NULL column falls through to the next level.
+DEFAULT_SETTINGS = {
+    "drink_interval": 100,  # minutes (1.67 hours)
+    "bottle_volume": 0.5,  # liters
+    "daily_goal": 2,  # liters
+    "prize_day": "Sunday",  # day to evaluate prizes; shared by everyone, so only read from the defaults row
+    "reminder_start_hour": 9,  # reminders run from 9 AM
+    "reminder_end_hour": 24,  # until midnight
+}
+SETTING_NAMES = tuple(DEFAULT_SETTINGS)
+DEFAULTS_USER_ID = 0
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+# Metrics
+SETTINGS_RELOADS = registry.counter("hydration_settings_reloads_total", "Times changed user settings were reloaded")
+SETTINGS_INVALID = registry.counter("hydration_settings_invalid_total",
+                                    "User settings rows rejected on reload; those users get the defaults")
+
+
+# One user's settings compiled for the scheduler: the interval is a timedelta and the reminder
+# window is minutes since midnight, so due checks are a few comparisons and never parse anything
+class ScheduleRules:
+    __slots__ = ("drink_interval", "interval", "bottle_volume", "daily_goal", "weekly_bottle_goal", "prize_weekday",
+                 "window_start", "window_end")
+
+    def __init__(self, drink_interval, bottle_volume, daily_goal, prize_day, reminder_start_hour, reminder_end_hour):
+        if drink_interval <= 0 or bottle_volume <= 0 or daily_goal < 0:
+            raise ValueError("drink_interval and bottle_volume must be positive and daily_goal not negative")
+        if not 0 <= reminder_start_hour < reminder_end_hour <= 24:
+            raise ValueError(f"Invalid reminder window {reminder_start_hour}-{reminder_end_hour}")
+        if prize_day not in WEEKDAYS:
+            raise ValueError(f"Unknown prize day: {prize_day}")
+        self.drink_interval = int(drink_interval)  # minutes
+        self.interval = timedelta(minutes=self.drink_interval)
+        self.bottle_volume = float(bottle_volume)
+        self.daily_goal = float(daily_goal)
+        self.weekly_bottle_goal = self.daily_goal / self.bottle_volume * 7
+        self.prize_weekday = WEEKDAYS.index(prize_day)
+        self.window_start = int(reminder_start_hour) * 60
+        self.window_end = int(reminder_end_hour) * 60
+
+    def in_window(self, moment):
+        return self.window_start <= moment.hour * 60 + moment.minute < self.window_end
+
+    # Whether a reminder is due at now, given the time of the user's last one
+    def is_due(self, now, last_reminder_time):
+        return self.in_window(now) and (last_reminder_time is None or now - last_reminder_time >= self.interval)
+
+    # Move a time outside the reminder window to the next start of the window
+    def clamp(self, moment):
+        minute = moment.hour * 60 + moment.minute
+        if self.window_start <= minute < self.window_end:
+            return moment
+        midnight = moment.replace(hour=0, minute=0, second=0, microsecond=0)
+        return midnight + timedelta(days=0 if minute < self.window_start else 1, minutes=self.window_start)
+
+    # Next reminder time after the user's last drink, never in the past
+    def next_reminder_time(self, last_drink_time, now):
+        return self.clamp(max(last_drink_time + self.interval, now))
+
+    def is_prize_day(self, day):
+        return day.weekday() == self.prize_weekday
+
+
+# Compile settings over defaults; NULL (None) and missing settings take the default
+def compile_rules(settings, defaults=DEFAULT_SETTINGS):
+    merged = {name: defaults[name] if settings.get(name) is None else settings[name] for name in SETTING_NAMES}
+    return ScheduleRules(**merged), merged
+
+
+# Compiled schedule rules of every user with a user_settings row. Rows are compiled once per
+# change, when load_version() moves, and swapped in whole, so rules(user_id) is a dict lookup
+# that never touches the database; users without a row share the default rules.
+class UserSettingsCache:
+    def __init__(self, load_version, load_settings, reload_interval=30):
+        self.load_version = load_version  # callable() -> value that changes whenever a row does
+        self.load_settings = load_settings  # callable() -> {user_id: {setting: value or None}}
+        self.reload_interval = reload_interval
+        self.version = None
+        self.default_rules, self.defaults = compile_rules({})
+        self._rules = {}
+        self._settings = {}
+        self._user_ids = frozenset()
+        self._listeners = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+
+    def rules(self, user_id):
+        return self._rules.get(user_id, self.default_rules)
+
+    # A user's effective settings, with the defaults filled in
+    def settings(self, user_id):
+        return self._settings.get(user_id, self.defaults)
+
+    # Users with a settings row of their own
+    def user_ids(self):
+        return self._user_ids
+
+    # Call listener(user_ids) after each reload that changed settings, from the reloading thread:
+    # user_ids is the set of users whose settings changed, or None when the defaults did
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    # Recompile every user's rules if the settings changed since the last load; returns whether they did
+    def reload(self, force=False):
+        with self._lock:
+            version = self.load_version()
+            if version == self.version and not force:
+                return False
+            rows = self.load_settings()
+
+            default_row = rows.pop(DEFAULTS_USER_ID, {})
+            try:
+                default_rules, defaults = compile_rules(default_row)
+            except (TypeError, ValueError) as e:
+                SETTINGS_INVALID.inc()
+                logger.error("Invalid default user settings %s, using the built-in defaults: %s", default_row, e)
+                default_rules, defaults = compile_rules({})
+            # The prize day is shared by everyone, so users follow the defaults row for it
+            defaults_prize_day = {"prize_day": defaults["prize_day"]}
+            compiled, merged = {}, {}
+            for user_id, settings in rows.items():
+                try:
+                    compiled[user_id], merged[user_id] = compile_rules({**settings, **defaults_prize_day}, defaults)
+                except (TypeError, ValueError) as e:
+                    SETTINGS_INVALID.inc()
+                    logger.error("Invalid settings for user %s, using the defaults: %s", user_id, e)
+
+            if defaults != self.defaults:
+                changed = None
+            else:
+                changed = {user_id for user_id in rows.keys() | self._user_ids
+                           if user_id not in self._user_ids or merged.get(user_id) != self._settings.get(user_id)}
+            self.default_rules, self.defaults, self.version = default_rules, defaults, version
+            self._rules, self._settings, self._user_ids = compiled, merged, frozenset(rows)
+        SETTINGS_RELOADS.inc()
+        logger.info("User settings loaded for %s user(s) (version %s).", len(compiled), version)
+        if changed is None or changed:
+            for listener in self._listeners:
+                try:
+                    listener(changed)
+                except Exception as e:
+                    logger.error("Error applying reloaded user settings: %s", e, exc_info=True)
+        return True
+
+    # Check for changed settings every reload_interval seconds until stop_event is set
+    def start(self, stop_event=None):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop_event = stop_event or threading.Event()
+        self._thread = threading.Thread(target=self._run, name="user-settings-reload", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout=None):
+        thread, self._thread = self._thread, None
+        if thread is not None:
+            self._stop_event.set()
+            thread.join(timeout)
+
+    def _run(self):
+        stop_event = self._stop_event
+        while not stop_event.wait(self.reload_interval):
+            try:
+                self.reload()
+            except Exception as e:
+                logger.error("Error reloading user settings, keeping the current ones: %s", e)
+
+
+# Parse a setting given on the command line
+def parse_setting(name, value):
+    if value in ("", "default", "null"):
+        return None
+    if name == "prize_day":
+        return value.capitalize()
+    return float(value) if name in ("bottle_volume", "daily_goal") else int(value)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Show or change a user's settings; running trackers pick them up")
+    parser.add_argument("--user", type=int, default=DEFAULTS_USER_ID,
+                        help=f"user id, or {DEFAULTS_USER_ID} for everyone's defaults (default)")
+    for name in SETTING_NAMES:
+        parser.add_argument(f"--{name.replace('_', '-')}", dest=name, help="'default' clears it")
+    args = parser.parse_args()
+
+    from utils.db_utils import get_user_settings, set_user_settings
+
+    changes = {name: parse_setting(name, getattr(args, name)) for name in SETTING_NAMES
+               if getattr(args, name) is not None}
+    if changes:
+        set_user_settings(args.user, changes)
+    for name, value in get_user_settings(args.user).items():
+        print(f"{name}: {value}")
@@ -0,0 +1,106 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+# Collects rows in memory and hands them to per-kind flush handlers in batches,
+# either once max_size rows are pending or every flush_interval seconds.
+class WriteBehindBuffer:
+    def __init__(self, flush_handlers, max_size=100, flush_interval=5, max_pending=10000):
+        self.flush_handlers = flush_handlers  # kind -> callable(rows)
+        self.max_size = max_size
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending  # rows kept for retry when the database is unavailable
+
+        self._pending = {kind: [] for kind in flush_handlers}
+        self._count = 0
+        self._cond = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._thread = None
+        self._stop_event = None
+        self.stats = {"rows": 0, "flushes": 0, "failed_flushes": 0, "dropped": 0}
+
+    def __len__(self):
+        with self._cond:
+            return self._count
+
+    # Start the background flusher; it flushes once more and exits when stop_event is set
+    def start(self, stop_event=None):
+        with self._cond:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop_event = stop_event or threading.Event()
+            self._thread = threading.Thread(target=self._run, name="log-write-buffer", daemon=True)
+            self._thread.start()
+
+    # Stop the flusher and write out everything still pending
+    def stop(self, timeout=None):
+        with self._cond:
+            thread, stop_event = self._thread, self._stop_event
+            self._thread = None
+        if thread is not None:
+            stop_event.set()
+            with self._cond:
+                self._cond.notify_all()
+            thread.join(timeout)
+        self.flush()
+
+    # Add a row without touching the database
+    def add(self, kind, row):
+        with self._cond:
+            if self._thread is None:
+                self.start()
+            if self._count >= self.max_pending:
+                self.stats["dropped"] += 1
+                logger.error("Write buffer full, dropping %s row: %s", kind, row)
+                return
+            self._pending[kind].append(row)
+            self._count += 1
+            self.stats["rows"] += 1
+            if self._count >= self.max_size:
+                self._cond.notify()
+
+    # Write every pending row now, one batch per kind; returns False if any batch failed
+    def flush(self):
+        success = True
+        with self._flush_lock:
+            with self._cond:
+                if not self._count:
+                    return success
+                batches = self._pending
+                self._pending = {kind: [] for kind in self.flush_handlers}
+                self._count = 0
+
+            for kind, rows in batches.items():
+                if not rows:
+                    continue
+                try:
+                    self.flush_handlers[kind](rows)
+                    self.stats["flushes"] += 1
+                except Exception as e:
+                    self.stats["failed_flushes"] += 1
+                    logger.error("Error flushing %s buffered %s rows, will retry: %s", len(rows), kind, e)
+                    self._requeue(kind, rows)
+                    success = False
+        return success
+
+    def _requeue(self, kind, rows):
+        with self._cond:
+            room = max(self.max_pending - self._count, 0)
+            if room < len(rows):
+                self.stats["dropped"] += len(rows) - room
+                logger.error("Write buffer full, dropping %s %s rows.", len(rows) - room, kind)
+                rows = rows[len(rows) - room:]
+            self._pending[kind][:0] = rows
+            self._count += len(rows)
+
+    def _run(self):
+        stop_event = self._stop_event
+        while not stop_event.is_set():
+            with self._cond:
+                if self._count < self.max_size:
+                    self._cond.wait(self.flush_interval)
+            if not self.flush():
+                stop_event.wait(self.flush_interval)  # Back off while the database is unavailable
+        self.flush()